@@ -1,15 +1,30 @@
 # ai_core.py
 
+import asyncio
+import hashlib
 import os
-from openai import OpenAI
+import re
+import threading
+import time
+from typing import Dict, Optional, Tuple
 
-# Retrieve the API key from environment variables and initialize the OpenAI client.
-# This client is the sole entry point for all communications with the OpenAI API.
+from openai import AsyncOpenAI, OpenAI
+
+import answer_cache
+import metrics
+import rate_limit
+from singleflight import SINGLEFLIGHT_ENABLED, AsyncSingleFlight, SingleFlight
+
+# Retrieve the API key from environment variables and initialize the OpenAI clients.
+# These clients are the sole entry points for all communications with the OpenAI API:
+# `client` for the sync path (CLI, threaded workers), `aclient` for the async path.
 
 _api_key = os.getenv("OPENAI_API_KEY")
 if not _api_key:
     print("ERROR: OPENAI_API_KEY is not set. Please configure your .env or Render env vars.")
-client = OpenAI(api_key=_api_key)
+# Retries are done here (not inside the SDK) so every attempt goes through rate_limit.
+client = OpenAI(api_key=_api_key, max_retries=0)
+aclient = AsyncOpenAI(api_key=_api_key, max_retries=0)
 
 MODEL_NAME = os.getenv("MODEL_NAME", "gpt-4.1-nano")
 SYSTEM_PROMPT_PATH = os.getenv("SYSTEM_PROMPT_PATH", "prompts/system.txt")
@@ -23,13 +38,54 @@ def _get_int_env(var_name: str, default: int) -> int:
         return default
 
 MAX_TOKEN = _get_int_env("MAX_TOKEN", 150)
+OPENAI_MAX_RETRIES = _get_int_env("OPENAI_MAX_RETRIES", 2)
+DEBUG_VERBOSE = os.getenv("DEBUG_VERBOSE", "false").lower() == "true"
+
+CONTEXT_PLACEHOLDER = "{{WEDDING_CONTEXT}}"
+
+# OpenAI only caches prompt prefixes of at least this many tokens.
+PROMPT_CACHE_MIN_TOKENS = 1024
 
+try:
+    import tiktoken  # Optional: exact token counts
+except ImportError:
+    tiktoken = None
 
-def _load_system_prompt(context: str) -> str:
+_CJK_RE = re.compile(r"[\u3000-\u30ff\u3400-\u9fff\uf900-\ufaff\uff00-\uffef]")
+
+def count_tokens(text: str) -> Tuple[int, str]:
+    """
+    Count prompt tokens with tiktoken when installed, otherwise estimate
+    (CJK ≈ 1 token per char, other text ≈ 4 chars per token).
+    :return: (token count, "tiktoken" | "estimate")
+    """
+    if tiktoken is not None:
+        try:
+            enc = tiktoken.encoding_for_model(MODEL_NAME)
+        except KeyError:
+            enc = tiktoken.get_encoding("o200k_base")
+        return len(enc.encode(text)), "tiktoken"
+    cjk = len(_CJK_RE.findall(text))
+    return cjk + (len(text) - cjk + 3) // 4, "estimate"
+
+_template_cache: Dict[str, tuple] = {}
+
+def _read_template() -> Tuple[str, str]:
     """
     Load system prompt from file if available; otherwise use a safe default.
-    Context will be appended so the model sees the wedding info.
+    Re-read only when the file's mtime/size changes.
+    :return: (template text, prompt version hash)
     """
+    try:
+        st = os.stat(SYSTEM_PROMPT_PATH)
+        key = (SYSTEM_PROMPT_PATH, st.st_mtime_ns, st.st_size)
+    except OSError:
+        key = None
+
+    cached = _template_cache.get("entry")
+    if cached and cached[0] == key:
+        return cached[1], cached[2]
+
     try:
         with open(SYSTEM_PROMPT_PATH, "r", encoding="utf-8") as f:
             base = f.read().strip()
@@ -61,33 +117,198 @@ def _load_system_prompt(context: str) -> str:
 
                 """
         )
-    return f"{base}\n---\n婚禮資訊:\n{context}\n---"
+    version = hashlib.sha256(base.encode("utf-8")).hexdigest()[:12]
+    _template_cache["entry"] = (key, base, version)
+    return base, version
+
+def _hash_context(context: str) -> str:
+    return hashlib.sha256(context.encode("utf-8")).hexdigest()[:16]
 
-def get_ai_reply(context: str, user_question: str) -> str:
+_prompt_cache: Dict[Tuple[str, str], str] = {}
+_prompt_lock = threading.Lock()
+
+def get_prompt_version() -> str:
+    """Hash of the current system prompt template."""
+    return _read_template()[1]
+
+def get_system_prompt(context: str, context_hash: Optional[str] = None) -> str:
+    """
+    Build the final system prompt once per (prompt version, context hash).
+    The context replaces the {{WEDDING_CONTEXT}} placeholder (appended if the
+    template has none). The result is byte-identical for every request with the
+    same inputs, so the provider's automatic prompt-prefix caching can hit.
+    """
+    if context_hash is None:
+        context_hash = _hash_context(context)
+    base, version = _read_template()
+    key = (version, context_hash)
+
+    prompt = _prompt_cache.get(key)
+    if prompt is not None:
+        return prompt
+
+    with _prompt_lock:
+        prompt = _prompt_cache.get(key)
+        if prompt is None:
+            if CONTEXT_PLACEHOLDER in base:
+                prompt = base.replace(CONTEXT_PLACEHOLDER, context)
+            else:
+                prompt = f"{base}\n---\n婚禮資訊:\n{context}\n---"
+            # Older versions are never asked for again.
+            _prompt_cache.clear()
+            _prompt_cache[key] = prompt
+
+            tokens, method = count_tokens(prompt)
+            note = "" if tokens >= PROMPT_CACHE_MIN_TOKENS else \
+                f" (below {PROMPT_CACHE_MIN_TOKENS}, provider prefix cache will not apply)"
+            print(f"[prompt][built] version={version} context={context_hash} "
+                  f"tokens={tokens} ({method}){note}")
+    return prompt
+
+# Fallback reply when the OpenAI call fails.
+AI_ERROR_REPLY = "抱歉，目前暫時沒辦法回答問題～請稍後再嘗試，謝謝你～"
+EMPTY_REPLY = "(無內容)"
+
+def _build_request(context: str, user_question: str, context_hash: Optional[str]) -> dict:
+    """Chat completion arguments shared by the sync and async clients."""
+    system_prompt = get_system_prompt(context, context_hash)
+    return {
+        "model": MODEL_NAME,
+        "messages": [
+            {"role": "system", "content": system_prompt},
+            {"role": "user", "content": user_question},
+        ],
+        # Limit the max token.
+        "max_tokens": MAX_TOKEN,
+    }
+
+def _read_completion(completion) -> str:
+    content = completion.choices[0].message.content or EMPTY_REPLY
+    metrics.record_usage(completion.usage)
+    if DEBUG_VERBOSE and completion.usage:
+        details = getattr(completion.usage, "prompt_tokens_details", None)
+        print(f"[openai][usage] prompt={completion.usage.prompt_tokens} "
+              f"cached={getattr(details, 'cached_tokens', None)} "
+              f"completion={completion.usage.completion_tokens}")
+    return content
+
+def _create_completion(request: dict):
+    """chat.completions.create with the shared OpenAI budget and 429-aware retries."""
+    bucket = rate_limit.limiter("openai")
+    for attempt in range(1, OPENAI_MAX_RETRIES + 2):
+        bucket.acquire()
+        try:
+            with metrics.STAGE_SECONDS.time(stage="openai"):
+                return client.chat.completions.create(**request)
+        except Exception as e:
+            retry_after = rate_limit.note_failure("openai", e)
+            if attempt > OPENAI_MAX_RETRIES or not rate_limit.is_retryable(e):
+                raise
+            wait = rate_limit.backoff_delay(attempt, retry_after)
+            print(f"[openai] {type(e).__name__}, retry in {wait:.1f}s")
+            metrics.RETRIES.inc(target="openai")
+            time.sleep(wait)
+
+async def _create_completion_async(request: dict):
+    """Async version of _create_completion()."""
+    bucket = rate_limit.limiter("openai")
+    for attempt in range(1, OPENAI_MAX_RETRIES + 2):
+        await bucket.acquire_async()
+        try:
+            with metrics.STAGE_SECONDS.time(stage="openai"):
+                return await aclient.chat.completions.create(**request)
+        except Exception as e:
+            retry_after = rate_limit.note_failure("openai", e)
+            if attempt > OPENAI_MAX_RETRIES or not rate_limit.is_retryable(e):
+                raise
+            wait = rate_limit.backoff_delay(attempt, retry_after)
+            print(f"[openai] {type(e).__name__}, retry in {wait:.1f}s")
+            metrics.RETRIES.inc(target="openai")
+            await asyncio.sleep(wait)
+
+def _answer_key(context: str, user_question: str, context_hash: Optional[str]) -> Optional[str]:
+    """Key shared by the answer cache and request coalescing."""
+    return answer_cache.make_key(user_question, context_hash or _hash_context(context),
+                                 MODEL_NAME, get_prompt_version())
+
+def _cached_answer(key: Optional[str]) -> Optional[str]:
+    cache = answer_cache.get_cache()
+    cached = cache.get(key) if cache and key else None
+    if cached is not None and DEBUG_VERBOSE:
+        print("[answer_cache][hit]")
+    return cached
+
+def has_cached_answer(context: str, user_question: str, context_hash: Optional[str] = None) -> bool:
+    """Whether get_ai_reply() would answer from the cache (used for scheduling)."""
+    cache = answer_cache.get_cache()
+    return bool(cache) and cache.peek(_answer_key(context, user_question, context_hash))
+
+def _remember(key: Optional[str], content: str) -> None:
+    cache = answer_cache.get_cache()
+    if cache and key and content != EMPTY_REPLY:
+        cache.put(key, content)
+
+async def _remember_async(key: Optional[str], content: str) -> None:
+    cache = answer_cache.get_cache()
+    if cache and key and content != EMPTY_REPLY:
+        await cache.put_async(key, content)
+
+# Identical questions asked at the same moment share one OpenAI call.
+_flight = SingleFlight() if SINGLEFLIGHT_ENABLED else None
+_async_flight = AsyncSingleFlight() if SINGLEFLIGHT_ENABLED else None
+
+def get_singleflight_stats() -> Dict[str, Dict[str, int]]:
+    if not SINGLEFLIGHT_ENABLED:
+        return {}
+    return {"sync": _flight.stats(), "async": _async_flight.stats()}
+
+def get_ai_reply(context: str, user_question: str, context_hash: Optional[str] = None) -> str:
     """
     Calls the OpenAI API to generate a reply based on the provided
     context and user question.
 
     :param context: All information about the wedding.
     :param user_question: The original question string from user.
+    :param context_hash: Optional content hash of context (skips re-hashing).
     :return: The reply string generated by the OpenAI model.
     """
-    try:
+    key = _answer_key(context, user_question, context_hash)
+    cached = _cached_answer(key)
+    if cached is not None:
+        return cached
+
+    def _complete() -> str:
         # Construct the prompt and send the request to the OpenAI API.
-        system_prompt = _load_system_prompt(context)
-        completion = client.chat.completions.create(
-            model=MODEL_NAME,
-            messages=[
-                {"role": "system", "content": system_prompt},
-                {"role": "user", "content": user_question}, 
-
-            ],
-        # Limit the max token.
-        max_tokens=MAX_TOKEN
-        )
-        content = completion.choices[0].message.content or "(無內容)"
+        completion = _create_completion(_build_request(context, user_question, context_hash))
+        content = _read_completion(completion)
+        _remember(key, content)
         return content
+
+    try:
+        return _flight.do(key, _complete) if _flight else _complete()
     except Exception as e:
         print(f"呼叫 OpenAI API時發生錯誤: {e}")
         # In case of an API error, return a safe default message.
-        return "抱歉，目前暫時沒辦法回答問題～請稍後再嘗試，謝謝你～"
+        return AI_ERROR_REPLY
+
+async def get_ai_reply_async(context: str, user_question: str, context_hash: Optional[str] = None) -> str:
+    """
+    Async version of get_ai_reply(), awaits the OpenAI round trip
+    on the event loop instead of holding a worker thread.
+    """
+    key = _answer_key(context, user_question, context_hash)
+    cached = _cached_answer(key)
+    if cached is not None:
+        return cached
+
+    async def _complete() -> str:
+        completion = await _create_completion_async(_build_request(context, user_question, context_hash))
+        content = _read_completion(completion)
+        await _remember_async(key, content)
+        return content
+
+    try:
+        return await (_async_flight.do(key, _complete) if _async_flight else _complete())
+    except Exception as e:
+        print(f"呼叫 OpenAI API時發生錯誤: {e}")
+        return AI_ERROR_REPLY
@@ -0,0 +1,215 @@
+# answer_cache.py
+
+import asyncio
+import hashlib
+import os
+import sqlite3
+import threading
+import time
+import unicodedata
+from collections import OrderedDict
+from typing import Any, Dict, Optional
+
+# Reply cache in front of ai_core.get_ai_reply().
+# Guests ask the same few questions over and over; an answer is reused when the
+# normalized question, wedding context, model and prompt version all match.
+
+DEBUG_VERBOSE = os.getenv("DEBUG_VERBOSE", "false").lower() == "true"
+
+def _get_num_env(var_name: str, default, cast=int):
+    try:
+        return cast(os.getenv(var_name, default))
+    except ValueError:
+        print(f"[Error] Invalid value for {var_name}, fallback to {default}")
+        return default
+
+ANSWER_CACHE_ENABLED = os.getenv("ANSWER_CACHE_ENABLED", "true").lower() == "true"
+ANSWER_CACHE_TTL_SECONDS = _get_num_env("ANSWER_CACHE_TTL_SECONDS", 3600.0, float)
+ANSWER_CACHE_MAX_ENTRIES = _get_num_env("ANSWER_CACHE_MAX_ENTRIES", 512)
+# Optional SQLite file so a restart keeps the warm cache (empty = memory only).
+ANSWER_CACHE_PATH = os.getenv("ANSWER_CACHE_PATH", "")
+
+try:
+    import opencc  # Optional: full traditional/simplified conversion
+    _t2s = opencc.OpenCC("t2s").convert
+except Exception:
+    _t2s = None
+
+# Fallback traditional → simplified folding for characters common in wedding questions.
+# Folding only has to be consistent, so everything maps to the simplified form.
+_FOLD_PAIRS = (
+    "時时 間间 點点 開开 場场 禮礼 車车 麼么 幾几 嗎吗 這这 裡里 裏里 還还 會会 來来 "
+    "們们 請请 問问 與与 為为 對对 說说 話话 號号 樓楼 廳厅 館馆 飯饭 門门 進进 邊边 "
+    "從从 後后 準准 備备 帶带 裝装 紅红 錢钱 給给 氣气 廁厕 電电 聯联 絡络 關关 於于 "
+    "結结 儀仪 證证 鐘钟 費费 網网 碼码 線线 動动 態态 戲戏 節节 資资 訊讯 統统 員员 "
+    "長长 劃划 區区 樣样 麵面 葷荤 過过 兒儿 陽阳 臺台 遠远 鐵铁 運运 計计 讓让"
+)
+_T2S_TABLE = str.maketrans({p[0]: p[1] for p in _FOLD_PAIRS.split() if p[0] != p[1]})
+
+def normalize_question(text: str) -> str:
+    """
+    Normalize a question for cache keys:
+    - width folding (NFKC, e.g. full-width ？ → ?)
+    - lower case
+    - traditional/simplified folding
+    - drop punctuation, symbols and whitespace
+    """
+    text = unicodedata.normalize("NFKC", text or "").lower()
+    text = _t2s(text) if _t2s else text.translate(_T2S_TABLE)
+    return "".join(
+        ch for ch in text
+        if not unicodedata.category(ch).startswith(("P", "S", "Z", "C"))
+    )
+
+def make_key(question: str, context_hash: str, model: str, prompt_version: str) -> Optional[str]:
+    """Cache key for (normalized question, context hash, model, prompt version)."""
+    normalized = normalize_question(question)
+    if not normalized:
+        return None
+    raw = "\x1f".join((normalized, context_hash or "", model or "", prompt_version or ""))
+    return hashlib.sha256(raw.encode("utf-8")).hexdigest()
+
+class AnswerCache:
+    """
+    Size-bounded LRU with per-entry TTL and hit/miss counters.
+    If `path` is set, entries are also written to SQLite and reloaded on start.
+    """
+
+    def __init__(self, max_entries: int = ANSWER_CACHE_MAX_ENTRIES,
+                 ttl_seconds: float = ANSWER_CACHE_TTL_SECONDS, path: str = ANSWER_CACHE_PATH):
+        self.max_entries = max(1, max_entries)
+        self.ttl_seconds = ttl_seconds
+        self.path = path
+        self._entries: "OrderedDict[str, tuple]" = OrderedDict()  # key -> (answer, expires_at)
+        self._lock = threading.Lock()
+        self._db_lock = threading.Lock()  # SQLite writes, kept apart so lookups never wait on them
+        self._db: Optional[sqlite3.Connection] = None
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expired = 0
+        if path:
+            self._open_store()
+
+    def _open_store(self) -> None:
+        try:
+            folder = os.path.dirname(self.path)
+            if folder:
+                os.makedirs(folder, exist_ok=True)
+            self._db = sqlite3.connect(self.path, check_same_thread=False)
+            self._db.execute("PRAGMA journal_mode=WAL")
+            self._db.execute(
+                "CREATE TABLE IF NOT EXISTS answers ("
+                " key TEXT PRIMARY KEY, answer TEXT NOT NULL, expires_at REAL NOT NULL)"
+            )
+            now = time.time()
+            self._db.execute("DELETE FROM answers WHERE expires_at <= ?", (now,))
+            rows = self._db.execute(
+                "SELECT key, answer, expires_at FROM answers ORDER BY expires_at DESC LIMIT ?",
+                (self.max_entries,),
+            ).fetchall()
+            self._db.commit()
+            for key, answer, expires_at in reversed(rows):
+                self._entries[key] = (answer, expires_at)
+            print(f"[answer_cache] loaded {len(rows)} entries from {self.path}")
+        except Exception as e:
+            print(f"[answer_cache][store-error] {type(e).__name__}: {e} (memory only)")
+            self._db = None
+
+    def get(self, key: Optional[str]) -> Optional[str]:
+        if key is None:
+            return None
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                self.misses += 1
+                return None
+            answer, expires_at = entry
+            if expires_at <= time.time():
+                del self._entries[key]
+                self.expired += 1
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return answer
+
+    def peek(self, key: Optional[str]) -> bool:
+        """True if a live answer is cached; does not count as a lookup or touch LRU order."""
+        if key is None:
+            return False
+        with self._lock:
+            entry = self._entries.get(key)
+            return entry is not None and entry[1] > time.time()
+
+    def _put_memory(self, key: str, answer: str) -> tuple:
+        """Store in the LRU; returns (expires_at, evicted keys) for the SQLite write."""
+        expires_at = time.time() + self.ttl_seconds
+        with self._lock:
+            self._entries[key] = (answer, expires_at)
+            self._entries.move_to_end(key)
+            evicted = []
+            while len(self._entries) > self.max_entries:
+                evicted.append(self._entries.popitem(last=False)[0])
+                self.evictions += 1
+        return expires_at, evicted
+
+    def _persist(self, key: str, answer: str, expires_at: float, evicted: list) -> None:
+        with self._db_lock:
+            if self._db is None:
+                return
+            try:
+                self._db.execute(
+                    "INSERT OR REPLACE INTO answers (key, answer, expires_at) VALUES (?, ?, ?)",
+                    (key, answer, expires_at),
+                )
+                if evicted:
+                    self._db.executemany("DELETE FROM answers WHERE key = ?", [(k,) for k in evicted])
+                self._db.commit()
+            except Exception as e:
+                if DEBUG_VERBOSE:
+                    print(f"[answer_cache][store-error] {type(e).__name__}: {e}")
+
+    def put(self, key: Optional[str], answer: str) -> None:
+        if key is None or not answer:
+            return
+        expires_at, evicted = self._put_memory(key, answer)
+        if self._db is not None:
+            self._persist(key, answer, expires_at, evicted)
+
+    async def put_async(self, key: Optional[str], answer: str) -> None:
+        """Like put(); the entry is usable at once, the SQLite write runs in a worker thread."""
+        if key is None or not answer:
+            return
+        expires_at, evicted = self._put_memory(key, answer)
+        if self._db is not None:
+            await asyncio.to_thread(self._persist, key, answer, expires_at, evicted)
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "entries": len(self._entries),
+                "max_entries": self.max_entries,
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": round(self.hits / lookups, 4) if lookups else 0.0,
+                "evictions": self.evictions,
+                "expired": self.expired,
+                "persistent": self._db is not None,
+            }
+
+_cache = AnswerCache() if ANSWER_CACHE_ENABLED else None
+
+def get_cache() -> Optional[AnswerCache]:
+    return _cache
+
+def get_stats() -> Dict[str, Any]:
+    return _cache.stats() if _cache else {"enabled": False}
+
+if __name__ == "__main__":
+    while True:
+        q = input("Question:")
+        if q.lower() in {"exit", "quit", "q"}:
+            break
+        print("normalized:", normalize_question(q))
@@ -0,0 +1,374 @@
+# bench/load_test.py
+
+import asyncio
+import base64
+import csv
+import hashlib
+import hmac
+import json
+import os
+import random
+import subprocess
+import sys
+import tempfile
+import time
+import uuid
+from collections import defaultdict, deque
+
+import httpx
+
+BASE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__))) # Go to project root path
+sys.path.insert(0, BASE_DIR)
+
+# Webhook load test: how many messages per second before replies get slow and
+# reply tokens start expiring.
+# Starts bench/stub_servers.py (LINE + OpenAI stand-ins) and the app (uvicorn
+# main:app) pointed at them, posts signed multi-event payloads to /webhook at a
+# fixed rate, then matches every event with the reply/push the stub received.
+# Usage:
+#   python bench/load_test.py [--requests 200] [--events 3] [--rate 20] [--seat-ratio 0.7]
+#       [--guests 500 | --guests-csv path | --postgres] [--line-latency-ms 50]
+#       [--openai-latency-ms 800] [--line-error-rate 0] [--openai-error-rate 0]
+#       [--repeat-ratio 0] [--redeliver-ratio 0] [--timeout 90] [--seed 42] [--json report.json]
+#       [--app-url http://127.0.0.1:8000 --stub-url http://127.0.0.1:9100]
+#   --requests/--events  webhook POSTs and message events per POST
+#   --rate               POSTs per second
+#   --seat-ratio         share of seat lookups (the rest goes to the LLM path)
+#   --guests             size of the generated in-memory guest list (GUEST_INDEX_CSV);
+#                        --guests-csv uses an existing CSV, --postgres the seeded DB (PG* / *_DATABASE_URL)
+#   --repeat-ratio       share of LLM questions repeated verbatim (answer cache / single-flight hits)
+#   --redeliver-ratio    share of POSTs sent again as LINE redeliveries (same webhookEventId,
+#                        isRedelivery=true); each should still be answered exactly once
+#   --app-url/--stub-url use an app and stubs that are already running (the app must
+#                        have LINE_API_HOST / OPENAI_BASE_URL pointed at the stubs and
+#                        the same LINE_CHANNEL_SECRET as this shell)
+# Other app settings (OUTBOX_WORKERS, RATE_LIMIT_*, DB_POOL_MAX, ...) are taken
+# from the environment, so the same command compares configurations.
+
+APP_PORT = 8100
+STUB_PORT = 9100
+REPLY_TOKEN_TTL_SECONDS = 50  # Same budget main.py uses
+
+SURNAMES = "王李張劉陳楊黃趙吳周徐孫馬朱胡郭何高林羅鄭梁謝宋唐許韓馮鄧曹彭曾蕭田董潘袁蔡蔣余杜葉程蘇魏呂丁任沈姚盧姜崔鍾譚陸汪范金石廖賈夏韋付方白鄒孟熊秦邱江尹薛閻段雷侯龍史陶黎賀顧毛郝龔邵萬錢嚴覃武戴莫孔向湯"
+GIVEN = "偉芳娜秀英敏靜麗強磊軍洋勇艷杰娟濤明超蘭霞平剛桂華玉萍紅娥玲芬燕彬輝鑫鵬宇浩凱瑞佳欣怡婷雅琪哲翔宏志豪俊廷柏承睿"
+SEAT_TEMPLATES = ["{name}", "{name}坐哪", "我要找{name}的座位", "請問{name}在哪一桌", "{name}的位子"]
+LLM_QUESTIONS = [
+    "婚禮當天可以帶小孩一起參加嗎",
+    "請問有素食的餐點可以選擇嗎",
+    "會場附近有推薦的停車場嗎",
+    "可以幫我介紹一下新郎新娘怎麼認識的嗎",
+    "婚宴大概幾點會結束",
+    "交通上搭捷運過去方便嗎",
+    "禮金要怎麼準備比較好",
+    "可以穿白色的衣服參加嗎",
+]
+
+def _opt(name: str, default, cast=float):
+    if name in sys.argv:
+        i = sys.argv.index(name)
+        if i + 1 < len(sys.argv):
+            try:
+                return cast(sys.argv[i + 1])
+            except ValueError:
+                print(f"[Error] Invalid value for {name}, fallback to {default}")
+    return default
+
+def percentile(values: list, p: float) -> float:
+    """Nearest-rank percentile (0 for an empty list)."""
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    k = max(0, min(len(ordered) - 1, round(p / 100 * len(ordered) + 0.5) - 1))
+    return ordered[k]
+
+# --- Guest data ---
+
+def write_guests_csv(path: str, count: int, rng: random.Random) -> list:
+    """Generate count attending guests (families of 1-4 at 10 per table); returns the names."""
+    names, seen, rows = [], set(), []
+    code = 0
+    while code < count:
+        size = min(rng.randint(1, 4), count - code)
+        rep = None
+        for member in range(size):
+            code += 1
+            name = rng.choice(SURNAMES) + "".join(rng.choice(GIVEN) for _ in range(rng.randint(1, 2)))
+            if name in seen:
+                name += GIVEN[code % len(GIVEN)]
+            seen.add(name)
+            guest_code = f"B{code:05d}"
+            rows.append({
+                "guest_code": guest_code, "name": name, "alias": "", "seat_number": (code - 1) // 10 + 1,
+                "attending": "TRUE", "group_code": "GR001",
+                "relation_role": "self" if member == 0 else "spouse" if member == 1 else "child",
+                "representative": rep or "", "display_name": "",
+            })
+            rep = rep or guest_code
+            names.append(name)
+    with open(path, "w", newline="", encoding="utf-8") as f:
+        writer = csv.DictWriter(f, fieldnames=list(rows[0].keys()))
+        writer.writeheader()
+        writer.writerows(rows)
+    return names
+
+def csv_guest_names(path: str) -> list:
+    with open(path, newline="", encoding="utf-8-sig") as f:
+        return [r["name"].strip() for r in csv.DictReader(f)
+                if (r.get("name") or "").strip() and str(r.get("attending", "")).strip().upper() == "TRUE"]
+
+def db_guest_names() -> list:
+    from db.db_connection import run_query
+    return [r["name"] for r in run_query("SELECT name FROM guests WHERE attending = TRUE AND name IS NOT NULL")]
+
+# --- Payloads ---
+
+def sign(secret: str, body: bytes) -> str:
+    """X-Line-Signature: base64(HMAC-SHA256(channel secret, body))."""
+    return base64.b64encode(hmac.new(secret.encode("utf-8"), body, hashlib.sha256).digest()).decode("utf-8")
+
+def make_events(count: int, names: list, seat_ratio: float, repeat_ratio: float,
+                rng: random.Random, counter: list) -> list:
+    events = []
+    for _ in range(count):
+        counter[0] += 1
+        n = counter[0]
+        if names and rng.random() < seat_ratio:
+            route, text = "seat", rng.choice(SEAT_TEMPLATES).format(name=rng.choice(names))
+        else:
+            text = rng.choice(LLM_QUESTIONS)
+            if rng.random() >= repeat_ratio:
+                text = f"{text}？（第{n}題）"  # Unique, so the answer cache cannot serve it
+            route = "llm"
+        events.append({
+            "route": route,
+            "user_id": f"Ubench{n:027d}",
+            "reply_token": uuid.uuid4().hex,
+            "event_id": uuid.uuid4().hex.upper()[:26],
+            "text": text,
+        })
+    return events
+
+def payload(events: list, redelivery: bool = False) -> bytes:
+    now_ms = int(time.time() * 1000)
+    return json.dumps({
+        "destination": "Ubenchdestination",
+        "events": [{
+            "type": "message",
+            "mode": "active",
+            "timestamp": now_ms,
+            "source": {"type": "user", "userId": e["user_id"]},
+            "webhookEventId": e["event_id"],
+            "deliveryContext": {"isRedelivery": redelivery},
+            "replyToken": e["reply_token"],
+            "message": {"id": str(random.randint(10**14, 10**15)), "type": "text",
+                        "quoteToken": "q", "text": e["text"]},
+        } for e in events],
+    }, ensure_ascii=False).encode("utf-8")
+
+# --- Processes ---
+
+def _wait_http(url: str, timeout: float) -> None:
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        try:
+            if httpx.get(url, timeout=1.0).status_code < 500:
+                return
+        except httpx.HTTPError:
+            pass
+        time.sleep(0.2)
+    raise RuntimeError(f"{url} did not come up within {timeout:.0f}s")
+
+def start_processes(stub_port: int, app_port: int, guests_csv, secret: str, workdir: str) -> list:
+    stub_args = [sys.executable, os.path.join(BASE_DIR, "bench", "stub_servers.py"), "--port", str(stub_port)]
+    for flag in ("--line-latency-ms", "--openai-latency-ms", "--line-error-rate", "--openai-error-rate", "--seed"):
+        if flag in sys.argv[:-1]:
+            stub_args += [flag, sys.argv[sys.argv.index(flag) + 1]]
+    stub = subprocess.Popen(stub_args, cwd=BASE_DIR)
+
+    env = dict(os.environ)
+    env.update({
+        "LINE_CHANNEL_SECRET": secret,
+        "LINE_CHANNEL_ACCESS_TOKEN": "bench-token",
+        "OPENAI_API_KEY": "sk-bench",
+        "LINE_API_HOST": f"http://127.0.0.1:{stub_port}",
+        "OPENAI_BASE_URL": f"http://127.0.0.1:{stub_port}/v1",
+        "OUTBOX_PATH": "",
+        "DEAD_LETTER_PATH": os.path.join(workdir, "dead_letters.jsonl"),
+        "WEBHOOK_DEDUP_PATH": os.path.join(workdir, "webhook_events.sqlite3"),
+        "GUEST_SEARCH_MODE": "index",
+    })
+    if guests_csv:
+        env["GUEST_INDEX_CSV"] = guests_csv
+    env.setdefault("WEDDING_CONTEXT_PATH", os.path.join(BASE_DIR, "instance", "wedding_data.example.json"))
+    app = subprocess.Popen(
+        [sys.executable, "-m", "uvicorn", "main:app", "--host", "127.0.0.1",
+         "--port", str(app_port), "--log-level", "warning"],
+        cwd=BASE_DIR, env=env,
+    )
+    return [stub, app]
+
+# --- Run ---
+
+async def send_all(app_url: str, secret: str, batches: list, rate: float, redelivered: int = 0) -> list:
+    """
+    POST every batch at rate/s; the last `redelivered` batches are repeats sent as
+    redeliveries. Returns (sent_at, status, post_latency) per batch.
+    """
+    results = [None] * len(batches)
+    interval = 1.0 / rate
+
+    async with httpx.AsyncClient(timeout=30.0) as client:
+        async def _post(i: int, events: list):
+            body = payload(events, redelivery=i >= len(batches) - redelivered)
+            sent_at = time.time()
+            for e in events:
+                e.setdefault("sent_at", sent_at)  # A redelivery keeps the first send time
+            try:
+                r = await client.post(f"{app_url}/webhook", content=body, headers={
+                    "Content-Type": "application/json", "X-Line-Signature": sign(secret, body)})
+                status = r.status_code
+            except httpx.HTTPError as e:
+                status = type(e).__name__
+            results[i] = (sent_at, status, time.time() - sent_at)
+
+        started = time.monotonic()
+        tasks = []
+        for i, events in enumerate(batches):
+            delay = started + i * interval - time.monotonic()
+            if delay > 0:
+                await asyncio.sleep(delay)
+            tasks.append(asyncio.create_task(_post(i, events)))
+        await asyncio.gather(*tasks)
+    return results
+
+def match_deliveries(events: list, deliveries: list) -> None:
+    """Attach the arrival time of each event's reply (by token) or push (by user, in order)."""
+    by_token = {e["reply_token"]: e for e in events}
+    by_user = defaultdict(deque)
+    for e in events:
+        by_user[e["user_id"]].append(e)
+    for d in sorted(deliveries, key=lambda d: d["ts"]):
+        if d["kind"] == "reply":
+            e = by_token.get(d["reply_token"])
+        else:
+            queue = by_user.get(d["to"]) or deque()
+            while queue and "done_at" in queue[0]:
+                queue.popleft()
+            e = queue[0] if queue else None
+        if e is not None and "done_at" not in e:
+            e["done_at"], e["via"] = d["ts"], d["kind"]
+
+def report(events: list, post_results: list, wall: float, stub_stats: dict, deliveries: int = 0) -> dict:
+    done = [e for e in events if "done_at" in e]
+    out = {
+        "events": len(events),
+        "delivered": len(done),
+        "undelivered": len(events) - len(done),
+        "wall_s": round(wall, 2),
+        "throughput_events_per_s": round(len(done) / wall, 2) if wall else 0.0,
+        "webhook_errors": sum(1 for r in post_results if r and r[1] != 200),
+        "via_push": sum(1 for e in done if e["via"] == "push"),
+        "over_reply_ttl": sum(1 for e in done if e["done_at"] - e["sent_at"] > REPLY_TOKEN_TTL_SECONDS),
+        "extra_deliveries": max(deliveries - len(done), 0),
+        "stub": stub_stats,
+        "webhook_ack_ms": {},
+        "end_to_end_ms": {},
+    }
+    acks = [r[2] * 1000 for r in post_results if r]
+    out["webhook_ack_ms"] = {f"p{p}": round(percentile(acks, p), 1) for p in (50, 95, 99)}
+    for route in ("seat", "llm", "all"):
+        latencies = [(e["done_at"] - e["sent_at"]) * 1000 for e in done if route in ("all", e["route"])]
+        out["end_to_end_ms"][route] = {
+            "count": len(latencies),
+            **{f"p{p}": round(percentile(latencies, p), 1) for p in (50, 95, 99)},
+            "max": round(max(latencies), 1) if latencies else 0.0,
+        }
+    return out
+
+def print_report(r: dict) -> None:
+    print(f"\nevents={r['events']} delivered={r['delivered']} undelivered={r['undelivered']} "
+          f"in {r['wall_s']}s -> {r['throughput_events_per_s']} events/s")
+    print(f"webhook ack ms: p50={r['webhook_ack_ms']['p50']} p95={r['webhook_ack_ms']['p95']} "
+          f"p99={r['webhook_ack_ms']['p99']} (non-200: {r['webhook_errors']})")
+    print(f"{'path':<6}{'count':>7}{'p50 ms':>10}{'p95 ms':>10}{'p99 ms':>10}{'max ms':>10}")
+    for route, s in r["end_to_end_ms"].items():
+        print(f"{route:<6}{s['count']:>7}{s['p50']:>10}{s['p95']:>10}{s['p99']:>10}{s['max']:>10}")
+    print(f"delivered via push (reply token lost/expired): {r['via_push']}, "
+          f"over {REPLY_TOKEN_TTL_SECONDS}s: {r['over_reply_ttl']}, "
+          f"extra (duplicate) deliveries: {r['extra_deliveries']}")
+    print(f"stub counters: {r['stub']}")
+
+def main():
+    seed = _opt("--seed", 42, int)
+    rng = random.Random(seed)
+    requests_n = _opt("--requests", 200, int)
+    per_request = max(1, _opt("--events", 3, int))
+    rate = max(0.1, _opt("--rate", 20.0))
+    timeout = _opt("--timeout", 90.0)
+    app_url = _opt("--app-url", None, str)
+    stub_url = _opt("--stub-url", None, str)
+    secret = os.getenv("LINE_CHANNEL_SECRET", "") if app_url else "bench-secret"
+
+    workdir = tempfile.mkdtemp(prefix="wedding-bench-")
+    guests_csv = None
+    if "--postgres" in sys.argv:
+        names = db_guest_names()
+    elif "--guests-csv" in sys.argv:
+        guests_csv = os.path.abspath(_opt("--guests-csv", "", str))
+        names = csv_guest_names(guests_csv)
+    else:
+        guests_csv = os.path.join(workdir, "guests.csv")
+        names = write_guests_csv(guests_csv, _opt("--guests", 500, int), rng)
+    print(f"[bench] {len(names)} guest names, {requests_n} POSTs x {per_request} events at {rate}/s")
+
+    procs = []
+    try:
+        if not app_url:
+            procs = start_processes(STUB_PORT, APP_PORT, guests_csv, secret, workdir)
+            app_url, stub_url = f"http://127.0.0.1:{APP_PORT}", f"http://127.0.0.1:{STUB_PORT}"
+        stub_url = stub_url or f"http://127.0.0.1:{STUB_PORT}"
+        _wait_http(f"{stub_url}/_bench/stats", 30)
+        _wait_http(f"{app_url}/", 60)
+        httpx.post(f"{stub_url}/_bench/reset")
+
+        counter = [0]
+        batches = [make_events(per_request, names, _opt("--seat-ratio", 0.7), _opt("--repeat-ratio", 0.0),
+                               rng, counter) for _ in range(requests_n)]
+        events = [e for batch in batches for e in batch]
+        redeliver_ratio = _opt("--redeliver-ratio", 0.0)
+        repeats = [b for b in batches if rng.random() < redeliver_ratio]
+
+        started = time.time()
+        post_results = asyncio.run(send_all(app_url, secret, batches + repeats, rate, len(repeats)))
+        deadline = time.monotonic() + timeout
+        while True:
+            deliveries = httpx.get(f"{stub_url}/_bench/deliveries", timeout=10).json()
+            match_deliveries(events, deliveries)
+            if all("done_at" in e for e in events) or time.monotonic() > deadline:
+                break
+            time.sleep(0.5)
+        if repeats:
+            time.sleep(2)  # Give duplicates (if any) time to arrive before counting them
+            deliveries = httpx.get(f"{stub_url}/_bench/deliveries", timeout=10).json()
+        last = max((e["done_at"] for e in events if "done_at" in e), default=time.time())
+
+        result = report(events, post_results, last - started, httpx.get(f"{stub_url}/_bench/stats").json(),
+                        len(deliveries))
+        result["settings"] = {"requests": requests_n, "events_per_request": per_request, "rate": rate,
+                              "guests": len(names), "redelivered_posts": len(repeats), "seed": seed}
+        print_report(result)
+        out = _opt("--json", None, str)
+        if out:
+            with open(out, "w", encoding="utf-8") as f:
+                json.dump(result, f, ensure_ascii=False, indent=2)
+            print(f"report written to {out}")
+    finally:
+        for p in reversed(procs):
+            p.terminate()
+            try:
+                p.wait(timeout=10)
+            except subprocess.TimeoutExpired:
+                p.kill()
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,145 @@
+# bench/stub_servers.py
+
+import asyncio
+import os
+import random
+import sys
+import threading
+import time
+
+import uvicorn
+from fastapi import FastAPI, Request
+from fastapi.responses import JSONResponse
+
+# Local stand-ins for the LINE Messaging API and OpenAI chat completions, for
+# bench/load_test.py. Point the app at them with
+#   LINE_API_HOST=http://127.0.0.1:<port>  OPENAI_BASE_URL=http://127.0.0.1:<port>/v1
+# Usage:
+#   python bench/stub_servers.py [--port 9100] [--line-latency-ms 50] [--openai-latency-ms 800]
+#                                [--line-error-rate 0] [--openai-error-rate 0] [--seed 1]
+#   Latencies are means (uniform +-50% jitter); error rates are 0..1.
+#   LINE errors are 500s, OpenAI errors alternate 429 (retry-after-ms) and 500.
+# Every delivered reply / push is recorded with its arrival time; the load test
+# reads them from GET /_bench/deliveries to measure end-to-end latency.
+
+def _opt(name: str, default, cast=float):
+    if name in sys.argv:
+        i = sys.argv.index(name)
+        if i + 1 < len(sys.argv):
+            try:
+                return cast(sys.argv[i + 1])
+            except ValueError:
+                print(f"[Error] Invalid value for {name}, fallback to {default}")
+    return default
+
+class StubSettings:
+    def __init__(self, line_latency_ms: float = 50, openai_latency_ms: float = 800,
+                 line_error_rate: float = 0.0, openai_error_rate: float = 0.0, seed: int = 1):
+        self.line_latency_ms = line_latency_ms
+        self.openai_latency_ms = openai_latency_ms
+        self.line_error_rate = line_error_rate
+        self.openai_error_rate = openai_error_rate
+        self.rng = random.Random(seed)
+
+    def update(self, values: dict) -> None:
+        for key, value in values.items():
+            if hasattr(self, key) and key != "rng":
+                setattr(self, key, float(value))
+
+    async def delay(self, mean_ms: float) -> None:
+        if mean_ms > 0:
+            await asyncio.sleep(mean_ms * self.rng.uniform(0.5, 1.5) / 1000)
+
+    def fails(self, rate: float) -> bool:
+        return rate > 0 and self.rng.random() < rate
+
+def create_app(settings: StubSettings) -> FastAPI:
+    app = FastAPI()
+    deliveries, counters = [], {}
+    lock = threading.Lock()
+
+    def _count(key: str) -> None:
+        with lock:
+            counters[key] = counters.get(key, 0) + 1
+
+    async def _line(kind: str, request: Request):
+        body = await request.json()
+        await settings.delay(settings.line_latency_ms)
+        if settings.fails(settings.line_error_rate):
+            _count(f"{kind}_error")
+            return JSONResponse({"message": "stub error"}, status_code=500)
+        _count(kind)
+        with lock:
+            deliveries.append({
+                "kind": kind,
+                "reply_token": body.get("replyToken"),
+                "to": body.get("to"),
+                "messages": len(body.get("messages", [])),
+                "ts": time.time(),
+            })
+        return {"sentMessages": [{"id": str(i), "quoteToken": "q"} for i, _ in enumerate(body["messages"])]}
+
+    @app.post("/v2/bot/message/reply")
+    async def reply(request: Request):
+        return await _line("reply", request)
+
+    @app.post("/v2/bot/message/push")
+    async def push(request: Request):
+        return await _line("push", request)
+
+    @app.post("/v1/chat/completions")
+    async def chat(request: Request):
+        body = await request.json()
+        await settings.delay(settings.openai_latency_ms)
+        if settings.fails(settings.openai_error_rate):
+            _count("openai_error")
+            if counters.get("openai_error", 0) % 2:
+                return JSONResponse({"error": {"message": "stub rate limit", "type": "rate_limit_exceeded"}},
+                                    status_code=429, headers={"retry-after-ms": "200"})
+            return JSONResponse({"error": {"message": "stub error", "type": "server_error"}}, status_code=500)
+        _count("openai")
+        question = body["messages"][-1]["content"]
+        return {
+            "id": "chatcmpl-stub", "object": "chat.completion", "created": int(time.time()),
+            "model": body.get("model", "stub"),
+            "choices": [{"index": 0, "finish_reason": "stop",
+                         "message": {"role": "assistant", "content": f"（測試回覆）{question[-40:]}"}}],
+            "usage": {"prompt_tokens": len(str(body["messages"])) // 2, "completion_tokens": 20,
+                      "total_tokens": len(str(body["messages"])) // 2 + 20},
+        }
+
+    @app.get("/_bench/deliveries")
+    def get_deliveries():
+        with lock:
+            return list(deliveries)
+
+    @app.get("/_bench/stats")
+    def get_stats():
+        with lock:
+            return dict(counters)
+
+    @app.post("/_bench/reset")
+    async def reset(request: Request):
+        raw = await request.body()
+        if raw:
+            settings.update(await request.json())
+        with lock:
+            deliveries.clear()
+            counters.clear()
+        return {"ok": True}
+
+    return app
+
+def main():
+    settings = StubSettings(
+        line_latency_ms=_opt("--line-latency-ms", 50.0),
+        openai_latency_ms=_opt("--openai-latency-ms", 800.0),
+        line_error_rate=_opt("--line-error-rate", 0.0),
+        openai_error_rate=_opt("--openai-error-rate", 0.0),
+        seed=_opt("--seed", 1, int),
+    )
+    port = _opt("--port", int(os.getenv("BENCH_STUB_PORT", "9100")), int)
+    uvicorn.run(create_app(settings), host="127.0.0.1", port=port, log_level="warning")
+
+if __name__ == "__main__":
+    main()
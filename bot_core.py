@@ -1,102 +1,206 @@
 # bot_core.py
 
+import asyncio
 import os
 from typing import Optional, Dict
 
 from dotenv import load_dotenv
 
 from intents import classify_intents, extract_keyword
-from db.queries import find_guest_and_family
+from db import queries, guest_index, guest_snapshot
 from db.formatters import format_guest_reply
-from data_provider import get_wedding_context_string
-from ai_core import get_ai_reply
+from data_provider import get_wedding_context
+from ai_core import get_ai_reply, get_ai_reply_async, has_cached_answer
+import faq_router
+import metrics
+import seatmap
+import static_assets
 
 # Load environment variables from .env for local CLI testing
 load_dotenv()
 
 # Get environment variables
-STATIC_BASE_URL = os.getenv("STATIC_BASE_URL", "http://127.0.0.1:8000/static")
 STATIC_FULL_SEATMAP = os.getenv("STATIC_FULL_SEATMAP", "sample_map.example.webp")
+# LINE image messages only accept JPEG/PNG: the seat map sent inline, and its
+# preview (max 1 MB, defaults to the same file).
+STATIC_SEATMAP_IMAGE = os.getenv("STATIC_SEATMAP_IMAGE", "sample_map.example.png")
+STATIC_SEATMAP_PREVIEW = os.getenv("STATIC_SEATMAP_PREVIEW", "") or STATIC_SEATMAP_IMAGE
+# Widths asked of the static build: full view on a phone, LINE preview thumbnail.
+SEATMAP_VIEW_WIDTH = 1080
+SEATMAP_PREVIEW_WIDTH = 240
 DEBUG_VERBOSE = os.getenv("DEBUG_VERBOSE", "false").lower() == "true"
 
+# Seat lookup backend: "index" (in-process search index, falls back to SQL), "snapshot"
+# (mmap'd file shared by all uvicorn workers, db/guest_snapshot.py) or "sql".
+GUEST_SEARCH_MODE = os.getenv("GUEST_SEARCH_MODE", "index").lower()
+if GUEST_SEARCH_MODE == "sql":
+    find_guest_and_family = queries.find_guest_and_family_single
+elif GUEST_SEARCH_MODE == "snapshot":
+    find_guest_and_family = guest_snapshot.find_guest_and_family
+else:
+    find_guest_and_family = guest_index.find_guest_and_family
+
+def _is_line_image(file_name: str) -> bool:
+    return file_name.lower().endswith((".png", ".jpg", ".jpeg"))
+
+# Reply when the AI path raises unexpectedly.
+AI_FAILURE_TEXT = "出了點狀況～請稍後再嘗試～"
+
+def _seat_lookup_reply(user_input: str) -> Dict[str, Optional[str]]:
+    """
+    Seat lookup path: extract the name, query guests, format the reply.
+    Never needs the wedding context.
+    """
+    result = {"text": "", "image_url": None, "native_image_url": None, "preview_url": None}
+
+    keyword = extract_keyword(user_input)
+    if not keyword:
+        result["text"] = (
+            "抱歉，我不太確定你要找誰的座位，"
+            "麻煩您重新查詢，查詢範例：「我要找王小明的座位」，謝謝您！"
+        )
+        return result
+    
+    # Query database
+    with metrics.STAGE_SECONDS.time(stage="db_query"):
+        db_result = find_guest_and_family(keyword)
+
+    # Format reply context
+    with metrics.STAGE_SECONDS.time(stage="format"):
+        reply_text = format_guest_reply(db_result)
+    result["text"] = reply_text
+
+    tables = sorted({
+        member.get("seat_number")
+        for bundle in db_result.get("data",[])
+        for member in bundle.get("family", [])
+        if member.get("seat_number") not in (None, "", 0)
+    })
+
+    # Per-table highlighted maps when configured (seatmap.py), else the full map.
+    table_images = [
+        {
+            "table": t["table"],
+            "image_url": static_assets.asset_url(t["webp"]),
+            "native_image_url": static_assets.asset_url(t["jpeg"]),
+            "preview_url": static_assets.asset_url(t["preview"]),
+        }
+        for t in seatmap.images_for(tables)
+    ] if tables else []
+    if table_images:
+        result.update({k: table_images[0][k] for k in ("image_url", "native_image_url", "preview_url")})
+        result["table_images"] = table_images
+    # Return seat chart URL, plus a JPEG/PNG version LINE can show inline.
+    # Fingerprinted, phone-sized copies when the static build has them (static_assets.py).
+    elif tables:
+        result["image_url"] = static_assets.asset_url(f"maps/{STATIC_FULL_SEATMAP}", width=SEATMAP_VIEW_WIDTH)
+        if _is_line_image(STATIC_SEATMAP_IMAGE) and _is_line_image(STATIC_SEATMAP_PREVIEW):
+            result["native_image_url"] = static_assets.asset_url(f"maps/{STATIC_SEATMAP_IMAGE}", width=SEATMAP_VIEW_WIDTH)
+            result["preview_url"] = static_assets.asset_url(f"maps/{STATIC_SEATMAP_PREVIEW}", width=SEATMAP_PREVIEW_WIDTH)
+
+    
+    if DEBUG_VERBOSE:
+        print("========== DEBUG CONTEXT ==========")
+        print("User question:", user_input)
+        print("Seat context:\n", db_result or "(空)")
+        print("Tables parsed:", tables)
+        print("Image URL:", result["image_url"])
+
+    return result
+
+def _load_ai_context(user_input: str) -> Dict[str, str]:
+    # Load wedding info lazily, only the AI path uses it
+    wedding_context = get_wedding_context()
+
+    if DEBUG_VERBOSE:
+        print("========== DEBUG CONTEXT ==========")
+        print("User question:", user_input)
+        print("===================================")
+        print("Wedding context:\n",wedding_context["text"][:1000],"...")
+
+    return wedding_context
+
+def estimate_route(user_input: str) -> str:
+    """
+    Cheap guess of the path handle_message() will take, for scheduling:
+    "seat", "faq", "cached" (answer cache hit) or "llm". No DB or OpenAI calls.
+    """
+    if "seat_lookup" in classify_intents(user_input):
+        return "seat"
+    if faq_router.FAQ_ENABLED and faq_router.get_index().match(user_input):
+        return "faq"
+    wedding_context = get_wedding_context()
+    if has_cached_answer(wedding_context["text"], user_input, wedding_context["hash"]):
+        return "cached"
+    return "llm"
+
 def handle_message(user_input: str) -> Dict[str, Optional[str]]:
     """
     Handle user input with the following strategy:
-    1. Always include wedding information from JSON (static data).
-    2. If the intent is seat lookup, also query the database for seat info.
-    3. Otherwise, generate a natural-language reply via the AI model.
+    1. If the intent is seat lookup, query the database for seat info.
+    2. If the FAQ router is confident, answer straight from the wedding data.
+    3. Otherwise, load the wedding information (memoized) and generate
+       a natural-language reply via the AI model.
 
     :param user_input: User's message text.
     :return: A dictionary containing:
              - "text": reply text content.
              - "image_url": Optional seat map URL (if applicable).
+             - "native_image_url" / "preview_url": Optional JPEG/PNG seat map
+               and preview for a LINE image message.
+             - "table_images": Optional list of the above per table, with the
+               table highlighted (first entry = the keys above).
     """
-    result = {"text": "", "image_url": None}
-    db_result = None
-
-    # Step 1: Always include wedding info
-    wedding_context = get_wedding_context_string()
-
-    # Step 2: Add seat info if needed
-    intents = classify_intents(user_input)
-
+    # Step 1: Seat info if needed
+    with metrics.STAGE_SECONDS.time(stage="intent"):
+        intents = classify_intents(user_input)
     if "seat_lookup" in intents:
-        keyword = extract_keyword(user_input)
-        if not keyword:
-            result["text"] = (
-                "抱歉，我不太確定你要找誰的座位，"
-                "麻煩您重新查詢，查詢範例：「我要找王小明的座位」，謝謝您！"
-            )
-            return result
-        
-        # Query database
-        db_result = find_guest_and_family(keyword)
+        return _seat_lookup_reply(user_input)
 
-        # Format reply context
-        reply_text = format_guest_reply(db_result)
-        result["text"] = reply_text
-
-        tables = sorted({
-            member.get("seat_number")
-            for bundle in db_result.get("data",[])
-            for member in bundle.get("family", [])
-            if member.get("seat_number") not in (None, "", 0)
-        })
-
-        # Return seat chart URL
-        if tables:
-            result["image_url"] = f"{STATIC_BASE_URL}/maps/{STATIC_FULL_SEATMAP}"            
-        
-        
-        if DEBUG_VERBOSE:
-            print("========== DEBUG CONTEXT ==========")
-            print("User question:", user_input)
-            print("Seat context:\n", db_result or "(空)")
-            print("Tables parsed:", tables)
-            print("Image URL:", result["image_url"])
+    # Step 2: High-confidence FAQ, no OpenAI call
+    faq_reply = faq_router.answer(user_input)
+    if faq_reply:
+        return {"text": faq_reply, "image_url": None}
 
+    # Step 3: Let GPT generate a natural reply
+    result = {"text": "", "image_url": None}
+    try:
+        wedding_context = _load_ai_context(user_input)
+        result["text"] = get_ai_reply(context=wedding_context["text"], user_question=user_input,
+                                      context_hash=wedding_context["hash"])
         return result
+    except Exception as e:
+        result["text"] = AI_FAILURE_TEXT
+        if DEBUG_VERBOSE:
+            print(f"reply_error: {e}")
+        return result 
 
-    
-    # Step 3 : Merge contexts into one string
-    full_context = wedding_context
+async def handle_message_async(user_input: str) -> Dict[str, Optional[str]]:
+    """
+    Async version of handle_message() for the webhook's async execution mode.
+    The seat lookup (index or DB) runs in a worker thread; the AI call is awaited
+    on the event loop, so waiting on OpenAI does not hold a thread.
+    """
+    with metrics.STAGE_SECONDS.time(stage="intent"):
+        intents = classify_intents(user_input)
+    if "seat_lookup" in intents:
+        return await asyncio.to_thread(_seat_lookup_reply, user_input)
 
-    if DEBUG_VERBOSE:
-        print("========== DEBUG CONTEXT ==========")
-        print("User question:", user_input)
-        print("===================================")
-        print("Wedding context:\n",full_context[:1000],"...")
+    faq_reply = faq_router.answer(user_input)
+    if faq_reply:
+        return {"text": faq_reply, "image_url": None}
 
-    # Step 4: Let GPT generate a natural reply
+    result = {"text": "", "image_url": None}
     try:
-        reply = get_ai_reply(context=full_context, user_question=user_input)
-        result["text"] = reply
+        wedding_context = _load_ai_context(user_input)
+        result["text"] = await get_ai_reply_async(context=wedding_context["text"], user_question=user_input,
+                                                  context_hash=wedding_context["hash"])
         return result
     except Exception as e:
-        result["text"] = "出了點狀況～請稍後再嘗試～"
+        result["text"] = AI_FAILURE_TEXT
         if DEBUG_VERBOSE:
             print(f"reply_error: {e}")
-        return result 
+        return result
 
 
 if __name__ == "__main__":
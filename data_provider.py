@@ -1,13 +1,19 @@
 # data_provider.py
 
+import hashlib
 import json
 import os
-from typing import Any, List, Dict
+import threading
+from typing import Any, List, Dict, Tuple
 from collections.abc import Mapping
 
 
 # This module is a general rendering engine responsible for transforming 
 # external wedding data (from env or file) into an AI-friendly context string.
+# The rendered result is memoized and only rebuilt when its source changes.
+
+def _context_path() -> str:
+    return os.getenv("WEDDING_CONTEXT_PATH", "instance/wedding_data.json")
 
 def _load_blocks() -> List[Dict[str, Any]]:
     """
@@ -29,7 +35,7 @@ def _load_blocks() -> List[Dict[str, Any]]:
             print(f"WEDDING_CONTEXT_JSON 解析失敗: {e}，將嘗試改用檔案來源。")
 
     # 2) Fallback to file path
-    path = os.getenv("WEDDING_CONTEXT_PATH", "instance/wedding_data.json")
+    path = _context_path()
     try:
         with open(path, "r", encoding="utf-8") as f:
             data = json.load(f)
@@ -45,12 +51,10 @@ def _load_blocks() -> List[Dict[str, Any]]:
         print(f"讀取婚禮資料發生錯誤: {e}")
         return []
     
-def get_wedding_context_string() -> str:
+def _render(blocks: List[Dict[str, Any]]) -> str:
     """
     Transform the wedding data into an AI-readable, multi-section text string.
     """
-
-    blocks = _load_blocks()
     if not blocks:
         return "(尚未提供婚禮資料)"
     
@@ -76,6 +80,62 @@ def get_wedding_context_string() -> str:
 
     return "\n".join(parts).strip()
 
+def _source_key() -> Tuple:
+    """
+    Cheap fingerprint of the data source: hash of WEDDING_CONTEXT_JSON plus
+    mtime/size of the context file. No parsing involved.
+    """
+    raw = os.getenv("WEDDING_CONTEXT_JSON")
+    env_hash = hashlib.sha256(raw.encode("utf-8")).hexdigest() if raw else None
+    path = _context_path()
+    try:
+        st = os.stat(path)
+        file_key = (path, st.st_mtime_ns, st.st_size)
+    except OSError:
+        file_key = (path, None, None)
+    return (env_hash, file_key)
+
+_cache: Dict[str, Any] = {"key": None, "blocks": [], "text": "", "hash": ""}
+_cache_lock = threading.Lock()
+
+def get_wedding_context() -> Dict[str, Any]:
+    """
+    Return the memoized context: {"blocks", "text", "hash"}.
+    Rebuilt only when the env var content or the file mtime/size changes.
+    "hash" identifies the rendered text, for downstream caches.
+    """
+    global _cache
+    key = _source_key()
+    current = _cache
+    if current["key"] == key:
+        return current
+    with _cache_lock:
+        if _cache["key"] != key:
+            blocks = _load_blocks()
+            text = _render(blocks)
+            # Swap in a new dict so readers never see a half-updated entry.
+            _cache = {
+                "key": key,
+                "blocks": blocks,
+                "text": text,
+                "hash": hashlib.sha256(text.encode("utf-8")).hexdigest()[:16],
+            }
+        return _cache
+
+def get_wedding_context_string() -> str:
+    """
+    Transform the wedding data into an AI-readable, multi-section text string.
+    """
+    return get_wedding_context()["text"]
+
+def get_wedding_context_hash() -> str:
+    """Content hash of the current context string."""
+    return get_wedding_context()["hash"]
+
+def get_wedding_blocks() -> List[Dict[str, Any]]:
+    """Parsed wedding info blocks (shared, do not mutate)."""
+    return get_wedding_context()["blocks"]
+
 # This block is for local testing of the module behavior.
 if __name__ == "__main__":
     print(get_wedding_context_string())
\ No newline at end of file
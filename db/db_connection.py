@@ -1,7 +1,13 @@
 # db_connection.py
 
 import os 
+import threading
+import time
+from contextlib import contextmanager
+
 import psycopg2
+from psycopg2 import extensions
+from psycopg2.pool import PoolError
 from psycopg2.extras import RealDictCursor
 from dotenv import load_dotenv
 
@@ -10,6 +16,27 @@ BASE_DIR = os.path.dirname(os.path.dirname(__file__))
 ENV_PATH = os.path.join(BASE_DIR, ".env")
 load_dotenv(ENV_PATH)
 
+DEBUG_VERBOSE = os.getenv("DEBUG_VERBOSE", "false").lower() == "true"
+
+def _get_num_env(var_name: str, default, cast=int):
+    try:
+        return cast(os.getenv(var_name, default))
+    except ValueError:
+        print(f"[Error] Invalid value for {var_name}, fallback to {default}")
+        return default
+
+# Pool sizing. Sync background tasks run on the anyio worker threads (40 by default),
+# so DB_POOL_MAX bounds how many of them can hold a connection at the same time.
+DB_POOL_MIN = _get_num_env("DB_POOL_MIN", 1)
+DB_POOL_MAX = _get_num_env("DB_POOL_MAX", 10)
+# Seconds a caller waits for a free connection before giving up.
+DB_POOL_TIMEOUT = _get_num_env("DB_POOL_TIMEOUT", 5.0, float)
+# Connections idle longer than this are pinged (SELECT 1) on checkout.
+DB_POOL_PING_SECONDS = _get_num_env("DB_POOL_PING_SECONDS", 30.0, float)
+
+# Errors that mean the connection itself is gone (server restart, idle kill, network drop).
+DISCONNECT_ERRORS = (psycopg2.OperationalError, psycopg2.InterfaceError)
+
 def get_connection():
     """
     Create a PostgreSQL connection.
@@ -37,20 +64,235 @@ def get_connection():
             cursor_factory=RealDictCursor
         ) 
 
+class PoolTimeout(PoolError):
+    """Raised when no connection becomes available within the borrow timeout."""
+
+class ConnectionPool:
+    """
+    Thread-safe pool of long-lived connections.
+    - Keeps up to `maxconn` connections, `minconn` of them opened eagerly.
+    - Callers block up to `timeout` seconds when every connection is in use.
+    - Checked-out connections are verified (closed flag, SELECT 1 after idling).
+    - Broken connections are discarded and replaced on the next checkout.
+    """
+
+    def __init__(self, minconn: int = DB_POOL_MIN, maxconn: int = DB_POOL_MAX,
+                 timeout: float = DB_POOL_TIMEOUT, ping_seconds: float = DB_POOL_PING_SECONDS,
+                 connect=get_connection):
+        self.minconn = max(0, minconn)
+        self.maxconn = max(1, maxconn, self.minconn)
+        self.timeout = timeout
+        self.ping_seconds = ping_seconds
+        self._connect = connect
+        self._cond = threading.Condition()
+        self._idle = []      # list of (conn, returned_at)
+        self._in_use = 0
+        self._opening = 0    # slots reserved for connections being opened
+        self._closed = False
+
+        # Stats
+        self._created = 0
+        self._discarded = 0
+        self._checkouts = 0
+        self._waits = 0
+        self._timeouts = 0
+        self._wait_total = 0.0
+        self._wait_max = 0.0
+
+        for _ in range(self.minconn):
+            try:
+                self._idle.append((self._new_connection(), time.monotonic()))
+            except Exception as e:
+                print(f"[db_pool][warm-up-error] {type(e).__name__}: {e}")
+                break
+
+    def _new_connection(self):
+        conn = self._connect()
+        with self._cond:
+            self._created += 1
+        return conn
+
+    def _size(self) -> int:
+        return len(self._idle) + self._in_use + self._opening
+
+    def _is_alive(self, conn, idle_for: float) -> bool:
+        if conn.closed:
+            return False
+        if idle_for < self.ping_seconds:
+            return True
+        try:
+            with conn.cursor() as cur:
+                cur.execute("SELECT 1")
+            conn.rollback()
+            return True
+        except Exception:
+            return False
+
+    def _close_quietly(self, conn) -> None:
+        try:
+            conn.close()
+        except Exception:
+            pass
+
+    def getconn(self, timeout: float = None):
+        """Borrow a connection; raise PoolTimeout if none frees up in time."""
+        timeout = self.timeout if timeout is None else timeout
+        started = time.monotonic()
+        deadline = started + timeout
+        waited = False
+
+        while True:
+            with self._cond:
+                if self._closed:
+                    raise PoolError("connection pool is closed")
+                while not self._idle and self._size() >= self.maxconn:
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0:
+                        self._timeouts += 1
+                        raise PoolTimeout(
+                            f"no database connection available within {timeout:.1f}s "
+                            f"(in_use={self._in_use}, max={self.maxconn})"
+                        )
+                    waited = True
+                    self._cond.wait(remaining)
+
+                if self._idle:
+                    conn, returned_at = self._idle.pop()
+                    self._in_use += 1
+                    fresh = False
+                else:
+                    conn, returned_at = None, None
+                    self._opening += 1
+                    fresh = True
+
+            if fresh:
+                try:
+                    conn = self._new_connection()
+                finally:
+                    with self._cond:
+                        self._opening -= 1
+                        if conn is not None:
+                            self._in_use += 1
+                        self._cond.notify()
+            elif not self._is_alive(conn, time.monotonic() - returned_at):
+                # Dead connection, drop it and try again (will open a new one).
+                self._close_quietly(conn)
+                with self._cond:
+                    self._in_use -= 1
+                    self._discarded += 1
+                    self._cond.notify()
+                continue
+
+            wait = time.monotonic() - started
+            with self._cond:
+                self._checkouts += 1
+                if waited:
+                    self._waits += 1
+                self._wait_total += wait
+                self._wait_max = max(self._wait_max, wait)
+            return conn
+
+    def putconn(self, conn, discard: bool = False) -> None:
+        """Return a connection. Broken or dirty connections are closed instead of reused."""
+        if not discard and not conn.closed:
+            try:
+                if conn.info.transaction_status != extensions.TRANSACTION_STATUS_IDLE:
+                    conn.rollback()
+            except Exception:
+                discard = True
+        if conn.closed:
+            discard = True
+
+        with self._cond:
+            self._in_use -= 1
+            if discard or self._closed:
+                self._discarded += 1
+            else:
+                self._idle.append((conn, time.monotonic()))
+                conn = None
+            self._cond.notify()
+        if conn is not None:
+            self._close_quietly(conn)
+
+    @contextmanager
+    def connection(self):
+        """with pool.connection() as conn: ... (discarded if the link dropped)"""
+        conn = self.getconn()
+        discard = False
+        try:
+            yield conn
+        except DISCONNECT_ERRORS:
+            discard = True
+            raise
+        finally:
+            self.putconn(conn, discard=discard)
+
+    def closeall(self) -> None:
+        with self._cond:
+            self._closed = True
+            idle, self._idle = self._idle, []
+            self._cond.notify_all()
+        for conn, _ in idle:
+            self._close_quietly(conn)
+
+    def stats(self) -> dict:
+        with self._cond:
+            return {
+                "min": self.minconn,
+                "max": self.maxconn,
+                "in_use": self._in_use,
+                "idle": len(self._idle),
+                "opening": self._opening,
+                "created": self._created,
+                "discarded": self._discarded,
+                "checkouts": self._checkouts,
+                "waits": self._waits,
+                "timeouts": self._timeouts,
+                "wait_avg_ms": round(self._wait_total / self._checkouts * 1000, 3) if self._checkouts else 0.0,
+                "wait_max_ms": round(self._wait_max * 1000, 3),
+            }
+
+_pool = None
+_pool_lock = threading.Lock()
+
+def get_pool() -> ConnectionPool:
+    """Return the process-wide pool, creating it on first use."""
+    global _pool
+    if _pool is None:
+        with _pool_lock:
+            if _pool is None:
+                _pool = ConnectionPool()
+    return _pool
+
+def get_pool_stats() -> dict:
+    """Pool stats (in use, idle, wait time) for sizing DB_POOL_MAX."""
+    return get_pool().stats() if _pool is not None else {"in_use": 0, "idle": 0, "created": 0}
+
+def close_pool() -> None:
+    """Close every pooled connection (called on app shutdown)."""
+    global _pool
+    with _pool_lock:
+        if _pool is not None:
+            _pool.closeall()
+            _pool = None
+
 def run_query(sql:str, params: tuple= ()):
     """
     Convenience helper:
     Execute a read-only query and return list[dict].
-    It opens/closes the connection for the function
+    Borrows a pooled connection; if the server dropped it, retry once on a fresh one.
     """
 
-    conn = None
-    try:
-        conn = get_connection()
-        with conn:
-            with conn.cursor() as cur:
-                cur.execute(sql, params)
-                return cur.fetchall()
-    finally:
-        if conn:
-            conn.close()
\ No newline at end of file
+    pool = get_pool()
+    for attempt in (1, 2):
+        try:
+            with pool.connection() as conn:
+                with conn:
+                    with conn.cursor() as cur:
+                        cur.execute(sql, params)
+                        return cur.fetchall()
+        except DISCONNECT_ERRORS as e:
+            if attempt == 2:
+                raise
+            if DEBUG_VERBOSE:
+                print(f"[db_pool][reconnect] {type(e).__name__}: {e}")
@@ -0,0 +1,363 @@
+# db/guest_index.py
+
+import csv
+import os
+import threading
+import time
+from typing import Any, Dict, List, Optional
+
+from db.db_connection import run_query
+from db import queries
+from db.queries import FAMILY_AMBIGUITY_THRESHOLD, ROW_HARD_CAP, resolve_anchors
+
+# In-process guest search index.
+# Loads every attending guest once, builds a character-bigram inverted index over
+# name / alias / display_name and answers seat lookups without touching the DB.
+# The SQL path in db/queries.py stays available as a fallback.
+# With migration 002 applied, changes are detected through guest_data_version and
+# only the guest_codes logged in guest_changes since the last load are re-read.
+
+DEBUG_VERBOSE = os.getenv("DEBUG_VERBOSE", "false").lower() == "true"
+
+# How often (seconds) to probe the guests table for changes.
+try:
+    REFRESH_SECONDS = float(os.getenv("GUEST_INDEX_REFRESH_SECONDS", "30"))
+except ValueError:
+    print("[Error] Invalid value for GUEST_INDEX_REFRESH_SECONDS, fallback to 30")
+    REFRESH_SECONDS = 30.0
+
+# Serve the index from a guests CSV instead of the database (benchmarks, demos).
+GUEST_INDEX_CSV = os.getenv("GUEST_INDEX_CSV", "")
+
+SEARCH_FIELDS = ("name", "alias", "display_name")
+FAMILY_FIELDS = ("guest_code", "show_name", "seat_number", "group_code", "relation_role")
+
+VERSION_SQL = """
+SELECT COUNT(*) AS row_count,
+       MD5(COALESCE(STRING_AGG(g::text, '|' ORDER BY g.guest_code), '')) AS digest
+FROM guests g
+"""
+
+DATA_VERSION_SQL = "SELECT version FROM guest_data_version"
+HAS_DATA_VERSION_SQL = "SELECT to_regclass('guest_data_version') IS NOT NULL AS present"
+CHANGES_SQL = """
+SELECT version, guest_code, op
+FROM guest_changes
+WHERE version > %s AND version <= %s
+ORDER BY version
+"""
+
+LOAD_SQL = """
+SELECT guest_code,
+       name,
+       alias,
+       display_name,
+       COALESCE(display_name, name, alias) AS show_name,
+       seat_number,
+       group_code,
+       relation_role,
+       representative
+FROM guests
+WHERE attending = TRUE
+"""
+LOAD_CODES_SQL = LOAD_SQL + " AND guest_code = ANY(%s)"
+
+# Past this share of changed rows a full reload is cheaper than patching.
+INCREMENTAL_MAX_SHARE = 0.5
+
+
+def _load_csv_rows(path: str) -> List[Dict[str, Any]]:
+    """Attending guests from a guests CSV, same shape as LOAD_SQL rows."""
+    def _val(row, key):
+        val = (row.get(key) or "").strip()
+        return val or None
+
+    rows = []
+    with open(path, newline="", encoding="utf-8-sig") as f:
+        for row in csv.DictReader(f):
+            if str(row.get("attending", "")).strip().upper() != "TRUE":
+                continue
+            seat = _val(row, "seat_number")
+            rows.append({
+                "guest_code": _val(row, "guest_code"),
+                "name": _val(row, "name"),
+                "alias": _val(row, "alias"),
+                "display_name": _val(row, "display_name"),
+                "show_name": _val(row, "display_name") or _val(row, "name") or _val(row, "alias"),
+                "seat_number": int(seat) if seat else None,
+                "group_code": _val(row, "group_code"),
+                "relation_role": _val(row, "relation_role"),
+                "representative": _val(row, "representative"),
+            })
+    return rows
+
+
+def _bigrams(text: str) -> set:
+    return {text[i:i + 2] for i in range(len(text) - 1)}
+
+
+def family_order(member: Dict[str, Any]) -> tuple:
+    """Sort key of family members, same as SQL ORDER BY relation_role, guest_code (NULLs last)."""
+    role = member.get("relation_role")
+    return (role is None, role or "", member["guest_code"])
+
+
+class _Snapshot:
+    """
+    Immutable view of the guest table. A refresh builds a new snapshot and swaps
+    the reference, so readers never see a half-built index.
+    """
+    __slots__ = ("version", "source", "rows", "texts", "postings", "families", "loaded_at")
+
+    def __init__(self, version: Optional[str], rows: List[Dict[str, Any]]):
+        self.version = version
+        self.loaded_at = time.time()
+        self.source = rows  # LOAD_SQL rows, kept for incremental refreshes
+        # Self rows, same shape as queries.find_self_rows()
+        self.rows = [
+            {
+                "guest_code": r["guest_code"],
+                "show_name": r["show_name"],
+                "seat_number": r["seat_number"],
+                "group_code": r["group_code"],
+                "relation_role": r["relation_role"],
+                "representative": r["representative"],
+            }
+            for r in rows
+        ]
+        # Lower-cased search fields per row (ILIKE is case-insensitive).
+        self.texts = [
+            tuple(str(r[f]).lower() for f in SEARCH_FIELDS if r.get(f))
+            for r in rows
+        ]
+
+        postings: Dict[str, set] = {}
+        for row_id, fields in enumerate(self.texts):
+            for field in fields:
+                for gram in _bigrams(field):
+                    postings.setdefault(gram, set()).add(row_id)
+        self.postings = {gram: frozenset(ids) for gram, ids in postings.items()}
+
+        # Family of an anchor = rows whose representative or guest_code is the anchor,
+        # same as queries.find_family_by_guest_code().
+        families: Dict[str, List[Dict[str, Any]]] = {}
+        for r in self.rows:
+            member = {k: r[k] for k in FAMILY_FIELDS}
+            families.setdefault(r["guest_code"], []).append(member)
+            rep = r["representative"]
+            if rep and rep != r["guest_code"]:
+                families.setdefault(rep, []).append(member)
+        for members in families.values():
+            members.sort(key=family_order)
+        self.families = families
+
+    def match(self, keyword: str) -> List[Dict[str, Any]]:
+        """
+        Case-insensitive substring match on name / alias / display_name, in load
+        order. % and _ are literal, as in the SQL path (queries.like_pattern).
+        """
+        kw = keyword.lower()
+        grams = sorted(_bigrams(kw), key=lambda g: len(self.postings.get(g, ())))
+        if not grams:
+            return []
+
+        candidates = self.postings.get(grams[0])
+        if not candidates:
+            return []
+        for gram in grams[1:]:
+            candidates = candidates & self.postings.get(gram, frozenset())
+            if not candidates:
+                return []
+
+        # Bigrams may come from different fields, verify the real substring.
+        return [
+            self.rows[i] for i in sorted(candidates)
+            if any(kw in field for field in self.texts[i])
+        ]
+
+    def family(self, anchor: str) -> List[Dict[str, Any]]:
+        return [dict(m) for m in self.families.get(anchor, [])]
+
+    def find_guest_and_family(self, keyword: str) -> Dict[str, Any]:
+        return bundle_families(self, keyword)
+
+
+def bundle_families(snapshot, keyword: str) -> Dict[str, Any]:
+    """
+    queries.find_guest_and_family() payload from any snapshot with match(keyword)
+    and family(anchor) (this module's _Snapshot, db/guest_snapshot.py's mmap reader).
+    """
+    if not keyword or len(keyword) < 2 or len(keyword) > 20:
+        return {"status": "too_short", "data": []}
+
+    self_rows = snapshot.match(keyword)
+    if not self_rows:
+        return {"status": "not_found", "data": []}
+
+    if len(self_rows) > ROW_HARD_CAP:
+        return {"status": "too_many", "data": []}
+
+    anchors = resolve_anchors(self_rows)
+    if len(anchors) > FAMILY_AMBIGUITY_THRESHOLD:
+        return {"status": "too_many", "data": []}
+
+    result = []
+    for anchor in anchors:
+        family = snapshot.family(anchor)
+        who = next((m["show_name"] for m in family if m["relation_role"] == "self"),
+                   family[0]["show_name"] if family else " (未知代表人) ")
+        result.append({"who": who, "family": family})
+
+    return {"status": "ok", "data": result}
+
+
+class GuestSearchIndex:
+    """
+    Thread-safe holder of the current snapshot.
+    The version probe runs at most once per REFRESH_SECONDS; while one thread
+    refreshes, the others keep answering from the previous snapshot.
+    """
+
+    def __init__(self, refresh_seconds: float = REFRESH_SECONDS):
+        self.refresh_seconds = refresh_seconds
+        self._snapshot: Optional[_Snapshot] = None
+        self._checked_at = 0.0
+        self._lock = threading.Lock()
+        self._has_data_version = False
+        self.refresh_count = 0
+        self.incremental_count = 0
+
+    def _probe_version(self) -> str:
+        # "v<n>" from guest_data_version (one row), else a digest of the whole table.
+        if GUEST_INDEX_CSV:
+            st = os.stat(GUEST_INDEX_CSV)
+            return f"csv:{st.st_size}:{st.st_mtime_ns}"
+        if not self._has_data_version:
+            self._has_data_version = run_query(HAS_DATA_VERSION_SQL)[0]["present"]
+        if self._has_data_version:
+            return f"v{run_query(DATA_VERSION_SQL)[0]['version']}"
+        row = run_query(VERSION_SQL)[0]
+        return f"{row['row_count']}:{row['digest']}"
+
+    def _patched_rows(self, current: _Snapshot, version: str) -> Optional[List[Dict[str, Any]]]:
+        """
+        current's rows with the guests changed since its version re-read from the DB,
+        or None when a full reload is needed (no version, whole-table reload, log gap).
+        """
+        if not (current.version or "").startswith("v") or not version.startswith("v"):
+            return None
+        old, new = int(current.version[1:]), int(version[1:])
+        if new <= old:
+            return None
+        log = run_query(CHANGES_SQL, (old, new))
+        if {r["version"] for r in log} != set(range(old + 1, new + 1)):
+            return None  # Log pruned or written by something else
+        if any(r["op"] == "reload" for r in log):
+            return None
+        codes = {r["guest_code"] for r in log}
+        if len(codes) > max(1, len(current.source)) * INCREMENTAL_MAX_SHARE:
+            return None
+
+        fresh = {r["guest_code"]: r for r in run_query(LOAD_CODES_SQL, (list(codes),))}
+        rows = []
+        for r in current.source:
+            code = r["guest_code"]
+            if code not in codes:
+                rows.append(r)
+            elif code in fresh:
+                rows.append(fresh.pop(code))  # Updated in place; soft-deleted rows drop out
+        rows.extend(fresh.values())  # New guests
+        return rows
+
+    def refresh(self, force: bool = False) -> bool:
+        """
+        Reload the snapshot if the guest table version changed.
+        :return: True if a new snapshot was swapped in.
+        """
+        version = self._probe_version()
+        current = self._snapshot
+        self._checked_at = time.monotonic()
+        if not force and current is not None and current.version == version:
+            return False
+
+        rows = None if force or current is None else self._patched_rows(current, version)
+        incremental = rows is not None
+        if not incremental:
+            rows = _load_csv_rows(GUEST_INDEX_CSV) if GUEST_INDEX_CSV else run_query(LOAD_SQL)
+        snapshot = _Snapshot(version, rows)
+        self._snapshot = snapshot  # Atomic reference swap
+        self.refresh_count += 1
+        self.incremental_count += incremental
+        if DEBUG_VERBOSE:
+            print(f"[guest_index][refresh] rows={len(snapshot.rows)} grams={len(snapshot.postings)} "
+                  f"version={version} {'incremental' if incremental else 'full'}")
+        return True
+
+    def snapshot(self) -> _Snapshot:
+        """Return the current snapshot, loading or refreshing it when due."""
+        current = self._snapshot
+        if current is None:
+            with self._lock:
+                if self._snapshot is None:
+                    self.refresh(force=True)
+            return self._snapshot
+
+        if time.monotonic() - self._checked_at >= self.refresh_seconds:
+            # Only one thread probes; the rest keep the current snapshot.
+            if self._lock.acquire(blocking=False):
+                try:
+                    self.refresh()
+                except Exception as e:
+                    self._checked_at = time.monotonic()
+                    print(f"[guest_index][refresh-error] {type(e).__name__}: {e} (serving stale index)")
+                finally:
+                    self._lock.release()
+        return self._snapshot
+
+    def find_guest_and_family(self, keyword: str) -> Dict[str, Any]:
+        return self.snapshot().find_guest_and_family(keyword)
+
+    def stats(self) -> Dict[str, Any]:
+        current = self._snapshot
+        return {
+            "loaded": current is not None,
+            "rows": len(current.rows) if current else 0,
+            "bigrams": len(current.postings) if current else 0,
+            "version": current.version if current else None,
+            "loaded_at": current.loaded_at if current else None,
+            "refresh_count": self.refresh_count,
+            "incremental_count": self.incremental_count,
+        }
+
+
+_index = GuestSearchIndex()
+
+
+def get_index() -> GuestSearchIndex:
+    return _index
+
+
+def find_guest_and_family(keyword: str) -> Dict[str, Any]:
+    """
+    Same contract as queries.find_guest_and_family(), served from memory.
+    Falls back to the SQL path if the index cannot be loaded.
+    """
+    try:
+        return _index.find_guest_and_family(keyword)
+    except Exception as e:
+        print(f"[guest_index][fallback] {type(e).__name__}: {e} → SQL lookup")
+        return queries.find_guest_and_family_single(keyword)
+
+
+if __name__ == "__main__":
+    while True:
+        keyword = input("Input Name:").strip()
+        if keyword.lower() in {"exit", "quit", "q"}:
+            print("--- End ---")
+            break
+        t0 = time.perf_counter()
+        bundles = find_guest_and_family(keyword)
+        elapsed_us = (time.perf_counter() - t0) * 1_000_000
+        print(f"\n Index result ({elapsed_us:.0f} µs):\n", bundles)
+        print("\n SQL result:\n", queries.find_guest_and_family_single(keyword))
+        print("\n Index stats:", _index.stats())
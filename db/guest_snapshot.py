@@ -0,0 +1,434 @@
+# db/guest_snapshot.py
+
+import bisect
+import mmap
+import os
+import struct
+import sys
+import threading
+import time
+from array import array
+from typing import Any, Dict, List, Optional
+
+from db import guest_index, queries
+
+try:
+    import fcntl  # POSIX: only one process rebuilds the file
+except ImportError:
+    fcntl = None
+
+# Compact binary guest snapshot, shared by every uvicorn worker.
+# With GUEST_SEARCH_MODE=snapshot the guest list is written once to
+# GUEST_SNAPSHOT_PATH and each worker mmaps it read-only, so all processes share
+# one page-cache copy instead of each holding (and refreshing) its own index.
+# Lookups read the columns in place; only the rows they return become dicts.
+#
+# Layout (little-endian, every section 8-byte aligned, offsets in the header):
+#   strings       sorted, de-duplicated UTF-8 strings: u32 offsets + blob
+#                 (a string id therefore orders like the string itself)
+#   columns       one fixed-width value per row: guest_code, show_name, group_code,
+#                 relation_role, representative (u32 string ids, NONE = null),
+#                 seat_number (i32, NO_SEAT = null), search (3 x u32: lower-cased
+#                 name / alias / display_name)
+#   postings      character bigrams as sorted u64 keys + CSR of row ids
+#   families      anchor guest_code string ids (sorted) + CSR of member row ids,
+#                 members already ordered like queries.find_family_by_guest_code()
+#
+# One process (whoever holds <path>.lock) keeps a guest_index.GuestSearchIndex,
+# so Postgres is probed, and patched incrementally, by that process only; when
+# the version changes it writes a new file next to the old one and renames it
+# over. Every worker notices the new inode on its next check and remaps it.
+# tools/guest_loader.py --snapshot writes the file right after an import.
+
+DEBUG_VERBOSE = os.getenv("DEBUG_VERBOSE", "false").lower() == "true"
+
+GUEST_SNAPSHOT_PATH = os.getenv("GUEST_SNAPSHOT_PATH", "instance/guest_snapshot.bin")
+# On first use, how long a worker that does not build waits for the builder's file.
+try:
+    FIRST_MAP_WAIT_SECONDS = float(os.getenv("GUEST_SNAPSHOT_WAIT_SECONDS", "10"))
+except ValueError:
+    print("[Error] Invalid value for GUEST_SNAPSHOT_WAIT_SECONDS, fallback to 10")
+    FIRST_MAP_WAIT_SECONDS = 10.0
+
+MAGIC = b"WGUESTS\x00"
+FORMAT_VERSION = 1
+NONE = 0xFFFFFFFF  # Null string id
+NO_SEAT = -(2 ** 31)  # Null seat_number
+
+SECTIONS = (
+    "str_offsets", "str_blob",
+    "guest_code", "show_name", "group_code", "relation_role", "representative",
+    "seat_number", "search",
+    "gram_keys", "gram_offsets", "postings",
+    "family_keys", "family_offsets", "family_members",
+)
+STRING_COLUMNS = ("guest_code", "show_name", "group_code", "relation_role", "representative")
+# magic, format, row_count, string_count, gram_count, family_count, version string id,
+# then the start of every section and the end of the file.
+HEADER = struct.Struct("<8s6I" + "Q" * (len(SECTIONS) + 1))
+
+
+def _gram_key(gram: str) -> int:
+    # Code points fit in 21 bits.
+    return (ord(gram[0]) << 21) | ord(gram[1])
+
+
+def _bigrams(text: str) -> set:
+    return {text[i:i + 2] for i in range(len(text) - 1)}
+
+
+def write(path: str, rows: List[Dict[str, Any]], version: Optional[str]) -> int:
+    """
+    Write guest_index.LOAD_SQL-shaped rows as a snapshot file (write, fsync,
+    then rename over the old one). Returns the file size.
+    """
+    if sys.byteorder != "little":
+        raise RuntimeError("guest snapshots are little-endian only")
+
+    search = [tuple(str(r[f]).lower() if r.get(f) else None for f in guest_index.SEARCH_FIELDS)
+              for r in rows]
+    strings = {version or ""}
+    for r, fields in zip(rows, search):
+        strings.update(str(r[c]) for c in STRING_COLUMNS if r.get(c) is not None)
+        strings.update(f for f in fields if f)
+    strings = sorted(strings)
+    sid = {s: i for i, s in enumerate(strings)}
+
+    def _sid(value) -> int:
+        return NONE if value is None else sid[str(value)]
+
+    sections: Dict[str, bytes] = {}
+    blob, offsets = bytearray(), array("I", [0])
+    for s in strings:
+        blob += s.encode("utf-8")
+        offsets.append(len(blob))
+    sections["str_offsets"], sections["str_blob"] = offsets.tobytes(), bytes(blob)
+    for column in STRING_COLUMNS:
+        sections[column] = array("I", (_sid(r.get(column)) for r in rows)).tobytes()
+    sections["seat_number"] = array("i", (NO_SEAT if r.get("seat_number") is None else int(r["seat_number"])
+                                          for r in rows)).tobytes()
+    sections["search"] = array("I", (_sid(f) for fields in search for f in fields)).tobytes()
+
+    postings: Dict[int, set] = {}
+    for row_id, fields in enumerate(search):
+        for field in fields:
+            for gram in _bigrams(field or ""):
+                postings.setdefault(_gram_key(gram), set()).add(row_id)
+    keys = sorted(postings)
+    sections["gram_keys"] = array("Q", keys).tobytes()
+    flat, offsets = array("I"), array("I", [0])
+    for key in keys:
+        flat.extend(sorted(postings[key]))
+        offsets.append(len(flat))
+    sections["gram_offsets"], sections["postings"] = offsets.tobytes(), flat.tobytes()
+
+    # Same grouping and order as guest_index._Snapshot.families.
+    families: Dict[str, List[int]] = {}
+    for row_id, r in enumerate(rows):
+        families.setdefault(r["guest_code"], []).append(row_id)
+        rep = r.get("representative")
+        if rep and rep != r["guest_code"]:
+            families.setdefault(rep, []).append(row_id)
+    anchors = sorted(families, key=lambda a: sid[a])
+    flat, offsets = array("I"), array("I", [0])
+    for anchor in anchors:
+        flat.extend(sorted(families[anchor], key=lambda i: guest_index.family_order(rows[i])))
+        offsets.append(len(flat))
+    sections["family_keys"] = array("I", (sid[a] for a in anchors)).tobytes()
+    sections["family_offsets"], sections["family_members"] = offsets.tobytes(), flat.tobytes()
+
+    starts, position = [], HEADER.size
+    for name in SECTIONS:
+        starts.append(position)
+        position += (len(sections[name]) + 7) // 8 * 8
+    header = HEADER.pack(MAGIC, FORMAT_VERSION, len(rows), len(strings), len(keys), len(anchors),
+                         sid[version or ""], *starts, position)
+
+    folder = os.path.dirname(path)
+    if folder:
+        os.makedirs(folder, exist_ok=True)
+    tmp = f"{path}.{os.getpid()}.tmp"
+    with open(tmp, "wb") as f:
+        f.write(header)
+        for name in SECTIONS:
+            data = sections[name]
+            f.write(data + b"\0" * ((8 - len(data) % 8) % 8))
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp, path)  # Readers see the old file or the new one, never a mix
+    return position
+
+
+class GuestSnapshot:
+    """
+    Read-only view of a snapshot file; same match() / family() / texts as
+    guest_index._Snapshot, so guest_index.bundle_families() and name_spotter
+    work on either.
+    """
+
+    def __init__(self, path: str):
+        if sys.byteorder != "little":
+            raise RuntimeError("guest snapshots are little-endian only")
+        self.path = path
+        with open(path, "rb") as f:
+            st = os.fstat(f.fileno())
+            self.file_key = (st.st_ino, st.st_mtime_ns, st.st_size)
+            self._mm = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        if st.st_size < HEADER.size:
+            raise ValueError(f"{path} is not a guest snapshot")
+        (magic, fmt, self.row_count, string_count, gram_count, family_count, version_sid,
+         *bounds) = HEADER.unpack_from(self._mm, 0)
+        if magic != MAGIC or fmt != FORMAT_VERSION or bounds[-1] != st.st_size:
+            raise ValueError(f"{path} is not a guest snapshot (format {FORMAT_VERSION})")
+
+        view = memoryview(self._mm)
+        formats = {"str_blob": "B", "gram_keys": "Q", "seat_number": "i"}
+        for i, name in enumerate(SECTIONS):
+            setattr(self, "_" + name, view[bounds[i]:bounds[i + 1]])
+        # Element counts (without the alignment padding); variable-length sections
+        # end where their offsets array says.
+        lengths = {
+            "str_offsets": lambda: string_count + 1,
+            "str_blob": lambda: self._str_offsets[-1],
+            "seat_number": lambda: self.row_count,
+            "search": lambda: self.row_count * 3,
+            "gram_keys": lambda: gram_count,
+            "gram_offsets": lambda: gram_count + 1,
+            "postings": lambda: self._gram_offsets[-1],
+            "family_keys": lambda: family_count,
+            "family_offsets": lambda: family_count + 1,
+            "family_members": lambda: self._family_offsets[-1],
+        }
+        for name in SECTIONS:
+            fmt = formats.get(name, "I")
+            count = lengths.get(name, lambda: self.row_count)()
+            setattr(self, "_" + name, getattr(self, "_" + name)[:count * struct.calcsize(fmt)].cast(fmt))
+        self.version = self._string(version_sid) or None
+        self.size = st.st_size
+        self.loaded_at = time.time()
+        self._texts = None
+
+    def _string(self, string_id: int) -> Optional[str]:
+        if string_id == NONE:
+            return None
+        return bytes(self._str_blob[self._str_offsets[string_id]:self._str_offsets[string_id + 1]]).decode("utf-8")
+
+    def _string_id(self, value: str) -> int:
+        """Binary search of the sorted string table; NONE if absent."""
+        lo, hi = 0, len(self._str_offsets) - 1
+        while lo < hi:
+            mid = (lo + hi) // 2
+            if self._string(mid) < value:
+                lo = mid + 1
+            else:
+                hi = mid
+        return lo if lo < len(self._str_offsets) - 1 and self._string(lo) == value else NONE
+
+    def _row(self, i: int) -> Dict[str, Any]:
+        seat = self._seat_number[i]
+        return {
+            "guest_code": self._string(self._guest_code[i]),
+            "show_name": self._string(self._show_name[i]),
+            "seat_number": None if seat == NO_SEAT else seat,
+            "group_code": self._string(self._group_code[i]),
+            "relation_role": self._string(self._relation_role[i]),
+            "representative": self._string(self._representative[i]),
+        }
+
+    def _search_texts(self, i: int) -> tuple:
+        return tuple(s for s in (self._string(self._search[i * 3 + k]) for k in range(3)) if s)
+
+    def _posting(self, gram: str):
+        key = _gram_key(gram)
+        k = bisect.bisect_left(self._gram_keys, key)
+        if k == len(self._gram_keys) or self._gram_keys[k] != key:
+            return None
+        return self._postings[self._gram_offsets[k]:self._gram_offsets[k + 1]]
+
+    def match(self, keyword: str) -> List[Dict[str, Any]]:
+        """Same matches as guest_index._Snapshot.match(), in row order."""
+        kw = keyword.lower()
+        grams = _bigrams(kw)
+        if not grams:
+            return []
+        lists = []
+        for gram in grams:
+            ids = self._posting(gram)
+            if ids is None:
+                return []
+            lists.append(ids)
+        lists.sort(key=len)
+
+        # Walk the shortest posting list, binary-search the others.
+        candidates = []
+        for row_id in lists[0]:
+            for ids in lists[1:]:
+                k = bisect.bisect_left(ids, row_id)
+                if k == len(ids) or ids[k] != row_id:
+                    break
+            else:
+                candidates.append(row_id)
+
+        # Bigrams may come from different fields, verify the real substring.
+        return [self._row(i) for i in candidates if any(kw in field for field in self._search_texts(i))]
+
+    def family(self, anchor: str) -> List[Dict[str, Any]]:
+        anchor_id = self._string_id(anchor)
+        k = bisect.bisect_left(self._family_keys, anchor_id)
+        if anchor_id == NONE or k == len(self._family_keys) or self._family_keys[k] != anchor_id:
+            return []
+        members = self._family_members[self._family_offsets[k]:self._family_offsets[k + 1]]
+        return [{f: row[f] for f in guest_index.FAMILY_FIELDS} for row in map(self._row, members)]
+
+    @property
+    def texts(self) -> List[tuple]:
+        """Lower-cased search fields per row (for name_spotter; decoded once per file)."""
+        if self._texts is None:
+            self._texts = [self._search_texts(i) for i in range(self.row_count)]
+        return self._texts
+
+    def find_guest_and_family(self, keyword: str) -> Dict[str, Any]:
+        return guest_index.bundle_families(self, keyword)
+
+
+class SharedGuestIndex:
+    """
+    Per-process holder of the mapped snapshot. Every REFRESH_SECONDS it remaps the
+    file if it was replaced; the process holding the lock file also refreshes
+    the guest list from its source and rewrites the file when the version changed.
+    """
+
+    def __init__(self, path: str = GUEST_SNAPSHOT_PATH, refresh_seconds: float = guest_index.REFRESH_SECONDS):
+        self.path = path
+        self.refresh_seconds = refresh_seconds
+        self._snapshot: Optional[GuestSnapshot] = None
+        self._checked_at = 0.0
+        self._lock = threading.Lock()
+        self._source: Optional[guest_index.GuestSearchIndex] = None  # Set while this process builds
+        self._lock_file = None
+        self.writes = 0
+        self.remaps = 0
+
+    def _claim_builder(self) -> bool:
+        if self._source is not None:
+            return True
+        if fcntl is not None:
+            folder = os.path.dirname(self.path)
+            if folder:
+                os.makedirs(folder, exist_ok=True)
+            lock_file = open(f"{self.path}.lock", "a")
+            try:
+                fcntl.flock(lock_file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+            except OSError:
+                lock_file.close()
+                return False  # Another worker builds
+            self._lock_file = lock_file  # Held for the life of the process
+        # Without fcntl every process rebuilds; the rename keeps that safe.
+        self._source = guest_index.GuestSearchIndex(refresh_seconds=0)
+        print(f"[guest_snapshot] this process (pid {os.getpid()}) maintains {self.path}")
+        return True
+
+    def _remap(self) -> None:
+        try:
+            st = os.stat(self.path)
+        except FileNotFoundError:
+            return
+        current = self._snapshot
+        if current is not None and current.file_key == (st.st_ino, st.st_mtime_ns, st.st_size):
+            return
+        self._snapshot = GuestSnapshot(self.path)  # Old maps are released once unreferenced
+        self.remaps += 1
+        if DEBUG_VERBOSE:
+            print(f"[guest_snapshot][map] rows={self._snapshot.row_count} bytes={self._snapshot.size} "
+                  f"version={self._snapshot.version}")
+
+    def refresh(self) -> None:
+        self._checked_at = time.monotonic()
+        self._remap()
+        if not self._claim_builder():
+            if self._snapshot is None:
+                # Starting together with the builder: give it time to write the first file.
+                deadline = time.monotonic() + FIRST_MAP_WAIT_SECONDS
+                while self._snapshot is None and time.monotonic() < deadline:
+                    time.sleep(0.1)
+                    self._remap()
+            return
+        source = self._source.snapshot()
+        current = self._snapshot
+        if current is None or current.version != source.version:
+            size = write(self.path, source.source, source.version)
+            self.writes += 1
+            if DEBUG_VERBOSE:
+                print(f"[guest_snapshot][write] rows={len(source.rows)} bytes={size} version={source.version}")
+            self._remap()
+
+    def snapshot(self) -> GuestSnapshot:
+        """Return the mapped snapshot, building or remapping it when due."""
+        if self._snapshot is None:
+            with self._lock:
+                if self._snapshot is None and time.monotonic() - self._checked_at >= min(self.refresh_seconds, 1.0):
+                    self.refresh()
+            if self._snapshot is None:
+                raise RuntimeError(f"guest snapshot {self.path} not available yet")
+            return self._snapshot
+
+        if time.monotonic() - self._checked_at >= self.refresh_seconds:
+            # Only one thread checks; the rest keep the current map.
+            if self._lock.acquire(blocking=False):
+                try:
+                    self.refresh()
+                except Exception as e:
+                    self._checked_at = time.monotonic()
+                    print(f"[guest_snapshot][refresh-error] {type(e).__name__}: {e} (serving stale snapshot)")
+                finally:
+                    self._lock.release()
+        return self._snapshot
+
+    def find_guest_and_family(self, keyword: str) -> Dict[str, Any]:
+        return self.snapshot().find_guest_and_family(keyword)
+
+    def stats(self) -> Dict[str, Any]:
+        current = self._snapshot
+        return {
+            "loaded": current is not None,
+            "rows": current.row_count if current else 0,
+            "bytes": current.size if current else 0,
+            "version": current.version if current else None,
+            "loaded_at": current.loaded_at if current else None,
+            "builder": self._source is not None,
+            "writes": self.writes,
+            "remaps": self.remaps,
+        }
+
+
+_index = SharedGuestIndex()
+
+
+def get_index() -> SharedGuestIndex:
+    return _index
+
+
+def find_guest_and_family(keyword: str) -> Dict[str, Any]:
+    """
+    Same contract as queries.find_guest_and_family(), served from the mapped file.
+    Falls back to the SQL path if the snapshot cannot be loaded.
+    """
+    try:
+        return _index.find_guest_and_family(keyword)
+    except Exception as e:
+        print(f"[guest_snapshot][fallback] {type(e).__name__}: {e} → SQL lookup")
+        return queries.find_guest_and_family_single(keyword)
+
+
+if __name__ == "__main__":
+    while True:
+        keyword = input("Input Name:").strip()
+        if keyword.lower() in {"exit", "quit", "q"}:
+            print("--- End ---")
+            break
+        t0 = time.perf_counter()
+        bundles = find_guest_and_family(keyword)
+        elapsed_us = (time.perf_counter() - t0) * 1_000_000
+        print(f"\n Snapshot result ({elapsed_us:.0f} µs):\n", bundles)
+        print("\n SQL result:\n", queries.find_guest_and_family_single(keyword))
+        print("\n Snapshot stats:", _index.stats())
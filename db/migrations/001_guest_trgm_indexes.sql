@@ -0,0 +1,9 @@
+-- db/migrations/001_guest_trgm_indexes.sql
+-- Substring search (ILIKE '%kw%') cannot use the plain b-tree indexes in schema.sql.
+-- pg_trgm GIN indexes can, and also enable similarity() ranking.
+
+CREATE EXTENSION IF NOT EXISTS pg_trgm;
+
+CREATE INDEX IF NOT EXISTS idx_guests_name_trgm ON guests USING GIN (name gin_trgm_ops);
+CREATE INDEX IF NOT EXISTS idx_guests_alias_trgm ON guests USING GIN (alias gin_trgm_ops);
+CREATE INDEX IF NOT EXISTS idx_guests_display_name_trgm ON guests USING GIN (display_name gin_trgm_ops);
@@ -0,0 +1,22 @@
+-- db/migrations/002_guest_data_version.sql
+-- Guest data version + change log, written by tools/guest_loader.py.
+-- guest_index probes the single version row instead of hashing the whole guests
+-- table, and reloads only the guest_codes logged since the version it holds.
+
+CREATE TABLE IF NOT EXISTS guest_data_version (
+    id BOOLEAN PRIMARY KEY DEFAULT TRUE CHECK (id),  -- Single row
+    version BIGINT NOT NULL DEFAULT 0,
+    updated_at TIMESTAMPTZ NOT NULL DEFAULT NOW()
+);
+INSERT INTO guest_data_version (id, version) VALUES (TRUE, 0) ON CONFLICT (id) DO NOTHING;
+
+-- One row per changed guest per version; op 'reload' (guest_code NULL) means
+-- the whole table was replaced.
+CREATE TABLE IF NOT EXISTS guest_changes (
+    id BIGSERIAL PRIMARY KEY,
+    version BIGINT NOT NULL,
+    guest_code VARCHAR(10),
+    op VARCHAR(10) NOT NULL CHECK (op IN ('insert', 'update', 'delete', 'reload')),
+    changed_at TIMESTAMPTZ NOT NULL DEFAULT NOW()
+);
+CREATE INDEX IF NOT EXISTS idx_guest_changes_version ON guest_changes(version);
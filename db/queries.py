@@ -1,5 +1,7 @@
 # db/queries.py
 
+import os
+
 from db.db_connection import run_query
 
 # Maximum number of families allowed before treating as ambiguous.
@@ -8,8 +10,17 @@ FAMILY_AMBIGUITY_THRESHOLD = 1
 # Performance protection: if raw matched rows exceed this cap ask user to refine.
 ROW_HARD_CAP = 30
 
+# "ilike" (default) or "trgm": rank matches by pg_trgm similarity().
+# trgm needs db/migrations/001_guest_trgm_indexes.sql.
+GUEST_MATCH_MODE = os.getenv("GUEST_MATCH_MODE", "ilike").lower()
+
+def like_pattern(keyword: str) -> str:
+    """ILIKE pattern matching keyword as a plain substring (% and _ are not wildcards)."""
+    escaped = keyword.replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_")
+    return f"%{escaped}%"
+
 def find_self_rows(keyword: str):
-    q = f"%{keyword}%"
+    q = like_pattern(keyword)
     sql = """
     SELECT guest_code,
            COALESCE(display_name, name, alias) AS show_name,
@@ -22,6 +33,28 @@ def find_self_rows(keyword: str):
     """
     return run_query(sql, (q, q, q))
 
+def find_self_rows_ranked(keyword: str):
+    """
+    Same matches as find_self_rows(), ordered by pg_trgm similarity() so the
+    closest names come first. Reads at most ROW_HARD_CAP + 1 rows, enough to
+    tell whether the cap was exceeded.
+    """
+    q = like_pattern(keyword)
+    sql = """
+    SELECT guest_code,
+           COALESCE(display_name, name, alias) AS show_name,
+           seat_number,
+           group_code,
+           relation_role,
+           representative,
+           GREATEST(similarity(name, %s), similarity(alias, %s), similarity(display_name, %s)) AS score
+    FROM guests
+    WHERE (name ILIKE %s OR alias ILIKE %s OR display_name ILIKE %s) AND attending = TRUE
+    ORDER BY score DESC, guest_code
+    LIMIT %s
+    """
+    return run_query(sql, (keyword, keyword, keyword, q, q, q, ROW_HARD_CAP + 1))
+
 def find_family_by_guest_code(guest_code: str):
     sql = """
     SELECT guest_code,
@@ -31,21 +64,15 @@ def find_family_by_guest_code(guest_code: str):
            relation_role
     FROM guests
     WHERE (representative = %s OR guest_code = %s) AND attending = TRUE
-    ORDER BY relation_role
+    ORDER BY relation_role, guest_code
     """
     return run_query(sql, (guest_code, guest_code))
 
-def find_guest_and_family(keyword: str):
-    if not keyword or len(keyword) < 2 or len(keyword)>20:
-        return {"status": "too_short", "data":[]}
-    
-    self_rows = find_self_rows(keyword)
-    if not self_rows:
-        return {"status": "not_found", "data":[]}
-    
-    if len(self_rows) > ROW_HARD_CAP:
-        return {"status": "too_many", "data": []}
-    
+def resolve_anchors(self_rows) -> list:
+    """
+    Map matched rows to their family anchors (the representative guest_code),
+    keeping first-seen order and dropping duplicates.
+    """
     anchors = []
     seen = set()
     for r in self_rows:
@@ -60,6 +87,23 @@ def find_guest_and_family(keyword: str):
 
         seen.add(anchor) # Record data to avoid duplicate processing
         anchors.append(anchor)
+    return anchors
+
+def find_guest_and_family(keyword: str):
+    if not keyword or len(keyword) < 2 or len(keyword)>20:
+        return {"status": "too_short", "data":[]}
+    
+    if GUEST_MATCH_MODE == "trgm":
+        self_rows = find_self_rows_ranked(keyword)
+    else:
+        self_rows = find_self_rows(keyword)
+    if not self_rows:
+        return {"status": "not_found", "data":[]}
+    
+    if len(self_rows) > ROW_HARD_CAP:
+        return {"status": "too_many", "data": []}
+    
+    anchors = resolve_anchors(self_rows)
     
     # Determine the number of families 
     if len(anchors) > FAMILY_AMBIGUITY_THRESHOLD:
@@ -74,6 +118,100 @@ def find_guest_and_family(keyword: str):
 
     return {"status": "ok", "data": result}
 
+# Single round trip: match, resolve anchors, apply the ambiguity threshold and
+# row cap, then return the family bundle. One row per family member, plus the
+# counters (row_count / anchor_count) so the status can be decided in Python.
+# Families come out best match first: in trgm mode by the highest similarity()
+# of their matched members, in ilike mode (score 0) by anchor.
+_FAMILY_BUNDLE_TEMPLATE = """
+WITH matched AS (
+    SELECT guest_code, relation_role, representative, {score} AS score
+    FROM guests
+    WHERE (name ILIKE %(q)s OR alias ILIKE %(q)s OR display_name ILIKE %(q)s) AND attending = TRUE
+),
+anchors AS (
+    SELECT CASE WHEN relation_role = 'self' THEN guest_code
+                ELSE COALESCE(NULLIF(representative, ''), guest_code)
+           END AS anchor,
+           MAX(score) AS score
+    FROM matched
+    GROUP BY 1
+),
+stats AS (
+    SELECT (SELECT COUNT(*) FROM matched) AS row_count,
+           (SELECT COUNT(*) FROM anchors) AS anchor_count
+),
+family AS (
+    SELECT a.anchor,
+           a.score,
+           g.guest_code,
+           COALESCE(g.display_name, g.name, g.alias) AS show_name,
+           g.seat_number,
+           g.group_code,
+           g.relation_role
+    FROM stats s
+    JOIN anchors a ON s.row_count <= %(row_cap)s AND s.anchor_count <= %(family_cap)s
+    JOIN guests g ON (g.representative = a.anchor OR g.guest_code = a.anchor) AND g.attending = TRUE
+)
+SELECT s.row_count, s.anchor_count,
+       f.anchor, f.guest_code, f.show_name, f.seat_number, f.group_code, f.relation_role
+FROM stats s
+LEFT JOIN family f ON TRUE
+ORDER BY f.score DESC, f.anchor, f.relation_role, f.guest_code
+"""
+
+_TRGM_SCORE = ("GREATEST(similarity(name, %(keyword)s), similarity(alias, %(keyword)s), "
+               "similarity(display_name, %(keyword)s))")
+
+FAMILY_BUNDLE_SQL = _FAMILY_BUNDLE_TEMPLATE.format(
+    score=_TRGM_SCORE if GUEST_MATCH_MODE == "trgm" else "0"
+)
+
+def family_bundle_params(keyword: str) -> dict:
+    """Parameters of FAMILY_BUNDLE_SQL for one keyword."""
+    return {
+        "q": like_pattern(keyword),
+        "keyword": keyword,
+        "row_cap": ROW_HARD_CAP,
+        "family_cap": FAMILY_AMBIGUITY_THRESHOLD,
+    }
+
+def find_guest_and_family_single(keyword: str):
+    """
+    Same payload as find_guest_and_family(), but in a single statement
+    instead of one query for the matches plus one per anchor.
+    """
+    if not keyword or len(keyword) < 2 or len(keyword)>20:
+        return {"status": "too_short", "data":[]}
+
+    rows = run_query(FAMILY_BUNDLE_SQL, family_bundle_params(keyword))
+    head = rows[0]
+    if head["row_count"] == 0:
+        return {"status": "not_found", "data":[]}
+
+    if head["row_count"] > ROW_HARD_CAP or head["anchor_count"] > FAMILY_AMBIGUITY_THRESHOLD:
+        return {"status": "too_many", "data": []}
+
+    families = {}
+    for r in rows:
+        if r["anchor"] is None:
+            continue
+        families.setdefault(r["anchor"], []).append({
+            "guest_code": r["guest_code"],
+            "show_name": r["show_name"],
+            "seat_number": r["seat_number"],
+            "group_code": r["group_code"],
+            "relation_role": r["relation_role"],
+        })
+
+    result = []
+    for family in families.values():
+        who = next((m["show_name"] for m in family if m["relation_role"] == "self"),
+                   family[0]["show_name"] if family else " (未知代表人) ") # Screen out representatives
+        result.append({"who": who, "family": family})
+
+    return {"status": "ok", "data": result}
+
 if __name__ == "__main__":
     while True:
         keyword = input("Input Name:").strip()
@@ -87,18 +225,7 @@ if __name__ == "__main__":
         self_rows = find_self_rows(keyword)
         print(f"self_rows ({len(self_rows)})", self_rows)
 
-        anchors = []
-        seen = set()
-        for r in self_rows:
-            # Find anchor
-            if r["relation_role"] == "self":
-                anchor = r["guest_code"]
-            else:
-                anchor = r.get("representative") or r["guest_code"]
-
-            if anchor not in seen:
-                seen.add(anchor)
-                anchors.append(anchor)
+        anchors = resolve_anchors(self_rows)
         print(f"\n anchors ({len(anchors)}):", anchors)
 
     
@@ -0,0 +1,184 @@
+# dead_letters.py
+
+import glob
+import json
+import os
+import threading
+import time
+import uuid
+from datetime import datetime, timezone
+from typing import Any, Dict, Iterator, List, Optional, Set
+
+# Replayable dead-letter store.
+# Pushes that still fail after retries are appended here (one JSON per line) with
+# the real recipient, so tools/replay_dead_letters.py can redeliver them later.
+# Every record carries a stable message id, which is also the X-Line-Retry-Key
+# used for the original push, so LINE itself rejects a replay of a message that
+# did get through (409).
+#
+# The files hold LINE user IDs: they are created owner-read/write only (0600)
+# and must never be committed or shared. Logs keep using masked IDs.
+
+DEBUG_VERBOSE = os.getenv("DEBUG_VERBOSE", "false").lower() == "true"
+
+def _get_num_env(var_name: str, default, cast=int):
+    try:
+        return cast(os.getenv(var_name, default))
+    except ValueError:
+        print(f"[Error] Invalid value for {var_name}, fallback to {default}")
+        return default
+
+DEAD_LETTER_PATH = os.getenv("DEAD_LETTER_PATH", "instance/dead_letters.jsonl")
+# Rotate the active file when it grows past this size or gets this old.
+DEAD_LETTER_MAX_BYTES = _get_num_env("DEAD_LETTER_MAX_BYTES", 1_000_000)
+DEAD_LETTER_ROTATE_SECONDS = _get_num_env("DEAD_LETTER_ROTATE_SECONDS", 86400.0, float)
+# Rotated files kept; older ones are deleted once every record in them was replayed.
+DEAD_LETTER_KEEP_FILES = _get_num_env("DEAD_LETTER_KEEP_FILES", 14)
+
+FILE_MODE = 0o600
+
+def new_message_id() -> str:
+    """Stable id for one outgoing message (UUID, valid as X-Line-Retry-Key)."""
+    return str(uuid.uuid4())
+
+def is_replayable(rec: Dict[str, Any]) -> bool:
+    """Old-format records (masked recipient, no id) cannot be redelivered."""
+    return bool(rec.get("id")) and "***" not in (rec.get("user_id") or "")
+
+class DeadLetterStore:
+    """
+    Append-only JSONL file with size/time rotation and a ledger of redelivered ids.
+    Rotated files are named <stem>-<UTC timestamp>.jsonl next to the active one.
+    """
+
+    def __init__(self, path: str = DEAD_LETTER_PATH):
+        self.path = path
+        stem, ext = os.path.splitext(path)
+        self._rotated_glob = f"{stem}-*{ext}"
+        self._rotated_fmt = f"{stem}-{{stamp}}{ext}"
+        self.sent_path = f"{stem}.sent"
+        self._lock = threading.Lock()
+        self._file = None
+        self._opened_at = 0.0
+        self.written = 0
+
+    # --- writing ---
+
+    def _open(self):
+        folder = os.path.dirname(self.path)
+        if folder:
+            os.makedirs(folder, exist_ok=True)
+        fd = os.open(self.path, os.O_WRONLY | os.O_CREAT | os.O_APPEND, FILE_MODE)
+        self._file = os.fdopen(fd, "a", encoding="utf-8")
+        st = os.fstat(fd)
+        # Age of the file, not of this process, decides time-based rotation.
+        self._opened_at = st.st_mtime if st.st_size else time.time()
+
+    def _should_rotate(self) -> bool:
+        if self._file.tell() >= DEAD_LETTER_MAX_BYTES:
+            return True
+        return self._file.tell() > 0 and time.time() - self._opened_at >= DEAD_LETTER_ROTATE_SECONDS
+
+    def _rotate(self) -> None:
+        self._file.close()
+        self._file = None
+        stamp = datetime.now(timezone.utc).strftime("%Y%m%dT%H%M%S%f")
+        os.replace(self.path, self._rotated_fmt.format(stamp=stamp))
+        expired = self.rotated_files()[:-DEAD_LETTER_KEEP_FILES or None]
+        sent = self.sent_ids() if expired else set()
+        for old in expired:
+            # A file past the keep limit may still hold the only copy of messages
+            # that were never redelivered (e.g. a long LINE outage): keep it.
+            unsent = sum(1 for rec in self._read(old) if is_replayable(rec) and rec["id"] not in sent)
+            if unsent:
+                print(f"[dead-letter][WARN] not deleting {old}: {unsent} record(s) never replayed, "
+                      f"run tools/replay_dead_letters.py")
+                continue
+            try:
+                os.remove(old)
+            except OSError:
+                pass
+        self._open()
+
+    def write(self, message_id: str, to_user_id: str, text: str, error_message: str,
+              messages: Optional[List[Dict[str, Any]]] = None) -> None:
+        """`messages` is the full bundle (LINE message dicts); `text` its readable text."""
+        rec = {
+            "id": message_id,
+            "ts": datetime.now(timezone.utc).isoformat(),  # timezone-aware UTC
+            "user_id": to_user_id,
+            "text": text,
+            "error": error_message,
+        }
+        if messages:
+            rec["messages"] = messages
+        line = json.dumps(rec, ensure_ascii=False) + "\n"
+        with self._lock:
+            if self._file is None:
+                self._open()
+            elif self._should_rotate():
+                self._rotate()
+            self._file.write(line)
+            self._file.flush()
+            self.written += 1
+
+    def close(self) -> None:
+        with self._lock:
+            if self._file is not None:
+                self._file.close()
+                self._file = None
+
+    # --- reading / replay ---
+
+    def rotated_files(self) -> List[str]:
+        return sorted(glob.glob(self._rotated_glob))
+
+    def files(self) -> List[str]:
+        """All dead-letter files, oldest first."""
+        active = [self.path] if os.path.exists(self.path) else []
+        return self.rotated_files() + active
+
+    def records(self) -> Iterator[Dict[str, Any]]:
+        for path in self.files():
+            yield from self._read(path)
+
+    def _read(self, path: str) -> Iterator[Dict[str, Any]]:
+        with open(path, "r", encoding="utf-8") as f:
+            for n, line in enumerate(f, 1):
+                line = line.strip()
+                if not line:
+                    continue
+                try:
+                    rec = json.loads(line)
+                except ValueError:
+                    print(f"[dead-letter] skip bad line {path}:{n}")
+                    continue
+                rec.setdefault("id", None)
+                rec["_file"] = path
+                yield rec
+
+    def sent_ids(self) -> Set[str]:
+        try:
+            with open(self.sent_path, "r", encoding="utf-8") as f:
+                return {line.strip() for line in f if line.strip()}
+        except FileNotFoundError:
+            return set()
+
+    def mark_sent(self, message_id: str) -> None:
+        folder = os.path.dirname(self.sent_path)
+        if folder:
+            os.makedirs(folder, exist_ok=True)
+        fd = os.open(self.sent_path, os.O_WRONLY | os.O_CREAT | os.O_APPEND, FILE_MODE)
+        with os.fdopen(fd, "a", encoding="utf-8") as f:
+            f.write(message_id + "\n")
+
+_store: Optional[DeadLetterStore] = None
+_store_lock = threading.Lock()
+
+def get_store() -> DeadLetterStore:
+    global _store
+    if _store is None:
+        with _store_lock:
+            if _store is None:
+                _store = DeadLetterStore()
+    return _store
@@ -0,0 +1,191 @@
+# faq_router.py
+
+import os
+import re
+import threading
+from typing import Any, Dict, List, Optional
+
+from answer_cache import normalize_question
+from data_provider import get_wedding_context
+
+# Deterministic FAQ fast path.
+# Builds a keyword/synonym index over the section_title/details blocks and answers
+# high-confidence questions straight from the data, without calling OpenAI.
+# Anything it is not sure about falls through to ai_core.get_ai_reply().
+
+FAQ_ENABLED = os.getenv("FAQ_ENABLED", "true").lower() == "true"
+
+try:
+    FAQ_MIN_SCORE = int(os.getenv("FAQ_MIN_SCORE", "2"))
+except ValueError:
+    print("[Error] Invalid value for FAQ_MIN_SCORE, fallback to 2")
+    FAQ_MIN_SCORE = 2
+
+# Longer questions are usually more than a lookup, leave them to the AI.
+FAQ_MAX_QUESTION_LENGTH = 24
+
+# concept -> phrases that mention it, in questions or in labels/section titles.
+# Phrases are normalized the same way as questions (see normalize_question).
+SYNONYMS = {
+    "time": ["時間", "幾點", "幾時", "什麼時候", "何時", "時段", "流程"],
+    "start": ["開始", "開席", "幾點吃", "上菜"],
+    "reception": ["迎賓", "接待", "報到", "簽到", "收禮"],
+    "banquet": ["宴會", "宴客", "喜宴", "午宴", "晚宴", "開席", "吃飯", "用餐"],
+    "date": ["日期", "哪天", "哪一天", "幾號", "幾月", "星期", "禮拜"],
+    "place": ["地點", "地址", "在哪", "哪裡", "場地", "會場", "餐廳", "飯店", "怎麼去", "怎麼走"],
+    "ceremony": ["儀式", "證婚", "典禮"],
+    "officiant": ["證婚人"],
+    "groom": ["新郎"],
+    "bride": ["新娘"],
+    "parking": ["停車", "車位", "開車"],
+    "transport": ["交通", "捷運", "公車", "接駁", "高鐵", "火車", "計程車"],
+    "dress": ["服裝", "穿著", "穿什麼", "dresscode", "衣著"],
+    "gift": ["禮金", "紅包", "禮物"],
+    "kids": ["小孩", "兒童", "小朋友", "嬰兒", "寶寶"],
+    "food": ["素食", "吃素", "過敏", "菜色", "餐點"],
+    "contact": ["聯絡", "電話", "聯繫", "負責人"],
+    "wifi": ["wifi", "網路", "密碼"],
+}
+
+# Which end of an event the question is about. A question using one of these
+# is only answered when the matched label or value uses the same direction:
+# "宴會幾點結束" must not get the start time, "開始前可以進場嗎" is not a time.
+DIRECTIONS = {
+    "start": ["開始", "開席", "入場", "進場"],
+    "end": ["結束", "散場", "散會"],
+    "before": ["之前", "以前", "提前", "提早", "前可以", "前先"],
+    "after": ["之後", "以後", "後可以", "後再"],
+}
+
+def _normalize_phrases(table: Dict[str, List[str]]) -> Dict[str, List[str]]:
+    return {concept: [normalize_question(p) for p in phrases] for concept, phrases in table.items()}
+
+_NORMALIZED_SYNONYMS = _normalize_phrases(SYNONYMS)
+_NORMALIZED_DIRECTIONS = _normalize_phrases(DIRECTIONS)
+
+def _concepts(text: str, table: Dict[str, List[str]] = _NORMALIZED_SYNONYMS) -> set:
+    return {c for c, phrases in table.items() if any(p and p in text for p in phrases)}
+
+def _clean_title(title: str) -> str:
+    # "# 證婚儀式 (可選)" -> "證婚儀式"
+    title = re.sub(r"[\(（].*?[\)）]", "", title or "")
+    return title.replace("#", "").strip()
+
+class FaqIndex:
+    """Index over one version of the wedding data blocks."""
+
+    def __init__(self, blocks: List[Dict[str, Any]]):
+        self.entries = []
+        for section in blocks or []:
+            details = section.get("details") or {}
+            if not isinstance(details, dict):
+                continue
+            title = _clean_title(section.get("section_title", ""))
+            norm_title = normalize_question(title)
+            for label, value in details.items():
+                if value in (None, ""):
+                    continue
+                norm_label = normalize_question(str(label))
+                self.entries.append({
+                    "section": title,
+                    "label": str(label),
+                    "value": str(value),
+                    "norm_label": norm_label,
+                    "norm_section": norm_title,
+                    "directions": _concepts(norm_label + normalize_question(str(value)), _NORMALIZED_DIRECTIONS),
+                    "concepts": _concepts(norm_label) | _concepts(norm_title),
+                    "label_concepts": _concepts(norm_label),
+                })
+
+    def match(self, question: str) -> Optional[Dict[str, Any]]:
+        """
+        Return {"entries", "score"} for a high-confidence match, else None.
+        High confidence means:
+        - the best entry scores at least FAQ_MIN_SCORE
+        - every concept the question asks about is covered by the answer
+        - every direction (start / end / before / after) the question uses
+          appears in each matched label or value
+        """
+        q = normalize_question(question)
+        if not q or len(q) > FAQ_MAX_QUESTION_LENGTH or not self.entries:
+            return None
+        q_concepts = _concepts(q)
+
+        scored = []
+        for e in self.entries:
+            score = 0
+            if e["norm_label"] and e["norm_label"] in q:
+                score += 2  # Label mentioned verbatim, e.g. "地點"
+            if e["norm_section"] and e["norm_section"] in q:
+                score += 1
+            score += len(q_concepts & e["concepts"])
+            if score:
+                scored.append((score, e))
+        if not scored:
+            return None
+
+        best = max(s for s, _ in scored)
+        if best < FAQ_MIN_SCORE:
+            return None
+        top = [e for s, e in scored if s == best]
+
+        covered = set().union(*(e["concepts"] for e in top))
+        if not q_concepts or not q_concepts <= covered:
+            return None
+        # Ties across unrelated labels ("幾點" vs every time entry) are only fine
+        # when they come from the same section, e.g. the whole timeline.
+        if len({e["section"] for e in top}) > 1:
+            return None
+        q_directions = _concepts(q, _NORMALIZED_DIRECTIONS)
+        if any(not q_directions <= e["directions"] for e in top):
+            return None
+
+        return {"entries": top, "score": best}
+
+    def answer(self, question: str) -> Optional[str]:
+        hit = self.match(question)
+        if hit is None:
+            return None
+        entries = hit["entries"]
+        if len(entries) == 1:
+            e = entries[0]
+            return f"您好～{e['label']}是：{e['value']}\n期待您的蒞臨！"
+        lines = [f"您好～{entries[0]['section']}如下：", ""]
+        lines += [f"- {e['label']}：{e['value']}" for e in entries]
+        lines += ["", "期待您的蒞臨！"]
+        return "\n".join(lines)
+
+_index: Dict[str, Any] = {"hash": None, "index": None}
+_lock = threading.Lock()
+_stats = {"answered": 0, "fallthrough": 0}
+
+def get_index() -> FaqIndex:
+    """FAQ index for the current wedding context, rebuilt when its hash changes."""
+    global _index
+    context = get_wedding_context()
+    current = _index
+    if current["hash"] == context["hash"]:
+        return current["index"]
+    with _lock:
+        if _index["hash"] != context["hash"]:
+            _index = {"hash": context["hash"], "index": FaqIndex(context["blocks"])}
+        return _index["index"]
+
+def answer(question: str) -> Optional[str]:
+    """Answer from the wedding data, or None to fall through to the AI."""
+    if not FAQ_ENABLED:
+        return None
+    reply = get_index().answer(question)
+    _stats["answered" if reply else "fallthrough"] += 1
+    return reply
+
+def get_stats() -> Dict[str, int]:
+    return dict(_stats)
+
+if __name__ == "__main__":
+    while True:
+        q = input("Question:")
+        if q.lower() in {"exit", "quit", "q"}:
+            break
+        print(get_index().match(q))
+        print(answer(q) or "(fall through to AI)")
@@ -2,18 +2,45 @@
 
 import re
 
+import name_spotter
+
+SEAT_CHARS = ["座","位","桌","找", "坐"]
+
+# What may follow a bare name ("王小明呢？") and still read as a seat lookup.
+NAME_PARTICLES = "嗎吗呢吧啊呀耶喔哦欸啦"
+
+def _is_bare_name(text: str, names: list[str]) -> bool:
+    # A bare name ("王小明", "王小明？") reads as a seat lookup; a question that
+    # merely mentions someone ("王小明幾點到") does not, however short it is.
+    rest = text
+    for name in sorted(names, key=len, reverse=True):
+        rest = rest.replace(name, "")
+    rest = re.sub(r"[^\w\u4e00-\u9fff]|_", "", rest)
+    return all(ch in NAME_PARTICLES for ch in rest)
+
 def classify_intents(text: str) -> list[str]:
     """
     Return list of intents.
-    Currently only distinguish seat lookup.
+    Currently only distinguish seat lookup: seat wording, or a message that is
+    (mostly) a guest's name.
     """
     intents = []
-    if any(k in text for k in ["座","位","桌","找", "坐"]):
+    if any(k in text for k in SEAT_CHARS):
         intents.append("seat_lookup")
+    else:
+        names = name_spotter.spot(text)
+        if names and _is_bare_name(text, names):
+            intents.append("seat_lookup")
 
     return intents
 
 def extract_keyword(text: str) -> str:
+    # Guest names found verbatim win: stripping the phrases below would mangle
+    # names that contain them (e.g. 張立位, 黃找財).
+    names = name_spotter.spot(text)
+    if names:
+        return max(names, key=len)
+
     phrases = [
         r"我要找", r"幫我找", r"請幫我找", r"找一下", r"查一下", r"查詢", r"查",
         r"請問", r"問", r"麻煩", r"謝謝",
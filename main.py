@@ -1,15 +1,17 @@
 # main.py
 
 # --- Section 1: Core Library Imports  ---
+import asyncio
+import math
 import os
+import re
+import secrets
 import time
-import json
-from datetime import datetime, timezone
-from typing import Any, Optional
+from typing import Any, List, Optional, Union
 
 import uvicorn
-from fastapi import FastAPI, Request, HTTPException, BackgroundTasks
-from fastapi.staticfiles import StaticFiles
+from fastapi import FastAPI, Request, HTTPException
+from fastapi.responses import PlainTextResponse
 from dotenv import load_dotenv
 # Import necessary components from the line-bot-sdk. 
 from linebot.v3 import WebhookParser
@@ -18,6 +20,10 @@ from linebot.v3.messaging import (
     Configuration,
     ApiException,
     ApiClient,
+    ImageMessage,
+    Message,
+    AsyncApiClient,
+    AsyncMessagingApi,
     MessagingApi,
     TextMessage,
     PushMessageRequest,
@@ -26,7 +32,21 @@ from linebot.v3.messaging import (
 from linebot.v3.webhooks import MessageEvent, TextMessageContent
 
 # Local application imports
-from bot_core import handle_message
+from bot_core import GUEST_SEARCH_MODE, estimate_route, handle_message, handle_message_async
+from ai_core import get_singleflight_stats
+from db import guest_index, guest_snapshot
+from db.db_connection import close_pool, get_pool_stats
+import answer_cache
+import faq_router
+import name_spotter
+from outbox import Outbox, WorkerPool
+import dead_letters
+import metrics
+import profiler
+import rate_limit
+import seatmap
+import static_assets
+import webhook_dedup
 
 # Load environment variables for local development.
 # On platforms like Render or Heroku, this is automatically handled.
@@ -41,7 +61,8 @@ app = FastAPI()
 static_dir = os.path.join(os.path.dirname(__file__), "static")
 if not os.path.exists(static_dir):
     os.makedirs(static_dir, exist_ok=True)
-app.mount("/static", StaticFiles(directory="static"), name="static")
+# Long-lived Cache-Control for fingerprinted files (static_assets.py), ETag/304 for all.
+app.mount("/static", static_assets.CachedStaticFiles(directory="static"), name="static")
 
 # Retrieve credentials from environment variables.
 channel_secret = os.getenv('LINE_CHANNEL_SECRET')
@@ -53,59 +74,187 @@ if not channel_secret or not channel_access_token:
     raise SystemExit(1)
 DEBUG_VERBOSE = os.getenv("DEBUG_VERBOSE", "false").lower() == "true"
 
+# "async": background work runs on the event loop (AsyncOpenAI, async LINE client,
+#          asyncio.sleep backoff), so waiting on I/O does not hold a worker thread.
+# "sync":  background work runs in the threadpool with the blocking clients.
+EXECUTION_MODE = os.getenv("EXECUTION_MODE", "async").lower()
+
+# Reply tokens are only usable for a short time after the event (about a minute);
+# past this many seconds the worker skips the reply attempt and pushes directly.
+try:
+    REPLY_TOKEN_TTL_SECONDS = float(os.getenv("REPLY_TOKEN_TTL_SECONDS", "50"))
+except ValueError:
+    print("[Error] Invalid value for REPLY_TOKEN_TTL_SECONDS, fallback to 50")
+    REPLY_TOKEN_TTL_SECONDS = 50.0
+
+# Cheap routes are answered before LLM work (see outbox scheduling).
+ROUTE_PRIORITY = {"seat": 0, "faq": 0, "cached": 0, "llm": 1}
+
+# Admin access: ADMIN_IDS (comma-separated LINE user IDs) may send chat commands
+# such as "/profile 0.1"; DEV_MODE_SECRET_CODE is the Bearer token for /admin/*.
+ADMIN_IDS = {u.strip() for u in os.getenv("ADMIN_IDS", "").split(",") if u.strip()}
+DEV_MODE_SECRET_CODE = os.getenv("DEV_MODE_SECRET_CODE", "")
+
 # Instantiate LINE Bot SDK core components
 # WebhookParser: For manually parsing and verifying
 parser = WebhookParser(channel_secret)
 # Configuration: Holds the Access Token used to authenticate API calls when sending messages.
-configuration = Configuration(access_token=channel_access_token)
+# LINE_API_HOST points the clients at another host (e.g. the stub server in bench/).
+configuration = Configuration(access_token=channel_access_token, host=os.getenv("LINE_API_HOST") or None)
 # Instantiate the main MessagingApi client for sending replies.
 line_bot_api = MessagingApi(ApiClient(configuration))
+# The async client owns an aiohttp session, so it is created lazily inside the event loop.
+_async_api_client: Optional[AsyncApiClient] = None
+_async_line_bot_api: Optional[AsyncMessagingApi] = None
+
+def _get_async_line_bot_api() -> AsyncMessagingApi:
+    global _async_api_client, _async_line_bot_api
+    if _async_line_bot_api is None:
+        _async_api_client = AsyncApiClient(configuration)
+        _async_line_bot_api = AsyncMessagingApi(_async_api_client)
+    return _async_line_bot_api
+
+FALLBACK_TEXT = "出了點狀況喔！請稍後再試～"
+
+# LINE accepts up to five messages per reply/push request.
+MAX_MESSAGES_PER_REQUEST = 5
+
+# When pushing fails, back off (Retry-After on 429, otherwise jittered 1s, 2s...)
+# then try again, otherwise writing into the dead-letter store for
+# tools/replay_dead_letters.py. Every call first waits for its rate_limit budget.
+
+def _mask(user_id: str) -> str:
+    """Mask a LINE user ID for logs."""
+    return f"{user_id[:5]}***{user_id[-3:]}"
+
+def _truncate(text: str) -> str:
+    # Limit LINE single message to ~5000 chars, conservatively truncate to avoid rejection.
+    return text if len(text) <= 4500 else (text[:4490] + "...(截斷)")
 
-# Failure message log
-DEAD_LETTER_PATH = "instance/dead_letters.jsonl"
+def _reply_token_invalid(e: Exception) -> bool:
+    return isinstance(e, ApiException) and e.status == 400 and bool(e.body) and "Invalid reply token" in e.body
 
-# When pushing fails, wait 1 or 2 seconds then try again,
-# otherwise writing into dead_letters.jsonl for retry in the future.
+def _log_reply_failure(e: Exception) -> None:
+    if isinstance(e, ApiException):
+        if DEBUG_VERBOSE:
+            print(f"[reply][api-error] status={e.status} body={e.body}")
+        if _reply_token_invalid(e):
+            print("[fallback] reply_token expired → push mode")
+        else:
+            print("[fallback] reply failed → push mode")
+    else:
+        print(f"[reply][conn-error] {type(e).__name__}: {e} → push mode")
+
+def _log_push_failure(e: Exception, attempt: int) -> None:
+    if not DEBUG_VERBOSE:
+        return
+    if isinstance(e, ApiException):
+        # When LINE API responds with an error (inspect http status/body for diagnostics).
+        print(
+            f"[push][api-error] status={getattr(e, 'status', None)} "
+            f"body={getattr(e, 'body',None)} try={attempt}"
+            )
+    else:
+        # Network-layer error (e.g. Connection reset by peer)
+        print(f"[push][conn-error] {type(e).__name__}: {e} try={attempt}")
+
+# How replies went out: "replied" made the reply-token deadline; the others were
+# pushed instead (reply failed, token expired while queued, or no token at all).
+_delivery_stats = {"replied": 0, "reply_failed": 0, "expired_in_queue": 0, "no_token": 0}
+
+def _count_delivery(outcome: str) -> None:
+    _delivery_stats[outcome] += 1
+    metrics.DELIVERIES.inc(outcome=outcome)
+
+def get_delivery_stats() -> dict:
+    stats = dict(_delivery_stats)
+    with_token = stats["replied"] + stats["reply_failed"] + stats["expired_in_queue"]
+    stats["deadline_hit_rate"] = round(stats["replied"] / with_token, 4) if with_token else 0.0
+    return stats
+
+def _as_messages(content: Union[str, List[Message]]) -> List[Message]:
+    """A plain string becomes one text message; text messages are truncated."""
+    messages = [TextMessage(text=content)] if isinstance(content, str) else list(content)
+    return [
+        TextMessage(text=_truncate(m.text)) if isinstance(m, TextMessage) else m
+        for m in messages[:MAX_MESSAGES_PER_REQUEST]
+    ]
+
+def _messages_text(messages: List[Message]) -> str:
+    return "\n".join(m.text for m in messages if isinstance(m, TextMessage))
+
+def _seat_map_link(url: str) -> TextMessage:
+    return TextMessage(text=f"📍座位圖請看這裡：{url}")
+
+def _text_only(messages: List[Message], e: BaseException) -> Optional[List[Message]]:
+    """
+    LINE rejects a whole request (4xx) when one image cannot be used; for a
+    bundle with images, the same bundle with each image turned into a link.
+    None when the error is not a rejection or there is no image to drop.
+    """
+    if rate_limit.error_status(e) is None or rate_limit.is_retryable(e):
+        return None
+    if not any(isinstance(m, ImageMessage) for m in messages):
+        return None
+    print(f"[line] bundle with images rejected (status={rate_limit.error_status(e)}) → text and link only")
+    return [_seat_map_link(m.original_content_url) if isinstance(m, ImageMessage) else m for m in messages]
+
+def _write_dead_letter(to_user_id: str, messages: List[Message], error_message: str, message_id: str) -> None:
+    """Still failing after retries than write a replayable dead-letter record."""
+    try:
+        store = dead_letters.get_store()
+        store.write(message_id, to_user_id, _messages_text(messages), error_message,
+                    messages=[m.to_dict() for m in messages])
+        metrics.DEAD_LETTERS.inc()
+        print(f"[push][dead-letter] saved id={message_id} user={_mask(to_user_id)} -> {store.path}")
+    except Exception as e:
+        if DEBUG_VERBOSE:
+            print(f"[push][dead-letter][fail] {e}")
 
-def _smart_send(user_id: str, reply_token: Optional[str], text:str) -> None:
+def _smart_send(user_id: str, reply_token: Optional[str], content: Union[str, List[Message]]) -> None:
     """
     Push-first hybrid messaging:
     - Try reply first (if token valid) to save quota.
     - Fallback to push if reply fails or token expired.
+    `content` is a text or a bundle of up to five messages, sent in one call either way.
     """
-    safe_text = text if len(text) <= 4500 else (text[:4490] + "...(截斷)")
+    messages = _as_messages(content)
     used_reply = False
 
-    if reply_token:
+    while reply_token and not used_reply:
         try:
-            line_bot_api.reply_message(
-                ReplyMessageRequest(
-                    reply_token=reply_token,
-                    messages=[TextMessage(text=safe_text)]
+            rate_limit.limiter("line_reply").acquire()
+            with metrics.STAGE_SECONDS.time(stage="line_reply"):
+                line_bot_api.reply_message(
+                    ReplyMessageRequest(
+                        reply_token=reply_token,
+                        messages=messages
+                    )
                 )
-            )
             used_reply = True
+            _count_delivery("replied")
             if DEBUG_VERBOSE:
-                print(f"[reply][ok] len={len(safe_text)} user={user_id[:5]}***{user_id[-3:]}")
-        except ApiException as e:
-            if DEBUG_VERBOSE:
-                print(f"[reply][api-error] status={e.status} body={e.body}")
-            if e.status == 400 and e.body and "Invalid reply token" in e.body:
-                print("[fallback] reply_token expired → push mode")
-            else:
-                print("[fallback] reply failed → push mode")
+                print(f"[reply][ok] messages={len(messages)} user={_mask(user_id)}")
         except Exception as e:
-            print(f"[reply][conn-error] {type(e).__name__}: {e} → push mode")
+            rate_limit.note_failure("line_reply", e)
+            text_only = None if _reply_token_invalid(e) else _text_only(messages, e)
+            if text_only:
+                messages = text_only  # A rejected request does not use up the token
+                continue
+            _count_delivery("reply_failed")
+            _log_reply_failure(e)
+            break
     
     if not used_reply:
-        _push_with_retry(user_id, safe_text)
+        _push_with_retry(user_id, messages)
         if DEBUG_VERBOSE:
-            print(f"[fallback][push][ok] user={user_id[:5]}***{user_id[-3:]}")
+            print(f"[fallback][push][ok] user={_mask(user_id)}")
 
 def _reply_safe(reply_token: str, text: str) -> None:
     """[Deprecated] Simple reply fallback. Use _smart_send() for normal flow."""
-    safe_text = text if len(text) <= 4500 else (text[:4490] + "...(截斷)")
+    safe_text = _truncate(text)
     try:
+        rate_limit.limiter("line_reply").acquire()
         line_bot_api.reply_message(
             ReplyMessageRequest(
                 reply_token=reply_token,
@@ -118,71 +267,266 @@ def _reply_safe(reply_token: str, text: str) -> None:
         if DEBUG_VERBOSE:
             print(f"[reply][api-error] {e}")
 
-def _push_with_retry(to_user_id: str, text: str, max_retries: int = 2) -> bool:
+def _push_with_retry(to_user_id: str, content: Union[str, List[Message]], max_retries: int = 2) -> bool:
     """
-    Send a text message to a LINE user with retry and dead-letter fallback.
+    Send a message bundle to a LINE user with retry and dead-letter fallback.
 
     :param to_user_id: The LINE user ID to send the message to.
-    :param text: Message content to be sent.
+    :param content: Message text, or a list of up to five messages sent in one push.
     :param max_retries: Maximum number of retries before writing to dead-letter.
     :return: True if message sent successfully; False otherwise.
     """
-
-    # Limit LINE single message to ~5000 chars, conservatively truncate to avoid rejection.
-    safe_text = text if len(text) <= 4500 else (text[:4490] + "...(截斷)")
+    messages = _as_messages(content)
+    error_message = "unknown"
+    # Same retry key on every attempt: LINE drops a retry of a push it already accepted.
+    message_id = dead_letters.new_message_id()
 
     for attempt in range(1, max_retries + 2):
+        retry_after = None
         try:
-            line_bot_api.push_message(
-                PushMessageRequest(
-                    to=to_user_id,
-                    messages=[TextMessage(text=safe_text)]
+            rate_limit.limiter("line_push").acquire()
+            with metrics.STAGE_SECONDS.time(stage="line_push"):
+                line_bot_api.push_message(
+                    PushMessageRequest(
+                        to=to_user_id,
+                        messages=messages
+                    ),
+                    x_line_retry_key=message_id,
                 )
-            )
+            metrics.PUSHES.inc(result="ok")
             if DEBUG_VERBOSE:
-                print(f"[push][ok] to={to_user_id[:5]}***{to_user_id[-3:]} try={attempt}")
+                print(f"[push][ok] to={_mask(to_user_id)} try={attempt}")
             return True
-        
-        except ApiException as e:
-            # When LINE API responds with an error (inspect http status/body for diagnostics).
-            if DEBUG_VERBOSE:
-                print(
-                    f"[push][api-error] status={getattr(e, 'status', None)} "
-                    f"body={getattr(e, 'body',None)} try={attempt}"
+        except Exception as e:
+            if rate_limit.error_status(e) == 409:
+                # Conflict on our retry key: an earlier attempt was accepted after all.
+                metrics.PUSHES.inc(result="duplicate")
+                return True
+            error_message = str(e)
+            _log_push_failure(e, attempt)
+            retry_after = rate_limit.note_failure("line_push", e)
+            if not rate_limit.is_retryable(e):
+                text_only = _text_only(messages, e)
+                if text_only:
+                    messages = text_only  # Send the text with a link instead of nothing
+                    continue
+                break  # e.g. 400: retrying cannot help
+
+        if attempt <= max_retries:
+            wait = rate_limit.backoff_delay(attempt, retry_after)
+            if wait > rate_limit.RATE_LIMIT_BACKOFF_MAX:
+                break  # Too long to hold a worker; the dead letter can be replayed
+            print(f"[push] retry in {wait:.1f}s")
+            metrics.RETRIES.inc(target="line_push")
+            time.sleep(wait)
+
+    metrics.PUSHES.inc(result="dead_letter")
+    _write_dead_letter(to_user_id, messages, error_message, message_id)
+    return False  # Return False if written to dead-letter file.
+
+async def _smart_send_async(user_id: str, reply_token: Optional[str], content: Union[str, List[Message]]) -> None:
+    """Async version of _smart_send() using the async LINE client."""
+    messages = _as_messages(content)
+    used_reply = False
+
+    while reply_token and not used_reply:
+        try:
+            await rate_limit.limiter("line_reply").acquire_async()
+            with metrics.STAGE_SECONDS.time(stage="line_reply"):
+                await _get_async_line_bot_api().reply_message(
+                    ReplyMessageRequest(
+                        reply_token=reply_token,
+                        messages=messages
                     )
-            
+                )
+            used_reply = True
+            _count_delivery("replied")
+            if DEBUG_VERBOSE:
+                print(f"[reply][ok] messages={len(messages)} user={_mask(user_id)}")
         except Exception as e:
-            # Network-layer error (e.g. Connection reset by peer)
+            rate_limit.note_failure("line_reply", e)
+            text_only = None if _reply_token_invalid(e) else _text_only(messages, e)
+            if text_only:
+                messages = text_only  # A rejected request does not use up the token
+                continue
+            _count_delivery("reply_failed")
+            _log_reply_failure(e)
+            break
+
+    if not used_reply:
+        await _push_with_retry_async(user_id, messages)
+        if DEBUG_VERBOSE:
+            print(f"[fallback][push][ok] user={_mask(user_id)}")
+
+async def _push_with_retry_async(to_user_id: str, content: Union[str, List[Message]], max_retries: int = 2) -> bool:
+    """Async version of _push_with_retry(), backs off with asyncio.sleep."""
+    messages = _as_messages(content)
+    error_message = "unknown"
+    message_id = dead_letters.new_message_id()
+
+    for attempt in range(1, max_retries + 2):
+        retry_after = None
+        try:
+            await rate_limit.limiter("line_push").acquire_async()
+            with metrics.STAGE_SECONDS.time(stage="line_push"):
+                await _get_async_line_bot_api().push_message(
+                    PushMessageRequest(
+                        to=to_user_id,
+                        messages=messages
+                    ),
+                    x_line_retry_key=message_id,
+                )
+            metrics.PUSHES.inc(result="ok")
             if DEBUG_VERBOSE:
-                print(f"[push][conn-error] {type(e).__name__}: {e} try={attempt}")
+                print(f"[push][ok] to={_mask(to_user_id)} try={attempt}")
+            return True
+        except Exception as e:
+            if rate_limit.error_status(e) == 409:
+                # Conflict on our retry key: an earlier attempt was accepted after all.
+                metrics.PUSHES.inc(result="duplicate")
+                return True
+            error_message = str(e)
+            _log_push_failure(e, attempt)
+            retry_after = rate_limit.note_failure("line_push", e)
+            if not rate_limit.is_retryable(e):
+                text_only = _text_only(messages, e)
+                if text_only:
+                    messages = text_only  # Send the text with a link instead of nothing
+                    continue
+                break  # e.g. 400: retrying cannot help
 
         if attempt <= max_retries:
-            wait = 2 ** (attempt - 1)  # 1s, 2s...
-            print(f"[push] retry in {wait}s")
-            time.sleep(wait)
+            wait = rate_limit.backoff_delay(attempt, retry_after)
+            if wait > rate_limit.RATE_LIMIT_BACKOFF_MAX:
+                break
+            print(f"[push] retry in {wait:.1f}s")
+            metrics.RETRIES.inc(target="line_push")
+            await asyncio.sleep(wait)
+
+    metrics.PUSHES.inc(result="dead_letter")
+    await asyncio.to_thread(_write_dead_letter, to_user_id, messages, error_message, message_id)
+    return False
+
+# --- Outbox: the webhook queues messages, a fixed worker pool answers them ---
+
+def _job_reply_token(job: dict) -> Optional[str]:
+    """The job's reply token, or None if it can no longer be used (go straight to push)."""
+    if not job["reply_token"]:
+        _count_delivery("no_token")
+        return None
+    if job["deadline"] is not None and time.time() >= job["deadline"]:
+        _count_delivery("expired_in_queue")
+        if DEBUG_VERBOSE:
+            print(f"[outbox] reply token expired in queue (route={job['route']}) → push mode")
+        return None
+    return job["reply_token"]
+
+def _process_job(job: dict) -> None:
+    process_text_message(job["user_id"], job["text"], _job_reply_token(job))
+
+async def _process_job_async(job: dict) -> None:
+    await process_text_message_async(job["user_id"], job["text"], _job_reply_token(job))
 
-    # Still failing after retries than write a dead-letter record (one JSON per line).
+def _enqueue_event(user_id: str, user_question: str, reply_token: Optional[str],
+                   event_ms: Optional[int], event_id: Optional[str] = None,
+                   redelivery: bool = False) -> None:
+    """
+    Classify the message (no I/O beyond local caches) and queue it with its deadline.
+    An event whose webhookEventId was already queued (LINE redelivery) is dropped here.
+    """
+    if not seen_events.add(event_id, redelivery):
+        metrics.WEBHOOK_DUPLICATES.inc(redelivery=str(redelivery).lower())
+        if DEBUG_VERBOSE:
+            print(f"[webhook][duplicate] event={event_id} redelivery={redelivery} user={_mask(user_id)}")
+        return
     try:
-        folder = os.path.dirname(DEAD_LETTER_PATH)
-        if folder:
-            os.makedirs(folder, exist_ok=True)
-        error_message = str(e) if 'e' in locals() else "unknown"
-        rec = {
-            "ts": datetime.now(timezone.utc).isoformat(),  # timezone-aware UTC
-            "user_id": f"{to_user_id[:5]}***{to_user_id[-3:]}",
-            "text": safe_text,
-            "error": error_message
-        }
-        with open(DEAD_LETTER_PATH, "a", encoding="utf-8") as f:
-            f.write(json.dumps(rec, ensure_ascii=False) + "\n")
-        print(f"[push][dead-letter] saved -> {DEAD_LETTER_PATH}")
+        route = estimate_route(user_question)
     except Exception as e:
         if DEBUG_VERBOSE:
-            print(f"[push][dead-letter][fail] {e}")
-            return False
-    
-    return False  # Return False if written to dead-letter file.
-    
+            print(f"[outbox][route-error] {type(e).__name__}: {e}")
+        route = "llm"
+    metrics.MESSAGES.inc(route=route)
+    event_time = event_ms / 1000 if event_ms else time.time()
+    deadline = event_time + REPLY_TOKEN_TTL_SECONDS if reply_token else None
+    try:
+        outbox.enqueue(user_id, user_question, reply_token,
+                       priority=ROUTE_PRIORITY.get(route, 1), deadline=deadline, route=route)
+    except Exception:
+        seen_events.forget(event_id)  # Not queued: let LINE's redelivery through
+        raise
+
+outbox = Outbox()
+seen_events = webhook_dedup.SeenEvents()
+workers = WorkerPool(
+    outbox,
+    _process_job_async if EXECUTION_MODE == "async" else _process_job,
+    use_async=EXECUTION_MODE == "async",
+)
+
+def get_outbox_stats() -> dict:
+    return workers.stats()
+
+def get_rate_limit_stats() -> dict:
+    return rate_limit.get_stats()
+
+# Gauges on /metrics, read from the existing stats at scrape time.
+metrics.register_stats("outbox", get_outbox_stats)
+metrics.register_stats("webhook_dedup", seen_events.stats)
+metrics.register_stats("delivery", get_delivery_stats)
+metrics.register_stats("rate_limit", get_rate_limit_stats)
+metrics.register_stats("db_pool", get_pool_stats)
+metrics.register_stats("answer_cache", answer_cache.get_stats)
+metrics.register_stats("singleflight", get_singleflight_stats)
+metrics.register_stats("faq", faq_router.get_stats)
+metrics.register_stats("guest_index", lambda: guest_index.get_index().stats())
+metrics.register_stats("guest_snapshot", lambda: guest_snapshot.get_index().stats())
+metrics.register_stats("name_spotter", name_spotter.get_stats)
+metrics.register_stats("seatmap", lambda: seatmap.get_renderer().stats())
+metrics.register_stats("profiler", profiler.get_stats)
+
+def _warm_guest_snapshot() -> None:
+    guest_snapshot.get_index().snapshot()
+
+def _prepare_static() -> None:
+    seatmap.get_renderer().render_all()
+    if not static_assets.get_manifest():
+        static_assets.build()
+
+def _run_startup_task(name: str, fn) -> None:
+    """Run a warm-up step in the default executor without delaying startup; log it if it fails."""
+    def _done(fut: "asyncio.Future") -> None:
+        if fut.cancelled():
+            return
+        e = fut.exception()
+        if e is not None:
+            print(f"[startup][{name}-error] {type(e).__name__}: {e}")
+    asyncio.get_running_loop().run_in_executor(None, fn).add_done_callback(_done)
+
+# Resume messages left over from the previous run.
+@app.on_event("startup")
+async def _startup() -> None:
+    workers.start()
+    # Pre-render per-table seat maps, then fingerprint anything the build step
+    # missed (both no-ops when unchanged).
+    _run_startup_task("static", _prepare_static)
+    if GUEST_SEARCH_MODE == "snapshot":
+        # Map (or, in one worker, build) the shared guest snapshot before the first lookup.
+        _run_startup_task("guest_snapshot", _warm_guest_snapshot)
+    if name_spotter.NAME_SPOTTER_ENABLED:
+        # Build the guest-name automaton in a thread; messages use keyword rules until it is ready.
+        _run_startup_task("name_spotter", name_spotter.warm)
+
+# Release pooled DB connections and the async LINE session when the server stops.
+@app.on_event("shutdown")
+async def _shutdown() -> None:
+    await workers.stop()
+    outbox.close()
+    seen_events.close()
+    dead_letters.get_store().close()
+    close_pool()
+    if _async_api_client is not None:
+        await _async_api_client.close()
+
 # --- Section 3 : Define the API router ---
 # Define the URL path
 
@@ -192,10 +536,40 @@ def _push_with_retry(to_user_id: str, text: str, max_retries: int = 2) -> bool:
 def read_root():
     return {"status": "ok", "message": "Wedding AI Assistant is alive."}
 
+# Prometheus scrape endpoint (metrics.py); METRICS_TOKEN set = Bearer token required.
+@app.get("/metrics")
+def get_metrics(request: Request):
+    if not metrics.METRICS_ENABLED:
+        raise HTTPException(status_code=404)
+    if metrics.METRICS_TOKEN and request.headers.get("Authorization", "") != f"Bearer {metrics.METRICS_TOKEN}":
+        raise HTTPException(status_code=401)
+    return PlainTextResponse(metrics.render(), media_type="text/plain; version=0.0.4")
+
+def _check_dev_secret(request: Request) -> None:
+    if not DEV_MODE_SECRET_CODE:
+        raise HTTPException(status_code=404)
+    if not secrets.compare_digest(request.headers.get("Authorization", ""), f"Bearer {DEV_MODE_SECRET_CODE}"):
+        raise HTTPException(status_code=401)
+
+# Sampling profiler (profiler.py): GET shows its state, POST ?rate=0.1 changes the
+# sampled share of messages (0 = off). Bearer DEV_MODE_SECRET_CODE required.
+@app.get("/admin/profile")
+def get_profile(request: Request):
+    _check_dev_secret(request)
+    return profiler.get_stats()
+
+@app.post("/admin/profile")
+def set_profile(request: Request, rate: float):
+    _check_dev_secret(request)
+    if not math.isfinite(rate):
+        raise HTTPException(status_code=400, detail="rate must be a number between 0 and 1")
+    profiler.set_rate(rate)
+    return profiler.get_stats()
+
 # Webhook endpoint, receiving all messages from LINE.
 # @app.post("/webhook"), only accept POST method from this path.
 @app.post("/webhook")
-async def webhook(request: Request, background_tasks: BackgroundTasks):
+async def webhook(request: Request):
     # Get 'X-Line-Signature'
     signature = request.headers.get('X-Line-Signature', '')
 
@@ -204,7 +578,8 @@ async def webhook(request: Request, background_tasks: BackgroundTasks):
 
     try: 
         # Signature Check Point
-        events = parser.parse(body.decode('utf-8'), signature)
+        with metrics.STAGE_SECONDS.time(stage="webhook_parse"):
+            events = parser.parse(body.decode('utf-8'), signature)
     except InvalidSignatureError:
         # Refuse invalid request
         raise HTTPException(status_code=400, detail="Invalid signature")
@@ -213,49 +588,107 @@ async def webhook(request: Request, background_tasks: BackgroundTasks):
     for event in events:
         # Only handle text message.
         if isinstance(event, MessageEvent) and isinstance(event.message, TextMessageContent):
-            # Instantiate a single background task for every text message.
+            # Queue every text message; the outbox workers answer it.
             user_id = event.source.user_id
             user_question = event.message.text
             reply_token = event.reply_token
-            background_tasks.add_task(process_text_message, user_id, user_question, reply_token)
+            # webhookEventId is stable across redeliveries; duplicates are dropped before queueing.
+            redelivery = bool(getattr(event.delivery_context, "is_redelivery", False))
+            await asyncio.to_thread(_enqueue_event, user_id, user_question, reply_token, event.timestamp,
+                                    event.webhook_event_id, redelivery)
+            workers.notify()
     return 'OK'
 
 # --- Section 4: Event Processing Logic ---
 
+def _is_https(url: Optional[str]) -> bool:
+    return bool(url) and url.lower().startswith("https://")
+
+def _build_reply_messages(result: dict) -> List[Message]:
+    """
+    One bundle per answer: the reply text, then for a seat query the seat map
+    (per table when rendered), as an inline image when a JPEG/PNG is available
+    over https (LINE rejects the whole request otherwise), else as a link.
+    """
+    messages: List[Message] = [TextMessage(text=result.get("text") or FALLBACK_TEXT)]
+    native_url, preview_url = result.get("native_image_url"), result.get("preview_url")
+    table_images = result.get("table_images") or []
+    if len(table_images) > 1 and all(
+        _is_https(t["native_image_url"]) and _is_https(t["preview_url"]) for t in table_images
+    ):
+        # Family spread over several tables: one highlighted map per table.
+        for t in table_images[:MAX_MESSAGES_PER_REQUEST - 1]:
+            messages.append(ImageMessage(original_content_url=t["native_image_url"],
+                                         preview_image_url=t["preview_url"]))
+    elif _is_https(native_url) and _is_https(preview_url):
+        messages.append(ImageMessage(original_content_url=native_url, preview_image_url=preview_url))
+    elif result.get("image_url"):
+        messages.append(_seat_map_link(result["image_url"]))
+    return messages
+
+PROFILE_COMMAND = re.compile(r"^/profile(?:\s+(on|off|[0-9]*\.?[0-9]+))?$", re.IGNORECASE)
+
+def _admin_command(user_id: str, text: str) -> Optional[str]:
+    """Reply text for an admin chat command, or None for a normal message."""
+    if user_id not in ADMIN_IDS:
+        return None
+    m = PROFILE_COMMAND.match(text.strip())
+    if not m:
+        return None
+    arg = (m.group(1) or "").lower()
+    if arg:
+        rate = {"on": 1.0, "off": 0.0}.get(arg)
+        profiler.set_rate(float(arg) if rate is None else rate)
+    stats = profiler.get_stats()
+    return (f"效能取樣比例：{stats['rate']:g}（已取樣 {stats['sampled']} 則，"
+            f"寫入 {stats['written']} 份到 {profiler.PROFILE_DIR}）")
+
 def process_text_message(user_id: str, user_question: str, reply_token: Optional[str] = None) -> None:
     """
-    Handle a single text message event in a background thread.
+    Handle a single text message event in an outbox worker thread.
 
     :param user_id: LINE user ID.
     :param user_question: Text content of the message.
     :return: None. The reply is sent asynchronously via LINE API.
     """
     if DEBUG_VERBOSE:
-        print(f"Processing message for user: {user_id[:5]}***{user_id[-3:]}")
+        print(f"Processing message for user: {_mask(user_id)}")
 
-    try:
-        result = handle_message(user_question)  # Handling by bot_core.py.
-        reply_text = result.get("text", "")
-        image_url = result.get("image_url")
+    with profiler.profile("process_text_message", _mask(user_id)):
+        try:
+            admin_reply = _admin_command(user_id, user_question)
+            # Handling by bot_core.py.
+            result = {"text": admin_reply} if admin_reply else handle_message(user_question)
 
-        if not reply_text:
-            reply_text = "出了點狀況喔！請稍後再試～"
+            # The architecture is primarily push-based, but utilizes replies whenever
+            # possible to conserve message quota. A seat map goes in the same request.
+            _smart_send(user_id, reply_token, _build_reply_messages(result))
 
-        # The architecture is primarily push-based, but utilizes replies whenever
-        # possible to conserve message quota.
-        _smart_send(user_id, reply_token, reply_text)
-        
-        # For a seat query, return the seat map URL.
-        if image_url:
-            _push_with_retry(user_id, f"📍座位圖請看這裡：{image_url}")
+        except Exception as e:
+            if DEBUG_VERBOSE:
+                print(f"[process_text_message][error] user={_mask(user_id)}: {e}")
+            if reply_token:
+                _reply_safe(reply_token, FALLBACK_TEXT)
+            else:
+                _push_with_retry(user_id, FALLBACK_TEXT)
 
-    except Exception as e:
-        if DEBUG_VERBOSE:
-            print(f"[process_text_message][error] user={user_id}: {e}")
-        if reply_token:
-            _reply_safe(reply_token, "出了點狀況喔！請稍後再試～")
-        else:
-            _push_with_retry(user_id, "出了點狀況喔！請稍後再試～")
+async def process_text_message_async(user_id: str, user_question: str, reply_token: Optional[str] = None) -> None:
+    """
+    Async version of process_text_message(), runs in an outbox worker task.
+    """
+    if DEBUG_VERBOSE:
+        print(f"Processing message for user: {_mask(user_id)}")
+
+    async with profiler.profile("process_text_message_async", _mask(user_id)):
+        try:
+            admin_reply = _admin_command(user_id, user_question)
+            result = {"text": admin_reply} if admin_reply else await handle_message_async(user_question)
+            await _smart_send_async(user_id, reply_token, _build_reply_messages(result))
+
+        except Exception as e:
+            if DEBUG_VERBOSE:
+                print(f"[process_text_message_async][error] user={_mask(user_id)}: {e}")
+            await _smart_send_async(user_id, reply_token, FALLBACK_TEXT)
 
 # --- Section 5 : Local Development Block ---
 # This block only runs when the script is executed directly (e.g., python main.py).
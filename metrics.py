@@ -0,0 +1,211 @@
+# metrics.py
+
+import bisect
+import os
+import re
+import threading
+import time
+from typing import Any, Callable, Dict, List, Sequence, Tuple
+
+# Dependency-free Prometheus metrics, served by main.py on GET /metrics.
+# - Counters / histograms are recorded where the work happens (a dict lookup,
+#   a bisect and a few additions under a lock, so they stay on in production).
+# - Gauges come from the modules' existing stats() functions, read only when
+#   /metrics is scraped.
+
+DEBUG_VERBOSE = os.getenv("DEBUG_VERBOSE", "false").lower() == "true"
+METRICS_ENABLED = os.getenv("METRICS_ENABLED", "true").lower() == "true"
+# Optional bearer token for /metrics (empty = open).
+METRICS_TOKEN = os.getenv("METRICS_TOKEN", "")
+
+PREFIX = "wedding_"
+# Seconds; from in-memory lookups (~ms) to slow OpenAI calls.
+DEFAULT_BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+def _label_text(names: Sequence[str], values: Tuple[str, ...], extra: str = "") -> str:
+    pairs = [f'{n}="{_escape(v)}"' for n, v in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+def _escape(value: Any) -> str:
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+def _number(value: float) -> str:
+    if isinstance(value, bool):
+        return str(int(value))
+    if value == float("inf"):
+        return "+Inf"
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+class Counter:
+    """Monotonic counter with optional labels."""
+
+    def __init__(self, name: str, help_text: str, labelnames: Sequence[str] = ()):
+        self.name, self.help, self.labelnames = PREFIX + name, help_text, tuple(labelnames)
+        self._values: Dict[Tuple[str, ...], float] = {}
+        self._lock = threading.Lock()
+
+    def inc(self, amount: float = 1, **labels) -> None:
+        if not METRICS_ENABLED:
+            return
+        key = tuple(str(labels.get(n, "")) for n in self.labelnames)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def value(self, **labels) -> float:
+        return self._values.get(tuple(str(labels.get(n, "")) for n in self.labelnames), 0)
+
+    def render(self) -> List[str]:
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} counter"]
+        with self._lock:
+            items = sorted(self._values.items())
+        lines += [f"{self.name}{_label_text(self.labelnames, k)} {_number(v)}" for k, v in items]
+        return lines
+
+class _Timer:
+    __slots__ = ("_hist", "_labels", "_start")
+
+    def __init__(self, hist: "Histogram", labels: Dict[str, Any]):
+        self._hist, self._labels = hist, labels
+
+    def __enter__(self):
+        self._start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        self._hist.observe(time.perf_counter() - self._start, **self._labels)
+        return False
+
+class Histogram:
+    """Fixed-bucket histogram; with Histogram.time(**labels): ... records seconds."""
+
+    def __init__(self, name: str, help_text: str, labelnames: Sequence[str] = (),
+                 buckets: Sequence[float] = DEFAULT_BUCKETS):
+        self.name, self.help, self.labelnames = PREFIX + name, help_text, tuple(labelnames)
+        self.buckets = tuple(sorted(buckets))
+        # Per label set: [count per bucket (last = +Inf), sum, count]
+        self._series: Dict[Tuple[str, ...], list] = {}
+        self._lock = threading.Lock()
+
+    def observe(self, value: float, **labels) -> None:
+        if not METRICS_ENABLED:
+            return
+        key = tuple(str(labels.get(n, "")) for n in self.labelnames)
+        i = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            series = self._series.get(key)
+            if series is None:
+                series = self._series[key] = [[0] * (len(self.buckets) + 1), 0.0, 0]
+            series[0][i] += 1
+            series[1] += value
+            series[2] += 1
+
+    def time(self, **labels) -> _Timer:
+        return _Timer(self, labels)
+
+    def render(self) -> List[str]:
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} histogram"]
+        with self._lock:
+            items = sorted((k, ([*s[0]], s[1], s[2])) for k, s in self._series.items())
+        for key, (counts, total, count) in items:
+            cumulative = 0
+            for bound, n in zip(self.buckets + (float("inf"),), counts):
+                cumulative += n
+                le = 'le="' + _number(bound) + '"'
+                lines.append(f"{self.name}_bucket{_label_text(self.labelnames, key, le)} {cumulative}")
+            lines.append(f"{self.name}_sum{_label_text(self.labelnames, key)} {_number(round(total, 6))}")
+            lines.append(f"{self.name}_count{_label_text(self.labelnames, key)} {count}")
+        return lines
+
+# --- What the app records ---
+
+STAGE_SECONDS = Histogram(
+    "stage_seconds", "Time spent per processing stage.", ["stage"])
+DELIVERIES = Counter(
+    "deliveries_total", "How answers went out: replied, or pushed because the reply failed / "
+    "the token expired in the queue / there was no token.", ["outcome"])
+PUSHES = Counter(
+    "pushes_total", "Push results (ok, duplicate = accepted earlier, dead_letter).", ["result"])
+DEAD_LETTERS = Counter(
+    "dead_letters_total", "Messages written to the dead-letter store.")
+RETRIES = Counter(
+    "retries_total", "Retries after a failed call.", ["target"])
+OPENAI_TOKENS = Counter(
+    "openai_tokens_total", "OpenAI token usage from completion.usage.", ["kind"])
+MESSAGES = Counter(
+    "messages_total", "Text messages queued from the webhook, by estimated route.", ["route"])
+WEBHOOK_DUPLICATES = Counter(
+    "webhook_duplicates_total", "Webhook events dropped because their webhookEventId was already seen.",
+    ["redelivery"])
+
+_metrics: List[Any] = [STAGE_SECONDS, DELIVERIES, PUSHES, DEAD_LETTERS, RETRIES, OPENAI_TOKENS, MESSAGES,
+                       WEBHOOK_DUPLICATES]
+
+def record_usage(usage) -> None:
+    """Add an OpenAI completion.usage to the token counters."""
+    if usage is None or not METRICS_ENABLED:
+        return
+    OPENAI_TOKENS.inc(usage.prompt_tokens or 0, kind="prompt")
+    OPENAI_TOKENS.inc(usage.completion_tokens or 0, kind="completion")
+    details = getattr(usage, "prompt_tokens_details", None)
+    cached = getattr(details, "cached_tokens", None)
+    if cached:
+        OPENAI_TOKENS.inc(cached, kind="cached_prompt")
+
+# --- Gauges from existing stats() functions ---
+
+_stats_sources: List[Tuple[str, Callable[[], Dict[str, Any]]]] = []
+
+def register_stats(name: str, fn: Callable[[], Dict[str, Any]]) -> None:
+    """
+    Export fn()'s numeric values as gauges wedding_<name>_<key> at scrape time.
+    Nested dicts (e.g. one entry per limiter) become a "name" label.
+    """
+    _stats_sources.append((name, fn))
+
+def _sanitize(name: str) -> str:
+    return re.sub(r"[^a-zA-Z0-9_]", "_", name)
+
+def _render_stats() -> List[str]:
+    lines = []
+    for source, fn in _stats_sources:
+        try:
+            stats = fn() or {}
+        except Exception as e:
+            if DEBUG_VERBOSE:
+                print(f"[metrics][stats-error] {source}: {type(e).__name__}: {e}")
+            continue
+        samples: Dict[str, List[str]] = {}
+
+        def _add(key: str, value: Any, label: str = "") -> None:
+            if isinstance(value, (int, float)):
+                labels = f'{{name="{_escape(label)}"}}' if label else ""
+                samples.setdefault(key, []).append(f"{labels} {_number(value)}")
+
+        if stats and all(isinstance(v, dict) for v in stats.values()):
+            # {name: {key: value}}, e.g. one entry per rate limiter
+            for name, inner in stats.items():
+                for key, value in inner.items():
+                    _add(key, value, name)
+        else:
+            # {key: value}; a dict value such as {route: count} is labelled by its keys
+            for key, value in stats.items():
+                if isinstance(value, dict):
+                    for name, inner in value.items():
+                        _add(key, inner, name)
+                else:
+                    _add(key, value)
+        for key, values in samples.items():
+            metric = _sanitize(f"{PREFIX}{source}_{key}")
+            lines.append(f"# TYPE {metric} gauge")
+            lines += [metric + v for v in values]
+    return lines
+
+def render() -> str:
+    """All metrics in the Prometheus text exposition format (0.0.4)."""
+    lines: List[str] = []
+    for metric in _metrics:
+        lines += metric.render()
+    lines += _render_stats()
+    return "\n".join(lines) + "\n"
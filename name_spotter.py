@@ -0,0 +1,181 @@
+# name_spotter.py
+
+import os
+import threading
+import time
+from collections import deque
+from typing import Any, Dict, Iterable, Iterator, List, Optional, Tuple
+
+from db import guest_index, guest_snapshot
+
+# Guest-name spotter for intent detection and keyword extraction.
+# Compiles every attending guest's name / alias / display_name into one
+# Aho-Corasick automaton, so all guest names in a message are found in a single
+# pass over the text, however many guests there are. The automaton is rebuilt
+# whenever the guest index loads a new snapshot of the guests table.
+# Loading the guests and rebuilding happen in one long-lived background thread,
+# every GUEST_INDEX_REFRESH_SECONDS: callers (the event loop included) never
+# wait on the database and keep the previous automaton meanwhile. Until the
+# first build is done only the keyword rules apply; main.py starts the thread
+# at startup.
+
+DEBUG_VERBOSE = os.getenv("DEBUG_VERBOSE", "false").lower() == "true"
+_SEARCH_MODE = os.getenv("GUEST_SEARCH_MODE", "index").lower()
+# GUEST_SEARCH_MODE=sql keeps the guest list out of memory, so spotting is opt-in there.
+NAME_SPOTTER_ENABLED = os.getenv(
+    "NAME_SPOTTER_ENABLED", "false" if _SEARCH_MODE == "sql" else "true"
+).lower() == "true"
+# Read the names from the shared snapshot file when bot_core serves lookups from it.
+USE_SNAPSHOT = _SEARCH_MODE == "snapshot"
+
+# Shorter patterns (single characters) would match inside ordinary words.
+MIN_NAME_LENGTH = 2
+
+class NameSpotter:
+    """Aho-Corasick automaton over a fixed set of (lower-cased) names."""
+
+    def __init__(self, names: Iterable[str]):
+        self._goto: List[Dict[str, int]] = [{}]
+        self._fail: List[int] = [0]
+        self._out: List[Tuple[int, ...]] = [()]  # Lengths of the names ending in each state
+        patterns = {n.strip().lower() for n in names if n and len(n.strip()) >= MIN_NAME_LENGTH}
+        for name in patterns:
+            self._insert(name)
+        self._build_links()
+        self.pattern_count = len(patterns)
+
+    def _insert(self, name: str) -> None:
+        state = 0
+        for ch in name:
+            nxt = self._goto[state].get(ch)
+            if nxt is None:
+                nxt = len(self._goto)
+                self._goto[state][ch] = nxt
+                self._goto.append({})
+                self._fail.append(0)
+                self._out.append(())
+            state = nxt
+        self._out[state] = self._out[state] + (len(name),)
+
+    def _build_links(self) -> None:
+        # Breadth-first: a state's failure link points to the longest proper
+        # suffix that is also a prefix of some name.
+        queue = deque(self._goto[0].values())
+        while queue:
+            state = queue.popleft()
+            for ch, nxt in self._goto[state].items():
+                queue.append(nxt)
+                f = self._fail[state]
+                while f and ch not in self._goto[f]:
+                    f = self._fail[f]
+                link = self._goto[f].get(ch, 0)
+                self._fail[nxt] = link if link != nxt else 0
+                self._out[nxt] = self._out[nxt] + self._out[self._fail[nxt]]
+
+    def find_all(self, text: str) -> Iterator[Tuple[int, int]]:
+        """Yield (start, end) of every name occurrence, overlaps included."""
+        goto, fail, out = self._goto, self._fail, self._out
+        state = 0
+        for i, ch in enumerate(text.lower()):
+            while state and ch not in goto[state]:
+                state = fail[state]
+            state = goto[state].get(ch, 0)
+            for length in out[state]:
+                yield i + 1 - length, i + 1
+
+    def spot(self, text: str) -> List[str]:
+        """Names found in text, leftmost-longest and non-overlapping, as written in text."""
+        if len(text.lower()) != len(text):
+            return []  # Case folding changed offsets (rare non-CJK letters)
+        best: Dict[int, int] = {}
+        for start, end in self.find_all(text):
+            if end > best.get(start, -1):
+                best[start] = end
+        names, pos = [], 0
+        for start in sorted(best):
+            if start >= pos:
+                names.append(text[start:best[start]])
+                pos = best[start]
+        return names
+
+    def stats(self) -> Dict[str, int]:
+        return {"patterns": self.pattern_count, "states": len(self._goto)}
+
+class _SpotterHolder:
+    """Rebuilds the automaton in the background when the guest index swaps in a new snapshot."""
+
+    def __init__(self, interval: float = guest_index.REFRESH_SECONDS):
+        self.interval = interval
+        self._snapshot = None
+        self._spotter: Optional[NameSpotter] = None
+        self._lock = threading.Lock()
+        self._thread: Optional[threading.Thread] = None
+        self._ready = threading.Event()  # Set after the first load attempt
+        self.builds = 0
+
+    def _ensure_started(self) -> None:
+        if self._thread is None:
+            with self._lock:
+                if self._thread is None:
+                    self._thread = threading.Thread(target=self._run, name="name-spotter", daemon=True)
+                    self._thread.start()
+
+    def get(self) -> Optional[NameSpotter]:
+        """Current automaton (None before the first build); never blocks."""
+        if not NAME_SPOTTER_ENABLED:
+            return None
+        self._ensure_started()
+        return self._spotter
+
+    def warm(self, timeout: Optional[float] = None) -> None:
+        """Start the refresher and wait for its first load (startup)."""
+        if NAME_SPOTTER_ENABLED:
+            self._ensure_started()
+            self._ready.wait(timeout)
+
+    def _run(self) -> None:
+        while True:
+            self._refresh()
+            self._ready.set()
+            time.sleep(self.interval)
+
+    def _refresh(self) -> None:
+        try:
+            snapshot = (guest_snapshot if USE_SNAPSHOT else guest_index).get_index().snapshot()
+            if snapshot is not self._snapshot:
+                started = time.perf_counter()
+                self._spotter = NameSpotter(name for fields in snapshot.texts for name in fields)
+                self._snapshot = snapshot
+                self.builds += 1
+                if DEBUG_VERBOSE:
+                    print(f"[name_spotter][build] {self._spotter.stats()} "
+                          f"in {(time.perf_counter() - started) * 1000:.1f} ms")
+        except Exception as e:
+            print(f"[name_spotter][load-error] {type(e).__name__}: {e} (keyword rules only)")
+
+_holder = _SpotterHolder()
+
+def get_spotter() -> Optional[NameSpotter]:
+    return _holder.get()
+
+def warm(timeout: Optional[float] = None) -> None:
+    """Build the automaton before the first message (blocking; call off the event loop)."""
+    _holder.warm(timeout)
+
+def spot(text: str) -> List[str]:
+    """Guest names mentioned in text ([] if the spotter is disabled or unavailable)."""
+    spotter = get_spotter()
+    return spotter.spot(text) if spotter and text else []
+
+def get_stats() -> Dict[str, Any]:
+    spotter = _holder._spotter
+    return {"enabled": NAME_SPOTTER_ENABLED, "builds": _holder.builds,
+            **(spotter.stats() if spotter else {})}
+
+if __name__ == "__main__":
+    warm()
+    while True:
+        text = input("Message:")
+        if text.lower() in {"exit", "quit", "q"}:
+            break
+        print(spot(text), get_stats())
@@ -0,0 +1,448 @@
+# outbox.py
+
+import asyncio
+import os
+import sqlite3
+import threading
+import time
+import uuid
+from typing import Any, Callable, Dict, List, Optional, Set
+
+# Durable queue between the webhook and the workers that answer messages.
+# The webhook only appends a row and returns; workers claim rows, run bot_core
+# and send the reply. In sync mode that is a fixed pool of threads; in async mode
+# one dispatcher claims rows and runs each as a task, up to a semaphore bound.
+# Rows survive a restart, and anything that was queued or half-done when the
+# process stopped is picked up again (at-least-once: a crash right after sending
+# can repeat one reply).
+#
+# Ordering: a user's messages are answered one at a time, in arrival order.
+# Only a user's oldest waiting row is claimable, and only while no other row of
+# that user is in progress.
+#
+# Scheduling: among claimable rows, workers take rows whose reply token is still
+# valid first, cheap routes (seat lookup, FAQ, cached answer; priority 0) before
+# LLM work (priority 1), then the earliest reply deadline. Rows whose token has
+# already expired go last, they will be pushed either way.
+#
+# Several processes (uvicorn --workers N) may share the file:
+# - claim() selects and marks a row inside BEGIN IMMEDIATE, so the SQLite write
+#   lock makes it atomic across processes, not just threads.
+# - A claimed row records its owner (one id per process run) and a lease that
+#   the owner renews every OUTBOX_LEASE_SECONDS / 3 while it works. Only rows
+#   whose lease ran out (their process died) are requeued, at startup and
+#   periodically by every live process, never rows another process is answering.
+
+DEBUG_VERBOSE = os.getenv("DEBUG_VERBOSE", "false").lower() == "true"
+
+def _get_num_env(var_name: str, default, cast=int):
+    try:
+        return cast(os.getenv(var_name, default))
+    except ValueError:
+        print(f"[Error] Invalid value for {var_name}, fallback to {default}")
+        return default
+
+# Empty path = in-memory only (no durability, same ordering and worker bound).
+OUTBOX_PATH = os.getenv("OUTBOX_PATH", "instance/outbox.sqlite3")
+# Worker threads (EXECUTION_MODE=sync); each blocks for the whole job.
+OUTBOX_WORKERS = max(1, _get_num_env("OUTBOX_WORKERS", 4))
+# Jobs in flight on the event loop (EXECUTION_MODE=async); waiting on OpenAI / LINE
+# costs no thread there, so this can be far higher than OUTBOX_WORKERS.
+OUTBOX_ASYNC_CONCURRENCY = max(1, _get_num_env("OUTBOX_ASYNC_CONCURRENCY", 200))
+OUTBOX_POLL_SECONDS = _get_num_env("OUTBOX_POLL_SECONDS", 1.0, float)
+# Log a backpressure warning when this many rows are waiting.
+OUTBOX_WARN_DEPTH = _get_num_env("OUTBOX_WARN_DEPTH", 50)
+# A row that was in progress during this many restarts is given up on.
+OUTBOX_MAX_ATTEMPTS = _get_num_env("OUTBOX_MAX_ATTEMPTS", 3)
+# A claimed row whose owner stops renewing it for this long is requeued.
+OUTBOX_LEASE_SECONDS = max(3.0, _get_num_env("OUTBOX_LEASE_SECONDS", 30.0, float))
+# Finished rows are kept this long, then purged.
+OUTBOX_RETENTION_SECONDS = _get_num_env("OUTBOX_RETENTION_SECONDS", 86400.0, float)
+
+PENDING, WORKING, DONE, FAILED = "pending", "working", "done", "failed"
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS outbox (
+    id          INTEGER PRIMARY KEY AUTOINCREMENT,
+    user_id     TEXT NOT NULL,
+    text        TEXT NOT NULL,
+    reply_token TEXT,
+    priority    INTEGER NOT NULL DEFAULT 1,
+    deadline    REAL,
+    route       TEXT,
+    state       TEXT NOT NULL DEFAULT 'pending',
+    owner       TEXT,
+    lease_until REAL,
+    attempts    INTEGER NOT NULL DEFAULT 0,
+    created_at  REAL NOT NULL,
+    updated_at  REAL NOT NULL,
+    error       TEXT
+);
+CREATE INDEX IF NOT EXISTS idx_outbox_state ON outbox (state, id);
+CREATE INDEX IF NOT EXISTS idx_outbox_user ON outbox (user_id, state, id);
+"""
+
+# Columns added after the first release, for files created by older versions.
+_ADDED_COLUMNS = {
+    "priority": "INTEGER NOT NULL DEFAULT 1",
+    "deadline": "REAL",
+    "route": "TEXT",
+    "owner": "TEXT",
+    "lease_until": "REAL",
+}
+
+# Per user: the oldest waiting row, if the user has nothing in progress.
+# Across users: live deadline first, cheap before LLM, earliest deadline, arrival.
+_CLAIM_SQL = """
+SELECT id, user_id, text, reply_token, attempts, created_at, priority, deadline, route
+FROM outbox o
+WHERE state = 'pending'
+  AND id = (SELECT MIN(id) FROM outbox p WHERE p.user_id = o.user_id AND p.state = 'pending')
+  AND user_id NOT IN (SELECT user_id FROM outbox WHERE state = 'working')
+ORDER BY
+  CASE WHEN deadline IS NULL OR deadline <= :now THEN 1 ELSE 0 END,
+  priority,
+  deadline,
+  id
+LIMIT 1
+"""
+
+class Outbox:
+    """SQLite-backed message queue with per-user ordering and queue metrics."""
+
+    def __init__(self, path: str = OUTBOX_PATH):
+        self.path = path
+        self.owner = f"{os.getpid()}:{uuid.uuid4().hex[:8]}"
+        self._lock = threading.Lock()
+        self._db = self._open(path)
+        self.enqueued = 0
+        self.completed = 0
+        self.failed = 0
+        self.recovered = 0
+        self.high_water = 0
+        self._wait_ms_total = 0.0
+        self._wait_ms_max = 0.0
+        self._warned = False
+        self._closed = threading.Event()
+        self.recover(startup=True)
+        self._heartbeat = threading.Thread(target=self._run_heartbeat, name="outbox-lease", daemon=True)
+        self._heartbeat.start()
+
+    def _open(self, path: str) -> sqlite3.Connection:
+        if path:
+            try:
+                folder = os.path.dirname(path)
+                if folder:
+                    os.makedirs(folder, exist_ok=True)
+                db = sqlite3.connect(path, timeout=30, check_same_thread=False)
+                db.execute("PRAGMA journal_mode=WAL")
+                db.executescript(_SCHEMA)
+                existing = {row[1] for row in db.execute("PRAGMA table_info(outbox)")}
+                for column, ddl in _ADDED_COLUMNS.items():
+                    if column not in existing:
+                        db.execute(f"ALTER TABLE outbox ADD COLUMN {column} {ddl}")
+                db.commit()
+                return db
+            except Exception as e:
+                print(f"[outbox][store-error] {type(e).__name__}: {e} (memory only)")
+        self.path = ""
+        db = sqlite3.connect(":memory:", check_same_thread=False)
+        db.executescript(_SCHEMA)
+        return db
+
+    def recover(self, startup: bool = False) -> None:
+        """
+        Requeue rows whose owner let the lease run out (its process stopped),
+        purge old finished rows. Rows other live processes are answering keep
+        renewing their lease and are left alone.
+        """
+        now = time.time()
+        expired = "state = ? AND (owner IS NULL OR lease_until IS NULL OR lease_until < ?)"
+        with self._lock:
+            cur = self._db.execute(
+                "UPDATE outbox SET state = ?, attempts = attempts + 1, owner = NULL, "
+                f"lease_until = NULL, updated_at = ? WHERE {expired} AND attempts + 1 < ?",
+                (PENDING, now, WORKING, now, OUTBOX_MAX_ATTEMPTS),
+            )
+            recovered = cur.rowcount
+            self._db.execute(
+                "UPDATE outbox SET state = ?, error = 'gave up after restarts', owner = NULL, "
+                f"lease_until = NULL, updated_at = ? WHERE {expired}",
+                (FAILED, now, WORKING, now),
+            )
+            self._purge(now)
+            self._db.commit()
+            self.recovered += recovered
+            pending = self._count(PENDING)
+        if startup and self.path:
+            print(f"[outbox] opened {self.path}: pending={pending} (recovered={recovered})")
+        elif recovered:
+            print(f"[outbox] requeued {recovered} rows with an expired lease")
+
+    def renew(self) -> None:
+        """Extend the lease on every row this process is still working on."""
+        with self._lock:
+            self._db.execute(
+                "UPDATE outbox SET lease_until = ? WHERE state = ? AND owner = ?",
+                (time.time() + OUTBOX_LEASE_SECONDS, WORKING, self.owner),
+            )
+            self._db.commit()
+
+    def _run_heartbeat(self) -> None:
+        while not self._closed.wait(OUTBOX_LEASE_SECONDS / 3):
+            try:
+                self.renew()
+                self.recover()
+            except sqlite3.Error as e:
+                print(f"[outbox][lease-error] {type(e).__name__}: {e}")
+
+    def _purge(self, now: float) -> None:
+        self._db.execute(
+            "DELETE FROM outbox WHERE state IN (?, ?) AND updated_at < ?",
+            (DONE, FAILED, now - OUTBOX_RETENTION_SECONDS),
+        )
+
+    def _count(self, state: str) -> int:
+        return self._db.execute("SELECT COUNT(*) FROM outbox WHERE state = ?", (state,)).fetchone()[0]
+
+    def enqueue(self, user_id: str, text: str, reply_token: Optional[str] = None,
+                priority: int = 1, deadline: Optional[float] = None, route: Optional[str] = None) -> int:
+        """
+        Persist one incoming message, return its row id.
+        `deadline` is the epoch time after which the reply token is no longer usable.
+        """
+        now = time.time()
+        with self._lock:
+            cur = self._db.execute(
+                "INSERT INTO outbox (user_id, text, reply_token, priority, deadline, route, "
+                "created_at, updated_at) VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                (user_id, text, reply_token, priority, deadline, route, now, now),
+            )
+            self._db.commit()
+            self.enqueued += 1
+            depth = self._count(PENDING)
+        self.high_water = max(self.high_water, depth)
+        if depth >= OUTBOX_WARN_DEPTH and not self._warned:
+            print(f"[outbox][backpressure] {depth} messages waiting (workers={OUTBOX_WORKERS})")
+            self._warned = True
+        elif depth < OUTBOX_WARN_DEPTH // 2:
+            self._warned = False
+        return cur.lastrowid
+
+    def claim(self) -> Optional[Dict[str, Any]]:
+        """Take the next row a worker may process, or None."""
+        with self._lock:
+            # Take the write lock before reading, so no other process can pick the same row
+            self._db.execute("BEGIN IMMEDIATE")
+            try:
+                now = time.time()
+                row = self._db.execute(_CLAIM_SQL, {"now": now}).fetchone()
+                if row is None:
+                    self._db.rollback()
+                    return None
+                self._db.execute(
+                    "UPDATE outbox SET state = ?, owner = ?, lease_until = ?, updated_at = ? WHERE id = ?",
+                    (WORKING, self.owner, now + OUTBOX_LEASE_SECONDS, now, row[0]),
+                )
+                self._db.commit()
+            except BaseException:
+                self._db.rollback()
+                raise
+            wait_ms = (now - row[5]) * 1000
+            self._wait_ms_total += wait_ms
+            self._wait_ms_max = max(self._wait_ms_max, wait_ms)
+        return {
+            "id": row[0], "user_id": row[1], "text": row[2],
+            "reply_token": row[3], "attempts": row[4], "created_at": row[5],
+            "priority": row[6], "deadline": row[7], "route": row[8],
+        }
+
+    def complete(self, job_id: int) -> None:
+        self._finish(job_id, DONE, None)
+
+    def fail(self, job_id: int, error: str) -> None:
+        self._finish(job_id, FAILED, error)
+
+    def _finish(self, job_id: int, state: str, error: Optional[str]) -> None:
+        now = time.time()
+        with self._lock:
+            self._db.execute(
+                "UPDATE outbox SET state = ?, error = ?, reply_token = NULL, lease_until = NULL, "
+                "updated_at = ? WHERE id = ? AND owner = ?",
+                (state, error, now, job_id, self.owner),
+            )
+            if state == DONE:
+                self.completed += 1
+                if self.completed % 500 == 0:
+                    self._purge(now)
+            else:
+                self.failed += 1
+            self._db.commit()
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            counts = dict(self._db.execute("SELECT state, COUNT(*) FROM outbox GROUP BY state").fetchall())
+            oldest = self._db.execute(
+                "SELECT MIN(created_at) FROM outbox WHERE state = ?", (PENDING,)
+            ).fetchone()[0]
+            by_route = dict(self._db.execute(
+                "SELECT COALESCE(route, '?'), COUNT(*) FROM outbox WHERE state = ? GROUP BY 1", (PENDING,)
+            ).fetchall())
+            claimed = self.completed + self.failed + counts.get(WORKING, 0)
+            return {
+                "pending": counts.get(PENDING, 0),
+                "working": counts.get(WORKING, 0),
+                "pending_by_route": by_route,
+                "failed_rows": counts.get(FAILED, 0),
+                "enqueued": self.enqueued,
+                "completed": self.completed,
+                "failed": self.failed,
+                "recovered": self.recovered,
+                "high_water": self.high_water,
+                "oldest_pending_age_s": round(time.time() - oldest, 3) if oldest else 0.0,
+                "queue_wait_avg_ms": round(self._wait_ms_total / claimed, 1) if claimed else 0.0,
+                "queue_wait_max_ms": round(self._wait_ms_max, 1),
+                "persistent": bool(self.path),
+                "owner": self.owner,
+            }
+
+    def close(self) -> None:
+        self._closed.set()
+        with self._lock:
+            self._db.close()
+
+class WorkerPool:
+    """
+    Bounded set of workers draining an Outbox.
+    `handler(job)` is a coroutine function when use_async is True (one task per
+    job, at most `size` at a time), otherwise a plain function (`size` threads).
+    `size` defaults to OUTBOX_ASYNC_CONCURRENCY / OUTBOX_WORKERS.
+    """
+
+    def __init__(self, box: Outbox, handler: Callable[[Dict[str, Any]], Any],
+                 size: Optional[int] = None, use_async: bool = True):
+        self.box = box
+        self.handler = handler
+        self.size = size or (OUTBOX_ASYNC_CONCURRENCY if use_async else OUTBOX_WORKERS)
+        self.use_async = use_async
+        self.busy = 0
+        self._running = False
+        self._dispatcher: Optional[asyncio.Task] = None
+        self._tasks: Set[asyncio.Task] = set()
+        self._slots: Optional[asyncio.Semaphore] = None
+        self._threads: List[threading.Thread] = []
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._async_wake: Optional[asyncio.Event] = None
+        self._thread_wake = threading.Event()
+
+    def start(self) -> None:
+        self._running = True
+        if self.use_async:
+            self._loop = asyncio.get_running_loop()
+            self._async_wake = asyncio.Event()
+            self._slots = asyncio.Semaphore(self.size)
+            self._dispatcher = asyncio.create_task(self._dispatch_async())
+        else:
+            self._threads = [
+                threading.Thread(target=self._run_thread, args=(i,), name=f"outbox-{i}", daemon=True)
+                for i in range(self.size)
+            ]
+            for t in self._threads:
+                t.start()
+        if self.use_async:
+            print(f"[outbox] async dispatcher started (up to {self.size} jobs in flight)")
+        else:
+            print(f"[outbox] {self.size} thread workers started")
+
+    def notify(self) -> None:
+        """Wake idle workers (new row, or a user's previous row finished)."""
+        if self.use_async:
+            if self._loop is None:
+                return
+            try:
+                running = asyncio.get_running_loop()
+            except RuntimeError:
+                running = None
+            if running is self._loop:
+                self._async_wake.set()
+            else:
+                self._loop.call_soon_threadsafe(self._async_wake.set)
+        else:
+            self._thread_wake.set()
+
+    def _finish(self, job: Dict[str, Any], error: Optional[BaseException]) -> None:
+        if error is None:
+            self.box.complete(job["id"])
+        else:
+            print(f"[outbox][job-error] id={job['id']} {type(error).__name__}: {error}")
+            self.box.fail(job["id"], f"{type(error).__name__}: {error}")
+
+    async def _dispatch_async(self) -> None:
+        """Claim rows while a slot is free and run each one as its own task."""
+        while self._running:
+            await self._slots.acquire()
+            job = None
+            while self._running and job is None:
+                self._async_wake.clear()
+                job = await asyncio.to_thread(self.box.claim)
+                if job is None:
+                    try:
+                        await asyncio.wait_for(self._async_wake.wait(), OUTBOX_POLL_SECONDS)
+                    except asyncio.TimeoutError:
+                        pass
+            if job is None:
+                self._slots.release()
+                break
+            task = asyncio.create_task(self._run_job_async(job))
+            self._tasks.add(task)
+            task.add_done_callback(self._tasks.discard)
+
+    async def _run_job_async(self, job: Dict[str, Any]) -> None:
+        self.busy += 1
+        error = None
+        try:
+            await self.handler(job)
+        except asyncio.CancelledError:
+            raise  # Shutting down: the row stays "working" and is requeued when its lease runs out
+        except Exception as e:
+            error = e
+        finally:
+            self.busy -= 1
+            self._slots.release()
+        await asyncio.to_thread(self._finish, job, error)
+        self._async_wake.set()  # The user's next message may be claimable now
+
+    def _run_thread(self, n: int) -> None:
+        while self._running:
+            self._thread_wake.clear()
+            job = self.box.claim()
+            if job is None:
+                self._thread_wake.wait(OUTBOX_POLL_SECONDS)
+                continue
+            self.busy += 1
+            error = None
+            try:
+                self.handler(job)
+            except Exception as e:
+                error = e
+            finally:
+                self.busy -= 1
+            self._finish(job, error)
+            self._thread_wake.set()
+
+    async def stop(self, timeout: float = 5.0) -> None:
+        """Stop claiming; in-flight jobs get `timeout` seconds to finish."""
+        self._running = False
+        self.notify()
+        pending = set(self._tasks) | ({self._dispatcher} if self._dispatcher else set())
+        if pending:
+            _, still_running = await asyncio.wait(pending, timeout=timeout)
+            for task in still_running:
+                task.cancel()
+        self._dispatcher, self._tasks = None, set()
+        for t in self._threads:
+            await asyncio.to_thread(t.join, timeout)
+        self._threads = []
+
+    def stats(self) -> Dict[str, Any]:
+        return {"workers": self.size, "busy": self.busy, **self.box.stats()}
@@ -0,0 +1,230 @@
+# profiler.py
+
+import asyncio
+import glob
+import math
+import os
+import random
+import sys
+import threading
+import time
+from datetime import datetime
+from typing import Any, Dict, Optional
+
+# Opt-in sampling profiler for individual requests.
+# main.py wraps each message in profile(); a fraction PROFILE_SAMPLE_RATE of them
+# is sampled: a background thread reads the handling thread's stack (or, in async
+# mode, the task's await chain) every PROFILE_INTERVAL_MS via sys._current_frames()
+# and counts identical stacks. The result is written in the collapsed-stack format
+# ("frame;frame;frame count" per line) under PROFILE_DIR, ready for flamegraph.pl
+# or speedscope; `cat instance/profiles/*.folded` merges several requests.
+#
+# Off (rate 0) costs one comparison per message and no thread runs. The rate can
+# be changed at runtime (POST /admin/profile, or "/profile <rate>" from ADMIN_IDS).
+# Files only hold code locations; user IDs appear masked in the log line only.
+
+DEBUG_VERBOSE = os.getenv("DEBUG_VERBOSE", "false").lower() == "true"
+
+def _get_num_env(var_name: str, default, cast=int):
+    try:
+        return cast(os.getenv(var_name, default))
+    except ValueError:
+        print(f"[Error] Invalid value for {var_name}, fallback to {default}")
+        return default
+
+# Share of messages to profile, 0..1 (0 = off).
+PROFILE_SAMPLE_RATE = _get_num_env("PROFILE_SAMPLE_RATE", 0.0, float)
+PROFILE_INTERVAL_MS = _get_num_env("PROFILE_INTERVAL_MS", 5.0, float)
+PROFILE_DIR = os.getenv("PROFILE_DIR", "instance/profiles")
+# Oldest profiles are deleted beyond this many files.
+PROFILE_MAX_FILES = _get_num_env("PROFILE_MAX_FILES", 200)
+
+def _clamp(rate: float, default: float = 0.0) -> float:
+    """Rate limited to 0..1; NaN / inf (every comparison with NaN is false) give the default."""
+    rate = float(rate)
+    if not math.isfinite(rate):
+        print(f"[Error] Invalid profile sample rate {rate}, fallback to {default:g}")
+        return default
+    return min(max(rate, 0.0), 1.0)
+
+_default_rate = _clamp(PROFILE_SAMPLE_RATE)
+_rate = _default_rate
+_stats = {"sampled": 0, "samples": 0, "written": 0, "errors": 0}
+
+def get_rate() -> float:
+    return _rate
+
+def set_rate(rate: float) -> float:
+    """
+    Change the sample rate at runtime (clamped to 0..1, a non-finite rate
+    restores PROFILE_SAMPLE_RATE); returns the new rate.
+    """
+    global _rate
+    _rate = _clamp(rate, _default_rate)
+    print(f"[profiler] sample rate set to {_rate:g}")
+    return _rate
+
+def get_stats() -> Dict[str, Any]:
+    return {"rate": _rate, "interval_ms": PROFILE_INTERVAL_MS, "active": len(_sampler.active), **_stats}
+
+def _frame_name(frame) -> str:
+    code = frame.f_code
+    return f"{os.path.basename(code.co_filename)}:{code.co_name}"
+
+def _thread_stack(frame, outermost=None) -> list:
+    """Innermost-first frames of a thread, up to and including outermost if given."""
+    stack = []
+    while frame is not None:
+        stack.append(frame)
+        if frame is outermost:
+            break
+        frame = frame.f_back
+    return stack
+
+def _task_stack(task: "asyncio.Task", loop_frame) -> list:
+    """
+    Innermost-first frames of an async task: its await chain while suspended,
+    or, while it runs, the loop thread's stack cut at the task's first frame
+    (so both kinds of samples share the same root).
+    """
+    coro, frames = task.get_coro(), []
+    while coro is not None:
+        frame = getattr(coro, "cr_frame", None) or getattr(coro, "gi_frame", None)
+        if frame is None:
+            break
+        if getattr(coro, "cr_running", False) and loop_frame is not None:
+            return _thread_stack(loop_frame, frames[0] if frames else frame)
+        frames.append(frame)
+        coro = getattr(coro, "cr_await", None) or getattr(coro, "gi_yieldfrom", None)
+    return frames[::-1]
+
+class _Profile:
+    """Collected stacks of one sampled request."""
+
+    __slots__ = ("label", "user", "thread_id", "task", "counts", "started")
+
+    def __init__(self, label: str, user: str, thread_id: int, task: Optional["asyncio.Task"]):
+        self.label, self.user, self.thread_id, self.task = label, user, thread_id, task
+        self.counts: Dict[str, int] = {}
+        self.started = time.perf_counter()
+
+    def __enter__(self):
+        _sampler.add(self)
+        return self
+
+    def __exit__(self, *exc):
+        _sampler.remove(self)
+        _write(self, time.perf_counter() - self.started)
+        return False
+
+    async def __aenter__(self):
+        return self.__enter__()
+
+    async def __aexit__(self, *exc):
+        _sampler.remove(self)
+        await asyncio.to_thread(_write, self, time.perf_counter() - self.started)
+        return False
+
+class _NullProfile:
+    """What profile() returns for requests that are not sampled."""
+
+    __slots__ = ()
+
+    def __enter__(self):
+        return None
+
+    def __exit__(self, *exc):
+        return False
+
+    async def __aenter__(self):
+        return None
+
+    async def __aexit__(self, *exc):
+        return False
+
+_NULL = _NullProfile()
+
+class _Sampler:
+    """One daemon thread, started on first use, idle while nothing is profiled."""
+
+    def __init__(self):
+        self.active: set = set()
+        self._cond = threading.Condition()
+        self._thread: Optional[threading.Thread] = None
+
+    def add(self, profile: _Profile) -> None:
+        with self._cond:
+            self.active.add(profile)
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name="profiler", daemon=True)
+                self._thread.start()
+            self._cond.notify()
+
+    def remove(self, profile: _Profile) -> None:
+        with self._cond:
+            self.active.discard(profile)
+
+    def _run(self) -> None:
+        interval = max(PROFILE_INTERVAL_MS, 1.0) / 1000
+        while True:
+            with self._cond:
+                while not self.active:
+                    self._cond.wait()
+                profiles = list(self.active)
+            try:
+                frames = sys._current_frames()
+                for p in profiles:
+                    frame = frames.get(p.thread_id)
+                    stack = _task_stack(p.task, frame) if p.task is not None else _thread_stack(frame)
+                    if stack:
+                        key = ";".join(_frame_name(f) for f in reversed(stack))
+                        p.counts[key] = p.counts.get(key, 0) + 1
+                _stats["samples"] += 1
+                del frames
+            except Exception as e:
+                _stats["errors"] += 1
+                if DEBUG_VERBOSE:
+                    print(f"[profiler][sample-error] {type(e).__name__}: {e}")
+            time.sleep(interval)
+
+_sampler = _Sampler()
+
+def profile(label: str, masked_user: str = ""):
+    """
+    Context manager (with / async with) around one request; samples it with
+    probability get_rate(). Pass the user ID already masked.
+    """
+    if _rate <= 0 or (_rate < 1 and random.random() >= _rate):
+        return _NULL
+    try:
+        task = asyncio.current_task()
+    except RuntimeError:
+        task = None  # Worker thread, no running loop
+    _stats["sampled"] += 1
+    return _Profile(label, masked_user, threading.get_ident(), task)
+
+def _prune() -> None:
+    files = sorted(glob.glob(os.path.join(PROFILE_DIR, "*.folded")))
+    for path in files[:max(len(files) - PROFILE_MAX_FILES, 0)]:
+        try:
+            os.remove(path)
+        except OSError:
+            pass
+
+def _write(p: _Profile, seconds: float) -> None:
+    if not p.counts:
+        return  # Finished before the first sample
+    stamp = datetime.now().strftime("%Y%m%d-%H%M%S-%f")
+    path = os.path.join(PROFILE_DIR, f"{stamp}-{p.label}-{round(seconds * 1000)}ms.folded")
+    try:
+        os.makedirs(PROFILE_DIR, exist_ok=True)
+        with open(path, "w", encoding="utf-8") as f:
+            for stack, count in sorted(p.counts.items()):
+                f.write(f"{p.label};{stack} {count}\n")
+        _stats["written"] += 1
+        _prune()
+        print(f"[profiler] {p.label} user={p.user} {seconds * 1000:.0f}ms "
+              f"samples={sum(p.counts.values())} -> {path}")
+    except OSError as e:
+        _stats["errors"] += 1
+        print(f"[profiler][write-error] {type(e).__name__}: {e}")
@@ -0,0 +1,203 @@
+# rate_limit.py
+
+import asyncio
+import email.utils
+import os
+import random
+import threading
+import time
+from typing import Any, Dict, Optional
+
+# Shared client-side rate limiting for outgoing API calls.
+# Each endpoint (LINE reply, LINE push, OpenAI) has a token bucket: callers take
+# a token before calling and wait in line when the budget is used up, instead of
+# firing and collecting 429s. A 429 with Retry-After pauses the whole endpoint,
+# so every caller backs off together rather than each retrying on its own.
+
+def _get_num_env(var_name: str, default, cast=float):
+    try:
+        return cast(os.getenv(var_name, default))
+    except ValueError:
+        print(f"[Error] Invalid value for {var_name}, fallback to {default}")
+        return default
+
+# Requests per second per endpoint (burst = one second's worth); 0 disables the limit.
+RATE_LIMITS = {
+    "line_reply": _get_num_env("RATE_LIMIT_LINE_REPLY", 100.0),
+    "line_push": _get_num_env("RATE_LIMIT_LINE_PUSH", 100.0),
+    "openai": _get_num_env("RATE_LIMIT_OPENAI", 8.0),
+}
+
+# Retry backoff: base * 2^(attempt-1), capped, with jitter.
+RATE_LIMIT_BACKOFF_BASE = _get_num_env("RATE_LIMIT_BACKOFF_BASE", 1.0)
+RATE_LIMIT_BACKOFF_MAX = _get_num_env("RATE_LIMIT_BACKOFF_MAX", 30.0)
+
+class TokenBucket:
+    """
+    Token bucket that queues callers in arrival order.
+    A caller reserves a token up front (the balance may go negative) and sleeps
+    until its slot, so waiting callers are spaced 1/rate apart.
+    """
+
+    def __init__(self, name: str, rate: float, burst: Optional[float] = None):
+        self.name = name
+        self.rate = rate
+        self.burst = max(1.0, burst if burst is not None else rate)
+        self._tokens = self.burst
+        self._updated = time.monotonic()  # In the future while paused
+        self._paused_until = 0.0
+        self._lock = threading.Lock()
+        self.acquired = 0
+        self.delayed = 0
+        self.waiting = 0
+        self.throttled = 0
+        self._wait_total = 0.0
+        self._wait_max = 0.0
+
+    def _reserve(self) -> float:
+        """Take a token, return how long the caller has to wait for it."""
+        with self._lock:
+            now = time.monotonic()
+            if now > self._updated:
+                self._tokens = min(self.burst, self._tokens + (now - self._updated) * self.rate)
+                self._updated = now
+            self._tokens -= 1
+            wait = (self._updated - now) + max(0.0, -self._tokens) / self.rate
+            self.acquired += 1
+            if wait > 0:
+                self.delayed += 1
+                self._wait_total += wait
+                self._wait_max = max(self._wait_max, wait)
+            return wait
+
+    def _pause_left(self) -> float:
+        return self._paused_until - time.monotonic()
+
+    def acquire(self) -> None:
+        """Block until the call may go out."""
+        if self.rate <= 0:
+            return
+        wait = self._reserve()
+        if wait <= 0:
+            return
+        self.waiting += 1
+        try:
+            time.sleep(wait)
+            while self._pause_left() > 0:  # Paused by a 429 while we slept
+                time.sleep(self._pause_left())
+        finally:
+            self.waiting -= 1
+
+    async def acquire_async(self) -> None:
+        """Async version of acquire(), waits with asyncio.sleep."""
+        if self.rate <= 0:
+            return
+        wait = self._reserve()
+        if wait <= 0:
+            return
+        self.waiting += 1
+        try:
+            await asyncio.sleep(wait)
+            while self._pause_left() > 0:
+                await asyncio.sleep(self._pause_left())
+        finally:
+            self.waiting -= 1
+
+    def penalize(self, retry_after: Optional[float]) -> None:
+        """The endpoint answered 429: stop sending for `retry_after` seconds."""
+        with self._lock:
+            self.throttled += 1
+            if not retry_after or retry_after <= 0:
+                return
+            until = time.monotonic() + retry_after
+            self._paused_until = max(self._paused_until, until)
+            if until > self._updated:
+                self._tokens = min(self._tokens, 0.0)
+                self._updated = until
+        print(f"[rate_limit][{self.name}] 429, pausing {retry_after:.1f}s")
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            now = time.monotonic()
+            tokens = self._tokens
+            if now > self._updated:
+                tokens = min(self.burst, tokens + (now - self._updated) * self.rate)
+            return {
+                "rate": self.rate,
+                "burst": self.burst,
+                "tokens": round(tokens, 2),
+                "waiting": self.waiting,
+                "acquired": self.acquired,
+                "delayed": self.delayed,
+                "wait_avg_ms": round(self._wait_total / self.delayed * 1000, 1) if self.delayed else 0.0,
+                "wait_max_ms": round(self._wait_max * 1000, 1),
+                "throttled": self.throttled,
+                "paused_for_s": round(max(0.0, self._paused_until - now), 2),
+            }
+
+_limiters = {name: TokenBucket(name, rate) for name, rate in RATE_LIMITS.items()}
+
+def limiter(name: str) -> TokenBucket:
+    return _limiters[name]
+
+def get_stats() -> Dict[str, Dict[str, Any]]:
+    return {name: bucket.stats() for name, bucket in _limiters.items()}
+
+# --- Error inspection and backoff ---
+
+def error_status(e: BaseException) -> Optional[int]:
+    """HTTP status of a LINE ApiException or OpenAI APIStatusError, else None."""
+    status = getattr(e, "status", None) or getattr(e, "status_code", None)
+    return status if isinstance(status, int) else None
+
+def _headers(e: BaseException):
+    headers = getattr(e, "headers", None)
+    if headers is None:
+        headers = getattr(getattr(e, "response", None), "headers", None)
+    return headers or {}
+
+def retry_after(e: BaseException) -> Optional[float]:
+    """Seconds from a Retry-After (or OpenAI retry-after-ms) header, if any."""
+    headers = _headers(e)
+    try:
+        ms = headers.get("retry-after-ms")
+        if ms:
+            return float(ms) / 1000
+        value = headers.get("Retry-After") or headers.get("retry-after")
+    except Exception:
+        return None
+    if not value:
+        return None
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        pass
+    try:
+        when = email.utils.parsedate_to_datetime(value)  # HTTP-date form
+        return max(0.0, when.timestamp() - time.time())
+    except (TypeError, ValueError):
+        return None
+
+def is_retryable(e: BaseException) -> bool:
+    """429, 5xx and network errors are worth retrying; other 4xx are not."""
+    status = error_status(e)
+    return status is None or status == 429 or status >= 500
+
+def backoff_delay(attempt: int, retry_after_s: Optional[float] = None) -> float:
+    """
+    Delay before retry number `attempt` (1-based).
+    Retry-After wins when given; otherwise exponential with jitter, so workers
+    that failed together do not retry together.
+    """
+    if retry_after_s is not None:
+        return retry_after_s + random.uniform(0, RATE_LIMIT_BACKOFF_BASE / 2)
+    ceiling = min(RATE_LIMIT_BACKOFF_MAX, RATE_LIMIT_BACKOFF_BASE * 2 ** (attempt - 1))
+    return ceiling / 2 + random.uniform(0, ceiling / 2)
+
+def note_failure(name: str, e: BaseException) -> Optional[float]:
+    """Record a failed call; on 429 pause the endpoint. Returns Retry-After seconds."""
+    if error_status(e) != 429:
+        return None
+    seconds = retry_after(e)
+    _limiters[name].penalize(seconds)
+    return seconds
@@ -0,0 +1,197 @@
+# seatmap.py
+
+import hashlib
+import json
+import os
+import threading
+from typing import Any, Dict, List, Optional
+
+try:
+    from PIL import Image, ImageDraw  # Optional: per-table seat maps
+except ImportError:
+    Image = ImageDraw = None
+
+# Per-table seat maps.
+# Reads table positions from a JSON config and renders, for every table, a copy
+# of the seat map with that table highlighted:
+# - WebP (linked, small download)
+# - JPEG (LINE image message, which does not accept WebP)
+# - small JPEG preview cropped around the table
+# Files are rendered once (at startup or with tools/render_seatmaps.py) into
+# static/maps/tables/ and reused while the base image and config are unchanged.
+# Without Pillow or a config, seat answers keep using the full map.
+
+DEBUG_VERBOSE = os.getenv("DEBUG_VERBOSE", "false").lower() == "true"
+
+def _get_int_env(var_name: str, default: int) -> int:
+    try:
+        return int(os.getenv(var_name, default))
+    except ValueError:
+        print(f"[Error] Invalid integer value for {var_name}, fallback to {default}")
+        return default
+
+SEATMAP_TABLES_PATH = os.getenv("SEATMAP_TABLES_PATH", "instance/seatmap_tables.json")
+STATIC_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "static")
+MAPS_DIR = os.path.join(STATIC_DIR, "maps")
+RENDER_SUBDIR = "maps/tables"  # Relative to static/, also the URL path
+SEATMAP_MAX_WIDTH = _get_int_env("SEATMAP_MAX_WIDTH", 1080)
+SEATMAP_PREVIEW_WIDTH = _get_int_env("SEATMAP_PREVIEW_WIDTH", 240)
+WEBP_QUALITY = 75
+JPEG_QUALITY = 80
+
+HIGHLIGHT_COLOR = (220, 40, 60)
+
+def _table_key(value: Any) -> str:
+    # Seat numbers come from the DB as int; config keys are strings ("1", "VIP").
+    return str(value).strip()
+
+class SeatMapRenderer:
+    """Renders and caches the highlighted map variants for one config."""
+
+    def __init__(self, config_path: str = SEATMAP_TABLES_PATH):
+        self.config_path = config_path
+        self.config: Dict[str, Any] = {}
+        self.tables: Dict[str, Dict[str, Any]] = {}
+        self._images: Dict[str, Dict[str, str]] = {}
+        self._lock = threading.Lock()
+        self.rendered = 0
+        self.reused = 0
+        self.enabled = self._load()
+
+    def _load(self) -> bool:
+        if Image is None:
+            print("[seatmap] Pillow not installed, per-table maps disabled")
+            return False
+        try:
+            with open(self.config_path, "r", encoding="utf-8") as f:
+                self.config = json.load(f)
+        except FileNotFoundError:
+            if DEBUG_VERBOSE:
+                print(f"[seatmap] no config at {self.config_path}, per-table maps disabled")
+            return False
+        except Exception as e:
+            print(f"[seatmap][config-error] {type(e).__name__}: {e}")
+            return False
+        self.tables = {_table_key(k): v for k, v in (self.config.get("tables") or {}).items()}
+        base = os.path.join(MAPS_DIR, self.config.get("base_image", ""))
+        if not self.tables or not os.path.isfile(base):
+            print(f"[seatmap] config has no tables or base image {base} is missing, disabled")
+            return False
+        self.base_path = base
+        return True
+
+    def _fingerprint(self, table: str) -> str:
+        """Changes whenever the output would: base image, table entry or render settings."""
+        st = os.stat(self.base_path)
+        raw = json.dumps([
+            os.path.basename(self.base_path), st.st_size, st.st_mtime_ns,
+            self.tables[table], SEATMAP_MAX_WIDTH, SEATMAP_PREVIEW_WIDTH,
+            WEBP_QUALITY, JPEG_QUALITY,
+        ], sort_keys=True)
+        return hashlib.sha256(raw.encode("utf-8")).hexdigest()[:10]
+
+    def _names(self, table: str) -> Dict[str, str]:
+        safe = "".join(ch if ch.isalnum() else "_" for ch in table)
+        stem = f"{RENDER_SUBDIR}/table-{safe}-{self._fingerprint(table)}"
+        return {"webp": f"{stem}.webp", "jpeg": f"{stem}.jpg", "preview": f"{stem}-preview.jpg"}
+
+    def _render(self, base, scale: float, table: str, names: Dict[str, str]) -> None:
+        spec = self.tables[table]
+        x, y = spec["x"] * scale, spec["y"] * scale
+        r = spec.get("r", 60) * scale
+
+        overlay = Image.new("RGBA", base.size, (0, 0, 0, 0))
+        draw = ImageDraw.Draw(overlay)
+        draw.ellipse((x - r, y - r, x + r, y + r), fill=HIGHLIGHT_COLOR + (60,))
+        width = max(3, int(r / 8))
+        for pad in (0, width * 2):
+            draw.ellipse((x - r - pad, y - r - pad, x + r + pad, y + r + pad),
+                         outline=HIGHLIGHT_COLOR + (255,), width=width)
+        image = Image.alpha_composite(base, overlay).convert("RGB")
+
+        os.makedirs(os.path.join(STATIC_DIR, RENDER_SUBDIR), exist_ok=True)
+        image.save(os.path.join(STATIC_DIR, names["webp"]), "WEBP", quality=WEBP_QUALITY, method=6)
+        image.save(os.path.join(STATIC_DIR, names["jpeg"]), "JPEG", quality=JPEG_QUALITY,
+                   optimize=True, progressive=True)
+
+        # Preview: square crop around the table, so the thumbnail already shows it.
+        half = max(r * 4, min(image.size) / 4)
+        box = (max(0, x - half), max(0, y - half),
+               min(image.width, x + half), min(image.height, y + half))
+        preview = image.crop(tuple(int(v) for v in box))
+        preview.thumbnail((SEATMAP_PREVIEW_WIDTH, SEATMAP_PREVIEW_WIDTH))
+        preview.save(os.path.join(STATIC_DIR, names["preview"]), "JPEG", quality=JPEG_QUALITY, optimize=True)
+
+    def _base(self):
+        base = Image.open(self.base_path)
+        scale = min(1.0, SEATMAP_MAX_WIDTH / base.width)
+        if scale < 1.0:
+            base = base.resize((SEATMAP_MAX_WIDTH, round(base.height * scale)), Image.LANCZOS)
+        return base.convert("RGBA"), scale
+
+    def render_all(self, force: bool = False) -> Dict[str, Dict[str, str]]:
+        """Make sure every table's files exist; render only missing or outdated ones."""
+        if not self.enabled:
+            return {}
+        with self._lock:
+            base = scale = None
+            for table in self.tables:
+                names = self._names(table)
+                exists = all(os.path.isfile(os.path.join(STATIC_DIR, p)) for p in names.values())
+                if exists and not force:
+                    self.reused += 1
+                else:
+                    if base is None:
+                        base, scale = self._base()
+                    self._render(base, scale, table, names)
+                    self.rendered += 1
+                self._images[table] = names
+            self._remove_stale()
+        print(f"[seatmap] {len(self._images)} tables ready (rendered={self.rendered}, reused={self.reused})")
+        return dict(self._images)
+
+    def _remove_stale(self) -> None:
+        folder = os.path.join(STATIC_DIR, RENDER_SUBDIR)
+        keep = {os.path.basename(p) for names in self._images.values() for p in names.values()}
+        for name in os.listdir(folder):
+            if name.startswith("table-") and name not in keep:
+                try:
+                    os.remove(os.path.join(folder, name))
+                except OSError:
+                    pass
+
+    def images_for(self, table: Any) -> Optional[Dict[str, str]]:
+        """Paths (relative to static/) of a table's map variants, or None."""
+        if not self.enabled:
+            return None
+        key = _table_key(table)
+        if key not in self.tables:
+            return None
+        if key not in self._images:
+            self.render_all()
+        return self._images.get(key)
+
+    def stats(self) -> Dict[str, Any]:
+        return {"enabled": self.enabled, "tables": len(self.tables),
+                "ready": len(self._images), "rendered": self.rendered, "reused": self.reused}
+
+_renderer: Optional[SeatMapRenderer] = None
+_renderer_lock = threading.Lock()
+
+def get_renderer() -> SeatMapRenderer:
+    global _renderer
+    if _renderer is None:
+        with _renderer_lock:
+            if _renderer is None:
+                _renderer = SeatMapRenderer()
+    return _renderer
+
+def images_for(tables: List[Any]) -> List[Dict[str, Any]]:
+    """Map variants for each table that has a configured position, in order."""
+    renderer = get_renderer()
+    result = []
+    for table in tables:
+        names = renderer.images_for(table)
+        if names:
+            result.append({"table": table, **names})
+    return result
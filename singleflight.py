@@ -0,0 +1,127 @@
+# singleflight.py
+
+import asyncio
+import os
+import threading
+from typing import Any, Awaitable, Callable, Dict, Hashable, Optional
+
+# Request coalescing ("single flight").
+# Concurrent calls with the same key share one in-flight call: the first caller
+# (leader) runs it, the others wait for its result. A waiter that waits longer
+# than `wait_seconds`, or whose leader failed, falls back to its own call.
+
+SINGLEFLIGHT_ENABLED = os.getenv("SINGLEFLIGHT_ENABLED", "true").lower() == "true"
+
+try:
+    SINGLEFLIGHT_WAIT_SECONDS = float(os.getenv("SINGLEFLIGHT_WAIT_SECONDS", "20"))
+except ValueError:
+    print("[Error] Invalid value for SINGLEFLIGHT_WAIT_SECONDS, fallback to 20")
+    SINGLEFLIGHT_WAIT_SECONDS = 20.0
+
+class _Call:
+    __slots__ = ("event", "result", "error")
+
+    def __init__(self):
+        self.event = threading.Event()
+        self.result = None
+        self.error: Optional[BaseException] = None
+
+class _Stats:
+    def __init__(self):
+        self.leaders = 0
+        self.shared = 0
+        self.fallbacks = 0
+
+    def as_dict(self, in_flight: int) -> Dict[str, int]:
+        return {"leaders": self.leaders, "shared": self.shared,
+                "fallbacks": self.fallbacks, "in_flight": in_flight}
+
+class SingleFlight:
+    """Coalescing for the threaded execution path."""
+
+    def __init__(self, wait_seconds: float = SINGLEFLIGHT_WAIT_SECONDS):
+        self.wait_seconds = wait_seconds
+        self._calls: Dict[Hashable, _Call] = {}
+        self._lock = threading.Lock()
+        self._stats = _Stats()
+
+    def do(self, key: Optional[Hashable], fn: Callable[[], Any]) -> Any:
+        if key is None:
+            return fn()
+
+        with self._lock:
+            call = self._calls.get(key)
+            leader = call is None
+            if leader:
+                call = self._calls[key] = _Call()
+                self._stats.leaders += 1
+
+        if leader:
+            try:
+                call.result = fn()
+                return call.result
+            except BaseException as e:
+                call.error = e
+                raise
+            finally:
+                with self._lock:
+                    self._calls.pop(key, None)
+                call.event.set()
+
+        if call.event.wait(self.wait_seconds) and call.error is None:
+            with self._lock:
+                self._stats.shared += 1
+            return call.result
+
+        with self._lock:
+            self._stats.fallbacks += 1
+        return fn()
+
+    def stats(self) -> Dict[str, int]:
+        with self._lock:
+            return self._stats.as_dict(len(self._calls))
+
+class AsyncSingleFlight:
+    """Coalescing for the asyncio execution path (one event loop)."""
+
+    def __init__(self, wait_seconds: float = SINGLEFLIGHT_WAIT_SECONDS):
+        self.wait_seconds = wait_seconds
+        self._calls: Dict[Hashable, asyncio.Future] = {}
+        self._stats = _Stats()
+
+    async def do(self, key: Optional[Hashable], fn: Callable[[], Awaitable[Any]]) -> Any:
+        if key is None:
+            return await fn()
+
+        future = self._calls.get(key)
+        if future is not None and future.get_loop() is not asyncio.get_running_loop():
+            future = None  # Left over from another (closed) loop
+
+        if future is None:
+            future = asyncio.get_running_loop().create_future()
+            self._calls[key] = future
+            self._stats.leaders += 1
+            try:
+                result = await fn()
+                future.set_result(result)
+                return result
+            except BaseException as e:
+                # Waiters only see a failure and fall back to their own call.
+                future.set_exception(RuntimeError(f"single-flight leader failed: {type(e).__name__}"))
+                future.exception()  # Mark retrieved, avoids "never retrieved" warnings
+                raise
+            finally:
+                if self._calls.get(key) is future:
+                    del self._calls[key]
+
+        try:
+            result = await asyncio.wait_for(asyncio.shield(future), self.wait_seconds)
+            self._stats.shared += 1
+            return result
+        except Exception:
+            # Timed out or the leader failed.
+            self._stats.fallbacks += 1
+            return await fn()
+
+    def stats(self) -> Dict[str, int]:
+        return self._stats.as_dict(len(self._calls))
@@ -0,0 +1,216 @@
+# static_assets.py
+
+import gzip
+import hashlib
+import json
+import mimetypes
+import os
+import shutil
+import threading
+from typing import Any, Dict, Optional
+
+from starlette.datastructures import Headers
+from starlette.responses import FileResponse, Response
+from starlette.staticfiles import NotModifiedResponse, StaticFiles
+
+import seatmap
+
+try:
+    from PIL import Image  # Optional: responsive image widths
+except ImportError:
+    Image = None
+
+# Static asset pipeline.
+# build() copies every file under static/ to static/build/ with a content hash in
+# its name, adds narrower copies of the images (STATIC_ASSET_WIDTHS) and gzip
+# copies of text assets, and writes static/build/manifest.json.
+# asset_url() turns "maps/wedding_map.webp" into the fingerprinted URL (optionally
+# the variant for a given width), so the URL changes whenever the file does and
+# clients may cache it forever. CachedStaticFiles serves those paths with
+# "immutable" Cache-Control; ETag / 304 handling comes from Starlette.
+# Run tools/build_static.py in the deploy build step; startup builds anything missing.
+
+DEBUG_VERBOSE = os.getenv("DEBUG_VERBOSE", "false").lower() == "true"
+
+def _get_int_env(var_name: str, default: int) -> int:
+    try:
+        return int(os.getenv(var_name, default))
+    except ValueError:
+        print(f"[Error] Invalid integer value for {var_name}, fallback to {default}")
+        return default
+
+def _get_widths_env(var_name: str, default: str) -> list[int]:
+    try:
+        return sorted({int(w) for w in os.getenv(var_name, default).split(",") if w.strip()})
+    except ValueError:
+        print(f"[Error] Invalid width list for {var_name}, fallback to {default}")
+        return sorted(int(w) for w in default.split(","))
+
+STATIC_BASE_URL = os.getenv("STATIC_BASE_URL", "http://127.0.0.1:8000/static")
+STATIC_DIR = seatmap.STATIC_DIR
+BUILD_SUBDIR = "build"  # Relative to static/, also the URL path
+MANIFEST_PATH = os.path.join(STATIC_DIR, BUILD_SUBDIR, "manifest.json")
+STATIC_ASSET_WIDTHS = _get_widths_env("STATIC_ASSET_WIDTHS", "240,480,1080")
+STATIC_MAX_AGE = _get_int_env("STATIC_MAX_AGE", 3600)  # Non-fingerprinted files
+
+IMMUTABLE_CACHE = "public, max-age=31536000, immutable"
+# Everything under these folders has a content hash in its name.
+IMMUTABLE_PREFIXES = (f"{BUILD_SUBDIR}/", f"{seatmap.RENDER_SUBDIR}/")
+IMAGE_EXTENSIONS = {".png", ".jpg", ".jpeg", ".webp"}
+GZIP_EXTENSIONS = {".css", ".js", ".json", ".svg", ".html", ".txt"}
+
+_manifest: Optional[Dict[str, Any]] = None
+_lock = threading.Lock()
+
+def _file_hash(path: str) -> str:
+    h = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(1 << 16), b""):
+            h.update(chunk)
+    return h.hexdigest()[:10]
+
+def _sources():
+    """Relative paths of the files the pipeline fingerprints."""
+    for root, dirs, files in os.walk(STATIC_DIR):
+        rel_root = os.path.relpath(root, STATIC_DIR).replace(os.sep, "/")
+        rel_root = "" if rel_root == "." else rel_root + "/"
+        dirs[:] = [d for d in dirs if not d.startswith(".")
+                   and not any(f"{rel_root}{d}/".startswith(p) for p in IMMUTABLE_PREFIXES)]
+        for name in sorted(files):
+            if not name.startswith("."):
+                yield rel_root + name
+
+def _write_image_variant(src: str, dest: str, width: int) -> None:
+    with Image.open(src) as image:
+        height = round(image.height * width / image.width)
+        resized = image.resize((width, height), Image.LANCZOS)
+        ext = os.path.splitext(dest)[1].lower()
+        if ext in {".jpg", ".jpeg"}:
+            resized.convert("RGB").save(dest, "JPEG", quality=80, optimize=True, progressive=True)
+        elif ext == ".webp":
+            resized.save(dest, "WEBP", quality=75, method=6)
+        else:
+            resized.save(dest, "PNG", optimize=True)
+
+def _build_entry(rel: str, fingerprint: str) -> Dict[str, Any]:
+    src = os.path.join(STATIC_DIR, rel)
+    stem, ext = os.path.splitext(rel)
+    target = f"{BUILD_SUBDIR}/{stem}.{fingerprint}{ext}"
+    entry: Dict[str, Any] = {"path": target, "hash": fingerprint, "variants": {}}
+
+    def _out(path: str) -> str:
+        full = os.path.join(STATIC_DIR, path)
+        os.makedirs(os.path.dirname(full), exist_ok=True)
+        return full
+
+    if not os.path.isfile(os.path.join(STATIC_DIR, target)):
+        shutil.copyfile(src, _out(target))
+
+    if ext.lower() in IMAGE_EXTENSIONS and Image is not None:
+        try:
+            with Image.open(src) as image:
+                entry["width"] = image.width
+            for width in STATIC_ASSET_WIDTHS:
+                if width >= entry["width"]:
+                    break  # Never upscale; the original covers the larger widths
+                variant = f"{BUILD_SUBDIR}/{stem}.{fingerprint}.w{width}{ext}"
+                if not os.path.isfile(os.path.join(STATIC_DIR, variant)):
+                    _write_image_variant(src, _out(variant), width)
+                entry["variants"][str(width)] = variant
+        except Exception as e:
+            print(f"[static_assets][image-error] {rel}: {type(e).__name__}: {e}")
+
+    if ext.lower() in GZIP_EXTENSIONS:
+        gz = os.path.join(STATIC_DIR, target + ".gz")
+        if not os.path.isfile(gz):
+            with open(src, "rb") as f:
+                data = gzip.compress(f.read(), compresslevel=9, mtime=0)
+            if len(data) < os.path.getsize(src):
+                with open(gz, "wb") as f:
+                    f.write(data)
+    return entry
+
+def _remove_stale(manifest: Dict[str, Any]) -> None:
+    keep = {os.path.normpath(MANIFEST_PATH)}
+    for entry in manifest.values():
+        for path in [entry["path"], *entry["variants"].values()]:
+            full = os.path.normpath(os.path.join(STATIC_DIR, path))
+            keep.update({full, full + ".gz"})
+    for root, _, files in os.walk(os.path.join(STATIC_DIR, BUILD_SUBDIR)):
+        for name in files:
+            full = os.path.normpath(os.path.join(root, name))
+            if full not in keep:
+                try:
+                    os.remove(full)
+                except OSError:
+                    pass
+
+def build() -> Dict[str, Any]:
+    """Fingerprint static/ into static/build/; only new or changed files are processed."""
+    global _manifest
+    with _lock:
+        os.makedirs(os.path.dirname(MANIFEST_PATH), exist_ok=True)
+        manifest = {rel: _build_entry(rel, _file_hash(os.path.join(STATIC_DIR, rel)))
+                    for rel in _sources()}
+        tmp = MANIFEST_PATH + ".tmp"
+        with open(tmp, "w", encoding="utf-8") as f:
+            json.dump(manifest, f, ensure_ascii=False, indent=2, sort_keys=True)
+        os.replace(tmp, MANIFEST_PATH)
+        _remove_stale(manifest)
+        _manifest = manifest
+    print(f"[static_assets] {len(manifest)} assets in manifest")
+    return manifest
+
+def get_manifest() -> Dict[str, Any]:
+    global _manifest
+    if _manifest is None:
+        try:
+            with open(MANIFEST_PATH, "r", encoding="utf-8") as f:
+                _manifest = json.load(f)
+        except FileNotFoundError:
+            return {}  # Not built yet; retried on the next call
+        except Exception as e:
+            print(f"[static_assets][manifest-error] {type(e).__name__}: {e}")
+            _manifest = {}
+    return _manifest
+
+def asset_url(path: str, width: Optional[int] = None, base_url: str = STATIC_BASE_URL) -> str:
+    """
+    Public URL of a static file (path relative to static/, e.g. "maps/wedding_map.webp").
+    Returns the fingerprinted copy when the file is in the manifest; with width,
+    the smallest variant at least that wide. Unknown files keep their plain URL.
+    """
+    entry = get_manifest().get(path)
+    if not entry:
+        return f"{base_url}/{path}"
+    chosen = entry["path"]
+    if width:
+        wider = [int(w) for w in entry["variants"] if int(w) >= width]
+        if wider:
+            chosen = entry["variants"][str(min(wider))]
+    return f"{base_url}/{chosen}"
+
+class CachedStaticFiles(StaticFiles):
+    """StaticFiles with Cache-Control and precompressed (.gz) responses."""
+
+    def file_response(self, full_path, stat_result, scope, status_code: int = 200) -> Response:
+        request_headers = Headers(scope=scope)
+        rel = os.path.relpath(full_path, self.directory).replace(os.sep, "/")
+        headers = {"Cache-Control": IMMUTABLE_CACHE if rel.startswith(IMMUTABLE_PREFIXES)
+                   else f"public, max-age={STATIC_MAX_AGE}"}
+
+        gz_path = f"{full_path}.gz"
+        has_gz = os.path.isfile(gz_path)
+        if has_gz:
+            headers["Vary"] = "Accept-Encoding"
+        if has_gz and "gzip" in request_headers.get("accept-encoding", ""):
+            headers["Content-Encoding"] = "gzip"
+            media_type = mimetypes.guess_type(str(full_path))[0] or "text/plain"
+            response = FileResponse(gz_path, status_code=status_code, headers=headers,
+                                    media_type=media_type, stat_result=os.stat(gz_path))
+        else:
+            response = FileResponse(full_path, status_code=status_code, headers=headers,
+                                    stat_result=stat_result)
+        if self.is_not_modified(response.headers, request_headers):
+            return NotModifiedResponse(response.headers)
+        return response
@@ -0,0 +1,68 @@
+# tests/test_dead_letters.py
+
+import os
+import sys
+
+import pytest
+
+BASE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__))) # Go to project root path
+sys.path.insert(0, BASE_DIR)
+
+import dead_letters
+from dead_letters import DeadLetterStore
+
+# Rotation must never delete the only copy of a message that was not replayed.
+
+
+@pytest.fixture
+def store(tmp_path, monkeypatch):
+    monkeypatch.setattr(dead_letters, "DEAD_LETTER_MAX_BYTES", 1)  # rotate before every write
+    monkeypatch.setattr(dead_letters, "DEAD_LETTER_KEEP_FILES", 2)
+    s = DeadLetterStore(str(tmp_path / "dead_letters.jsonl"))
+    yield s
+    s.close()
+
+
+def _write(store, message_id, user_id="U123"):
+    store.write(message_id, user_id, "text", "error")
+
+
+def _ids(store, path):
+    return [rec["id"] for rec in store._read(path)]
+
+
+def test_rotation_keeps_files_with_unsent_records(store, capsys):
+    for n in range(6):
+        _write(store, f"m{n}")
+    # m0..m4 were rotated out, m5 is active: nothing was replayed, nothing is lost.
+    assert [rec["id"] for rec in store.records()] == [f"m{n}" for n in range(6)]
+    assert len(store.rotated_files()) == 5
+    assert "never replayed" in capsys.readouterr().out
+
+
+def test_rotation_deletes_replayed_files(store):
+    for n in range(3):
+        _write(store, f"m{n}")
+    for n in range(3):
+        store.mark_sent(f"m{n}")
+    for n in range(3, 6):
+        _write(store, f"m{n}")
+    # Replayed m0..m2 are pruned down to the keep limit; unsent m3, m4 stay.
+    kept = [i for path in store.rotated_files() for i in _ids(store, path)]
+    assert kept == ["m3", "m4"]
+
+
+def test_rotation_deletes_files_without_replayable_records(store):
+    _write(store, "", user_id="U12***")  # old format: no id, masked recipient
+    for n in range(1, 5):
+        _write(store, f"m{n}")
+        store.mark_sent(f"m{n}")
+    kept = [i for path in store.rotated_files() for i in _ids(store, path)]
+    assert kept == ["m2", "m3"]
+
+
+def test_files_are_owner_only(store):
+    _write(store, "m0")
+    store.mark_sent("m0")
+    assert os.stat(store.path).st_mode & 0o777 == 0o600
+    assert os.stat(store.sent_path).st_mode & 0o777 == 0o600
@@ -0,0 +1,100 @@
+# tests/test_family_query.py
+
+import os
+import sys
+
+import pytest
+
+# Pin the pool to one connection so the TEMP fixture table below is visible
+# to every query (temp tables live per session and shadow public.guests).
+os.environ["DB_POOL_MIN"] = "1"
+os.environ["DB_POOL_MAX"] = "1"
+
+BASE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__))) # Go to project root path
+sys.path.insert(0, BASE_DIR)
+
+psycopg2 = pytest.importorskip("psycopg2")
+
+from db.db_connection import get_pool, run_query
+from db.guest_index import LOAD_SQL, _Snapshot
+from db.queries import find_guest_and_family, find_guest_and_family_single
+
+# The single-statement family query must return the same payload as the
+# multi-query path, members in the same order, and so must the in-process
+# guest index built from the same rows. Needs a PostgreSQL database
+# with the guests table (RENDER_DATABASE_URL / REMOTE_DATABASE_URL / PG*).
+
+if not any(os.getenv(v) for v in ("RENDER_DATABASE_URL", "REMOTE_DATABASE_URL", "PGHOST", "PGDATABASE")):
+    pytest.skip("no database configured", allow_module_level=True)
+
+FIXTURE = [
+    # guest_code, name, alias, seat_number, attending, group_code, relation_role, representative, display_name
+    ("T001", "王小明", "小明", 1, True, "GR001", "self", None, "王小明"),
+    ("T002", "李美華", None, 1, True, "GR001", "spouse", "T001", None),
+    ("T003", "王小寶", "寶寶", 1, True, "GR001", "child", "T001", None),
+    ("T004", "陳大文", "阿文", 2, True, "GR003", "self", None, "陳大文"),
+    ("T005", "林小明", None, 3, True, "GR004", "self", None, None),
+    ("T006", "張立位", None, 4, True, "GR002", "self", None, None),
+    ("T007", "張太太", None, 4, True, "GR002", "spouse", "T006", None),
+    ("T008", "黃找財", "財哥", None, True, "GR005", "self", None, None),
+    ("T009", "吳不來", None, 6, False, "GR006", "self", None, None),
+    ("T010", "Alice Chen", "alice", 7, True, "GR004", "guest", "", None),
+    ("T011", "周小妹", None, 7, True, "GR004", "guest", "T010", None),
+    ("T012", "周小弟", None, 8, True, "GR004", "other", "T999", None),
+    # Same relation_role inside one family: member order must still match.
+    ("T000", "王大姊", None, 1, True, "GR001", "child", "T001", None),
+    # % and _ are matched literally, not as ILIKE wildcards.
+    ("T013", "Bob_Lee", None, 9, True, "GR006", "self", None, None),
+]
+
+KEYWORDS = [
+    "王小明", "小明", "王小", "李美華", "寶寶", "阿文", "張立位", "張太太", "黃找財",
+    "吳不來", "alice", "CHEN", "周小", "周小妹", "周小弟", "王大姊", "b_l", "b%l", "_小", "不存在", "明", "", "小" * 21,
+]
+
+
+@pytest.fixture(scope="module", autouse=True)
+def seeded_guests():
+    try:
+        with get_pool().connection() as conn:
+            with conn:
+                with conn.cursor() as cur:
+                    cur.execute("CREATE TEMP TABLE guests (LIKE public.guests INCLUDING DEFAULTS)")
+                    cur.executemany(
+                        "INSERT INTO guests (guest_code, name, alias, seat_number, attending, group_code, "
+                        "relation_role, representative, display_name) VALUES (%s,%s,%s,%s,%s,%s,%s,%s,%s)",
+                        FIXTURE,
+                    )
+    except (psycopg2.OperationalError, psycopg2.errors.UndefinedTable) as e:
+        pytest.skip(f"database not usable: {e}")
+    yield
+    with get_pool().connection() as conn:
+        with conn:
+            with conn.cursor() as cur:
+                cur.execute("DROP TABLE IF EXISTS pg_temp.guests")
+
+
+def _families(payload: dict) -> tuple:
+    """
+    Status plus bundles. The multi-query path lists bundles in match order,
+    which SQL leaves unspecified, so bundles are keyed by anchor; the members
+    inside each bundle are compared in their returned order.
+    """
+    bundles = sorted(payload["data"], key=lambda b: (b["who"] or "", b["family"][0]["guest_code"]))
+    return payload["status"], [(b["who"], [dict(m) for m in b["family"]]) for b in bundles]
+
+
+@pytest.mark.parametrize("keyword", KEYWORDS)
+def test_single_statement_matches_multi_query(keyword):
+    assert _families(find_guest_and_family_single(keyword)) == _families(find_guest_and_family(keyword))
+
+
+@pytest.mark.parametrize("keyword", KEYWORDS)
+def test_guest_index_matches_sql(keyword):
+    snapshot = _Snapshot(None, run_query(LOAD_SQL))
+    assert _families(snapshot.find_guest_and_family(keyword)) == _families(find_guest_and_family_single(keyword))
+
+
+def test_fixture_covers_each_status():
+    statuses = {find_guest_and_family_single(kw)["status"] for kw in KEYWORDS}
+    assert statuses == {"ok", "not_found", "too_short", "too_many"}
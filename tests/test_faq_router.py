@@ -0,0 +1,54 @@
+# tests/test_faq_router.py
+
+import json
+import os
+import sys
+
+import pytest
+
+BASE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__))) # Go to project root path
+sys.path.insert(0, BASE_DIR)
+
+from faq_router import FaqIndex
+
+# FAQ fast path over instance/wedding_data.example.json: confident answers for
+# plain lookups, None (fall through to the AI) for anything it cannot answer.
+
+with open(os.path.join(BASE_DIR, "instance", "wedding_data.example.json"), encoding="utf-8") as f:
+    INDEX = FaqIndex(json.load(f))
+
+
+@pytest.mark.parametrize("question, labels", [
+    ("宴會幾點開始？", ["宴會開始"]),
+    ("幾點開始", ["宴會開始"]),
+    ("地點在哪裡", ["地點"]),
+    ("儀式在哪裡", ["儀式地點"]),
+    ("儀式幾點", ["儀式時間"]),
+    ("證婚人是誰", ["證婚人"]),
+    ("新郎是誰", ["新郎"]),
+    ("幾點報到", ["迎賓接待"]),
+    ("時間流程", ["迎賓接待", "宴會開始"]),
+])
+def test_answers_plain_lookups(question, labels):
+    hit = INDEX.match(question)
+    assert hit is not None
+    assert [e["label"] for e in hit["entries"]] == labels
+
+
+@pytest.mark.parametrize("question", [
+    "宴會幾點結束",  # Only the start time is known
+    "儀式幾點結束",
+    "宴會開始前可以先進場嗎",  # Not a time lookup
+    "宴會結束後可以拍照嗎",
+    "可以停車嗎",
+    "有素食嗎",
+    "謝謝你",
+    "請問一下婚禮當天如果下雨的話儀式還會在戶外花園舉行嗎",  # Too long for a lookup
+])
+def test_falls_through_to_ai(question):
+    assert INDEX.match(question) is None
+
+
+def test_answer_text_uses_the_value():
+    assert "上午 10:30" in INDEX.answer("儀式幾點")
+    assert INDEX.answer("宴會幾點結束") is None
@@ -0,0 +1,142 @@
+# tests/test_guest_index.py
+
+import os
+import sys
+
+import pytest
+
+BASE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__))) # Go to project root path
+sys.path.insert(0, BASE_DIR)
+
+from db import guest_index, guest_snapshot
+from db.guest_index import _Snapshot
+from db.queries import ROW_HARD_CAP
+
+# The in-process index (and its mmap'd snapshot file) answers seat lookups in
+# place of SQL, so it must honour the same contract as
+# queries.find_guest_and_family_single(): case-insensitive literal substring
+# match on name / alias / display_name of attending guests, family =
+# representative or guest_code equal to the anchor, members ordered by
+# relation_role (NULLs last) then guest_code, too_many past ROW_HARD_CAP rows
+# or more than one family. No database needed.
+
+FIELDS = ("guest_code", "name", "alias", "seat_number", "group_code", "relation_role",
+          "representative", "display_name")
+FIXTURE = [
+    ("T001", "王小明", "小明", 1, "GR001", "self", None, "王小明"),
+    ("T002", "李美華", None, 1, "GR001", "spouse", "T001", None),
+    ("T003", "王小寶", "寶寶", 1, "GR001", "child", "T001", None),
+    ("T000", "王大姊", None, 1, "GR001", "child", "T001", None),
+    ("T014", "王阿姨", None, 1, "GR001", None, "T001", None),
+    ("T004", "陳大文", "阿文", 2, "GR003", "self", None, "陳大文"),
+    ("T005", "林小明", None, 3, "GR004", "self", None, None),
+    ("T006", "張立位", None, 4, "GR002", "self", None, None),
+    ("T007", "張太太", None, 4, "GR002", "spouse", "T006", None),
+    ("T008", "黃找財", "財哥", None, "GR005", "self", None, None),
+    ("T010", "Alice Chen", "alice", 7, "GR004", "guest", None, None),
+    ("T011", "周小妹", None, 7, "GR004", "guest", "T010", None),
+    ("T012", "周小弟", None, 8, "GR004", "other", "T999", None),
+    ("T015", "Bob_Lee", None, 9, "GR006", "self", None, None),
+    ("T016", "100%純", None, 9, "GR006", "guest", "T015", None),
+]
+
+KEYWORDS = [
+    "王小明", "小明", "王小", "李美華", "寶寶", "阿文", "張立位", "張太太", "黃找財", "財哥",
+    "alice", "CHEN", "周小", "周小妹", "周小弟", "王阿姨", "不存在", "明", "", "小" * 21,
+    "b_l", "B_LEE", "0%純", "王%", "_小", "%%",
+]
+
+
+def _rows(fixture=FIXTURE):
+    """guest_index.LOAD_SQL-shaped rows (attending guests only)."""
+    rows = []
+    for values in fixture:
+        r = dict(zip(FIELDS, values))
+        r["show_name"] = r["display_name"] or r["name"] or r["alias"]
+        rows.append(r)
+    return rows
+
+
+def _expected_matches(rows, keyword):
+    """Reference for ILIKE '%keyword%' with % and _ escaped, in row order."""
+    kw = keyword.lower()
+    return [r["guest_code"] for r in rows
+            if any(kw in str(r[f]).lower() for f in guest_index.SEARCH_FIELDS if r[f])]
+
+
+def _expected_family(rows, anchor):
+    members = [r for r in rows if r["guest_code"] == anchor or r["representative"] == anchor]
+    members.sort(key=lambda r: (r["relation_role"] is None, r["relation_role"] or "", r["guest_code"]))
+    return [r["guest_code"] for r in members]
+
+
+@pytest.fixture(scope="module")
+def snapshot():
+    return _Snapshot("v1", _rows())
+
+
+@pytest.fixture(scope="module")
+def mapped(tmp_path_factory):
+    path = str(tmp_path_factory.mktemp("snap") / "guests.bin")
+    guest_snapshot.write(path, _rows(), "v1")
+    return guest_snapshot.GuestSnapshot(path)
+
+
+@pytest.mark.parametrize("keyword", [k for k in KEYWORDS if len(k) >= 2])
+def test_match_is_a_literal_case_insensitive_substring(snapshot, keyword):
+    assert [r["guest_code"] for r in snapshot.match(keyword)] == _expected_matches(_rows(), keyword)
+
+
+def test_wildcards_are_literal(snapshot):
+    assert [r["guest_code"] for r in snapshot.match("b_l")] == ["T015"]
+    assert snapshot.match("b%l") == []
+    assert [r["guest_code"] for r in snapshot.match("0%純")] == ["T016"]
+
+
+def test_self_rows_have_the_sql_shape(snapshot):
+    (row,) = snapshot.match("李美華")
+    assert row == {"guest_code": "T002", "show_name": "李美華", "seat_number": 1,
+                   "group_code": "GR001", "relation_role": "spouse", "representative": "T001"}
+
+
+@pytest.mark.parametrize("anchor", ["T001", "T006", "T010", "T999", "T015", "T404"])
+def test_family_order_is_relation_role_then_guest_code(snapshot, anchor):
+    assert [m["guest_code"] for m in snapshot.family(anchor)] == _expected_family(_rows(), anchor)
+
+
+def test_family_with_same_role_and_null_role():
+    family = [m["guest_code"] for m in _Snapshot(None, _rows()).family("T001")]
+    assert family == ["T000", "T003", "T001", "T002", "T014"]
+
+
+def test_bundles(snapshot):
+    assert snapshot.find_guest_and_family("王小明") == {"status": "ok", "data": [
+        {"who": "王小明", "family": snapshot.family("T001")},
+    ]}
+    assert snapshot.find_guest_and_family("周小弟")["data"][0]["who"] == "周小弟"  # Anchor T999 has no row
+    assert snapshot.find_guest_and_family("明")["status"] == "too_short"
+    assert snapshot.find_guest_and_family("不存在")["status"] == "not_found"
+    assert snapshot.find_guest_and_family("周小")["status"] == "too_many"  # Two families
+
+
+def test_row_hard_cap():
+    family = [("L000", "林家長", None, 1, "GR009", "self", None, None)]
+
+    def cousins(n):
+        return [(f"L{i:03d}", f"林家{i}", None, 1, "GR009", "other", "L000", None) for i in range(1, n)]
+
+    at_cap = _Snapshot(None, _rows(family + cousins(ROW_HARD_CAP)))
+    assert len(at_cap.match("林家")) == ROW_HARD_CAP
+    assert at_cap.find_guest_and_family("林家")["status"] == "ok"
+    over_cap = _Snapshot(None, _rows(family + cousins(ROW_HARD_CAP + 1)))
+    assert over_cap.find_guest_and_family("林家") == {"status": "too_many", "data": []}
+
+
+def test_snapshot_file_round_trip(snapshot, mapped):
+    assert mapped.version == "v1" and mapped.row_count == len(FIXTURE)
+    assert mapped.texts == snapshot.texts
+    for keyword in KEYWORDS:
+        assert mapped.match(keyword) == snapshot.match(keyword), keyword
+        assert mapped.find_guest_and_family(keyword) == snapshot.find_guest_and_family(keyword), keyword
+    for anchor in ["T001", "T006", "T010", "T999", "T015", "T404", ""]:
+        assert mapped.family(anchor) == snapshot.family(anchor), anchor
@@ -0,0 +1,82 @@
+# tests/test_name_spotter.py
+
+import os
+import sys
+
+import pytest
+
+BASE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__))) # Go to project root path
+sys.path.insert(0, BASE_DIR)
+
+import name_spotter
+from intents import classify_intents, extract_keyword
+from name_spotter import NameSpotter
+
+# Guest-name spotting (Aho-Corasick) and the intent rules built on it; the
+# spotter is built from a fixed name list, no database involved.
+
+NAMES = ["王小明", "小明", "李美華", "張立位", "黃找財", "Alice Chen", "alice", "王"]
+
+
+@pytest.fixture
+def spotter(monkeypatch):
+    s = NameSpotter(NAMES)
+    monkeypatch.setattr(name_spotter, "get_spotter", lambda: s)
+    return s
+
+
+def test_single_characters_are_not_patterns():
+    s = NameSpotter(NAMES)
+    assert s.pattern_count == len(NAMES) - 1
+    assert s.spot("王先生") == []
+
+
+def test_find_all_reports_overlapping_names():
+    s = NameSpotter(NAMES)
+    assert sorted(s.find_all("王小明")) == [(0, 3), (1, 3)]
+
+
+def test_spot_is_leftmost_longest_and_keeps_the_text_spelling():
+    s = NameSpotter(NAMES)
+    assert s.spot("我是王小明") == ["王小明"]
+    assert s.spot("小明和李美華坐一起嗎") == ["小明", "李美華"]
+    assert s.spot("ALICE CHEN 坐哪") == ["ALICE CHEN"]
+    assert s.spot("今天天氣很好") == []
+
+
+def test_spot_finds_names_sharing_a_suffix():
+    s = NameSpotter(["明華", "李明華", "華英"])
+    assert s.spot("李明華英") == ["李明華"]
+    assert sorted(s.find_all("李明華英")) == [(0, 3), (1, 3), (2, 4)]
+
+
+@pytest.mark.parametrize("text", ["王小明", "王小明？", "王小明呢", "王小明 李美華", "alice!"])
+def test_bare_name_is_a_seat_lookup(spotter, text):
+    assert classify_intents(text) == ["seat_lookup"]
+
+
+@pytest.mark.parametrize("text", ["王小明幾點到", "小明來了沒", "李美華會致詞嗎", "今天幾點開始"])
+def test_question_mentioning_a_name_is_not(spotter, text):
+    assert classify_intents(text) == []
+
+
+def test_seat_wording_is_a_seat_lookup_without_names(spotter):
+    assert classify_intents("我的座位在哪") == ["seat_lookup"]
+
+
+def test_extract_keyword_prefers_the_longest_spotted_name(spotter):
+    assert extract_keyword("小明和王小明的座位") == "王小明"
+    # Names containing stripped phrases (位, 找) survive intact.
+    assert extract_keyword("張立位坐哪") == "張立位"
+    assert extract_keyword("黃找財的座位") == "黃找財"
+
+
+def test_extract_keyword_falls_back_to_phrase_stripping(spotter):
+    assert extract_keyword("我要找陳大文的座位") == "陳大文"
+    assert extract_keyword("座位") == ""
+
+
+def test_disabled_or_unbuilt_spotter_finds_nothing(monkeypatch):
+    monkeypatch.setattr(name_spotter, "get_spotter", lambda: None)
+    assert name_spotter.spot("王小明") == []
+    assert classify_intents("王小明") == []
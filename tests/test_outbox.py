@@ -0,0 +1,179 @@
+# tests/test_outbox.py
+
+import os
+import sqlite3
+import sys
+import threading
+import time
+
+import pytest
+
+BASE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__))) # Go to project root path
+sys.path.insert(0, BASE_DIR)
+
+import outbox
+from outbox import DONE, FAILED, PENDING, WORKING, Outbox
+
+# Durable queue semantics: per-user ordering, deadline/priority scheduling,
+# claims that are atomic across processes sharing one file, and lease-based
+# recovery that never takes a row from a live owner.
+
+
+@pytest.fixture
+def box():
+    b = Outbox(path="")  # SQLite in memory
+    yield b
+    b.close()
+
+
+@pytest.fixture
+def shared(tmp_path):
+    """Two Outbox instances (as two uvicorn workers would have) on one file."""
+    path = str(tmp_path / "outbox.sqlite3")
+    boxes = [Outbox(path), Outbox(path)]
+    yield path, boxes
+    for b in boxes:
+        b.close()
+
+
+def _state(path, job_id):
+    with sqlite3.connect(path) as db:
+        return db.execute("SELECT state, owner FROM outbox WHERE id = ?", (job_id,)).fetchone()
+
+
+def test_a_users_next_message_waits_for_the_previous_one(box):
+    first = box.enqueue("U1", "一")
+    second = box.enqueue("U1", "二")
+    other = box.enqueue("U2", "三")
+
+    assert box.claim()["id"] == first
+    assert box.claim()["id"] == other  # U1 is busy, U2 is not
+    assert box.claim() is None
+    box.complete(first)
+    assert box.claim()["id"] == second
+
+
+def test_live_deadline_then_priority_then_deadline_then_arrival(box):
+    now = time.time()
+    expired = box.enqueue("U1", "token gone", "t1", priority=0, deadline=now - 1)
+    no_token = box.enqueue("U2", "push only", None, priority=1)
+    llm_late = box.enqueue("U3", "llm", "t3", priority=1, deadline=now + 40)
+    llm_soon = box.enqueue("U4", "llm", "t4", priority=1, deadline=now + 10)
+    seat = box.enqueue("U5", "seat", "t5", priority=0, deadline=now + 50)
+
+    order = [box.claim()["id"] for _ in range(5)]
+    # Rows whose reply token can still be used go first; the rest are pushed anyway.
+    assert order == [seat, llm_soon, llm_late, expired, no_token]
+
+
+def test_complete_and_fail_are_counted(box):
+    a, b = box.enqueue("U1", "a"), box.enqueue("U2", "b")
+    box.claim(), box.claim()
+    box.complete(a)
+    box.fail(b, "boom")
+    stats = box.stats()
+    assert (stats["completed"], stats["failed"], stats["working"], stats["failed_rows"]) == (1, 1, 0, 1)
+
+
+def test_two_instances_never_claim_the_same_row(shared):
+    _, boxes = shared
+    ids = [boxes[0].enqueue(f"U{i % 40}", str(i)) for i in range(400)]
+    claimed = [[] for _ in boxes]
+    start = threading.Barrier(len(boxes))
+
+    def drain(n):
+        start.wait()
+        idle = 0
+        while idle < 50:
+            job = boxes[n].claim()
+            if job is None:
+                idle += 1
+                time.sleep(0.001)
+                continue
+            idle = 0
+            claimed[n].append(job["id"])
+            time.sleep(0.0005)  # Answering takes a moment; the other worker claims meanwhile
+            boxes[n].complete(job["id"])
+
+    threads = [threading.Thread(target=drain, args=(n,)) for n in range(len(boxes))]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    everything = claimed[0] + claimed[1]
+    assert sorted(everything) == ids  # Each row exactly once
+    assert claimed[0] and claimed[1]
+
+
+def test_per_user_order_holds_across_instances(shared):
+    _, (a, b) = shared
+    first = a.enqueue("U1", "一")
+    second = b.enqueue("U1", "二")
+    assert a.claim()["id"] == first
+    assert b.claim() is None  # U1's first message is WORKING in the other process
+    a.complete(first)
+    assert b.claim()["id"] == second
+
+
+def test_startup_recovery_leaves_live_rows_alone(shared):
+    path, (a, _) = shared
+    job = a.enqueue("U1", "hi")
+    a.claim()
+    late = Outbox(path)  # Another worker starting up
+    try:
+        assert late.recovered == 0
+        assert _state(path, job) == (WORKING, a.owner)
+    finally:
+        late.close()
+
+
+def _expire_leases(path):
+    with sqlite3.connect(path) as db:
+        db.execute("UPDATE outbox SET lease_until = ? WHERE state = ?", (time.time() - 1, WORKING))
+
+
+def test_expired_lease_is_requeued(shared):
+    path, (a, b) = shared
+    job = a.enqueue("U1", "hi")
+    a.claim()
+    _expire_leases(path)  # a stopped renewing (its process died)
+    b.recover()
+    assert _state(path, job) == (PENDING, None)
+    assert b.claim()["id"] == job
+    assert _state(path, job) == (WORKING, b.owner)
+
+
+def test_renewed_lease_is_not_requeued(shared):
+    path, (a, b) = shared
+    job = a.enqueue("U1", "hi")
+    a.claim()
+    _expire_leases(path)
+    a.renew()  # Heartbeat of a live owner
+    b.recover()
+    assert _state(path, job) == (WORKING, a.owner)
+
+
+def test_finish_is_scoped_to_the_owner(shared):
+    path, (a, b) = shared
+    job = a.enqueue("U1", "hi")
+    a.claim()
+    _expire_leases(path)
+    b.recover()
+    b.claim()
+    a.complete(job)  # a finished late, after its row was handed to b
+    assert _state(path, job) == (WORKING, b.owner)
+    b.complete(job)
+    assert _state(path, job) == (DONE, b.owner)
+
+
+def test_row_is_failed_after_max_attempts(shared, monkeypatch):
+    monkeypatch.setattr(outbox, "OUTBOX_MAX_ATTEMPTS", 2)
+    path, (a, b) = shared
+    job = a.enqueue("U1", "hi")
+    a.claim()
+    _expire_leases(path)
+    b.recover()  # attempts 0 -> 1, requeued
+    b.claim()
+    _expire_leases(path)
+    a.recover()  # attempts + 1 reaches the limit
+    assert _state(path, job)[0] == FAILED
@@ -0,0 +1,51 @@
+# tools/apply_migrations.py
+
+import os
+import sys
+
+BASE_DIR = os.path.dirname(os.path.dirname(__file__)) # Go to project root path
+sys.path.insert(0, BASE_DIR)
+
+from db.db_connection import get_connection
+
+MIGRATIONS_DIR = os.path.join(BASE_DIR, "db", "migrations")
+
+# Apply db/migrations/*.sql in file-name order, once each.
+# Applied files are recorded in schema_migrations.
+# Connection priority is the same as the app (RENDER/REMOTE_DATABASE_URL, then PG*).
+
+def main():
+    files = sorted(f for f in os.listdir(MIGRATIONS_DIR) if f.endswith(".sql"))
+    conn = get_connection()
+    try:
+        with conn:
+            with conn.cursor() as cur:
+                cur.execute("""
+                    CREATE TABLE IF NOT EXISTS schema_migrations (
+                        filename TEXT PRIMARY KEY,
+                        applied_at TIMESTAMPTZ NOT NULL DEFAULT NOW()
+                    )
+                """)
+                cur.execute("SELECT filename FROM schema_migrations")
+                applied = {r["filename"] for r in cur.fetchall()}
+
+        for filename in files:
+            if filename in applied:
+                print(f"⏭️ {filename} (already applied)")
+                continue
+            with open(os.path.join(MIGRATIONS_DIR, filename), "r", encoding="utf-8") as f:
+                sql = f.read()
+            # One transaction per migration file.
+            with conn:
+                with conn.cursor() as cur:
+                    cur.execute(sql)
+                    cur.execute("INSERT INTO schema_migrations (filename) VALUES (%s)", (filename,))
+            print(f"✅ {filename} applied")
+    except Exception as e:
+        print(f"🚫 migration failed: {e}")
+        raise SystemExit(1)
+    finally:
+        conn.close()
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,33 @@
+# tools/build_static.py
+
+import os
+import sys
+
+BASE_DIR = os.path.dirname(os.path.dirname(__file__)) # Go to project root path
+sys.path.insert(0, BASE_DIR)
+
+from dotenv import load_dotenv
+load_dotenv(os.path.join(BASE_DIR, ".env"))
+
+import seatmap
+import static_assets
+
+# Build step for static/: per-table seat maps, then fingerprinted copies,
+# responsive widths and static/build/manifest.json.
+# Usage (e.g. in the Render build command):
+#   python tools/build_static.py
+# Unchanged files are skipped, so running it on every deploy is cheap.
+
+def main():
+    seatmap.get_renderer().render_all()
+    manifest = static_assets.build()
+    for rel, entry in sorted(manifest.items()):
+        size = os.path.getsize(os.path.join(static_assets.STATIC_DIR, entry["path"])) // 1024
+        variants = ", ".join(
+            f"w{w}={os.path.getsize(os.path.join(static_assets.STATIC_DIR, path)) // 1024} KB"
+            for w, path in sorted(entry["variants"].items(), key=lambda kv: int(kv[0]))
+        )
+        print(f"  {rel} -> {entry['path']} ({size} KB{'; ' + variants if variants else ''})")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,50 @@
+# tools/check_family_query.py
+
+import os
+import sys
+
+BASE_DIR = os.path.dirname(os.path.dirname(__file__)) # Go to project root path
+sys.path.insert(0, BASE_DIR)
+
+from db.db_connection import run_query
+from db.queries import find_guest_and_family, find_guest_and_family_single
+
+# Compare the single-statement family query with the multi-query reference
+# implementation on the live guests table, for every name/alias/display_name
+# and their 2-character fragments. The seeded-fixture version of this check is
+# tests/test_family_query.py (pytest).
+
+
+def _normalize(payload: dict) -> dict:
+    """Bundle order follows match order in the multi-query path (unspecified); member order must match."""
+    data = sorted(
+        ({"who": b["who"], "family": [dict(m) for m in b["family"]]} for b in payload.get("data", [])),
+        key=lambda b: (b["who"] or "", b["family"][0]["guest_code"] if b["family"] else ""),
+    )
+    return {"status": payload.get("status"), "data": data}
+
+
+def live_keywords() -> list:
+    rows = run_query("SELECT name, alias, display_name FROM guests")
+    words = {v for r in rows for v in r.values() if v}
+    # Also probe 2-char fragments, they produce most of the ambiguous matches.
+    return sorted(words | {w[i:i + 2] for w in words for i in range(len(w) - 1)})
+
+
+def main() -> int:
+    keywords = live_keywords()
+
+    mismatches = 0
+    for kw in keywords:
+        expected = _normalize(find_guest_and_family(kw))
+        actual = _normalize(find_guest_and_family_single(kw))
+        if expected != actual:
+            mismatches += 1
+            print(f"❌ {kw!r}\n   multi : {expected}\n   single: {actual}")
+
+    print(f"Checked {len(keywords)} keywords, {mismatches} mismatch(es).")
+    return 1 if mismatches else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
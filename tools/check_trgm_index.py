@@ -0,0 +1,90 @@
+# tools/check_trgm_index.py
+
+import json
+import os
+import sys
+
+BASE_DIR = os.path.dirname(os.path.dirname(__file__)) # Go to project root path
+sys.path.insert(0, BASE_DIR)
+
+from db.db_connection import get_connection
+from db.queries import FAMILY_BUNDLE_SQL, family_bundle_params
+
+# Report whether the planner actually uses the pg_trgm indexes for seat lookups.
+# Explains the statement the bot runs (db.queries.FAMILY_BUNDLE_SQL, in the
+# GUEST_MATCH_MODE of this environment).
+# Usage:
+#   python tools/check_trgm_index.py [keyword ...] [--analyze] [--force]
+#   --analyze  run EXPLAIN ANALYZE (executes the query, shows real timings)
+#   --force    disable seq scans for the session to prove the index is usable at all
+
+TRGM_INDEXES = ("idx_guests_name_trgm", "idx_guests_alias_trgm", "idx_guests_display_name_trgm")
+
+def _walk(plan: dict):
+    yield plan
+    for child in plan.get("Plans", []):
+        yield from _walk(child)
+
+def main():
+    args = [a for a in sys.argv[1:] if not a.startswith("--")]
+    analyze = "--analyze" in sys.argv
+    force = "--force" in sys.argv
+
+    conn = get_connection()
+    try:
+        with conn.cursor() as cur:
+            cur.execute("SELECT extversion FROM pg_extension WHERE extname = 'pg_trgm'")
+            ext = cur.fetchone()
+            print(f"pg_trgm extension: {ext['extversion'] if ext else '❌ not installed'}")
+
+            cur.execute(
+                "SELECT indexname FROM pg_indexes WHERE tablename = 'guests' AND indexname = ANY(%s)",
+                (list(TRGM_INDEXES),),
+            )
+            present = {r["indexname"] for r in cur.fetchall()}
+            for name in TRGM_INDEXES:
+                print(f"  {'✅' if name in present else '❌'} {name}")
+
+            cur.execute("SELECT COUNT(*) AS n FROM guests")
+            print(f"guests rows: {cur.fetchone()['n']}")
+
+            if not args:
+                cur.execute("SELECT COALESCE(display_name, name, alias) AS n FROM guests "
+                            "WHERE COALESCE(display_name, name, alias) IS NOT NULL LIMIT 1")
+                row = cur.fetchone()
+                args = [row["n"]] if row else ["王小明"]
+
+            if force:
+                cur.execute("SET enable_seqscan = off")
+
+            explain = "EXPLAIN (ANALYZE, FORMAT JSON)" if analyze else "EXPLAIN (FORMAT JSON)"
+            for kw in args:
+                cur.execute(f"{explain} {FAMILY_BUNDLE_SQL}", family_bundle_params(kw))
+                raw = cur.fetchone()
+                doc = next(iter(raw.values()))
+                if isinstance(doc, str):
+                    doc = json.loads(doc)
+                top = doc[0]
+                nodes = list(_walk(top["Plan"]))
+                used = sorted({n["Index Name"] for n in nodes if n.get("Index Name") in TRGM_INDEXES})
+                seq = any(n["Node Type"] == "Seq Scan" for n in nodes)
+
+                print(f"\nkeyword={kw!r}")
+                print("  plan:", " → ".join(n["Node Type"] for n in nodes))
+                print(f"  estimated cost: {top['Plan']['Total Cost']}")
+                if analyze:
+                    print(f"  execution time: {top.get('Execution Time')} ms")
+                if used:
+                    print(f"  ✅ trigram index used: {', '.join(used)}")
+                else:
+                    print("  ❌ trigram index NOT used" + (" (sequential scan)" if seq else ""))
+                    if len(kw) < 3:
+                        print("     note: keywords shorter than 3 characters yield no trigrams to search with")
+                    elif not force:
+                        print("     note: on a small table the planner may prefer a seq scan; retry with --force")
+        conn.rollback()
+    finally:
+        conn.close()
+
+if __name__ == "__main__":
+    main()
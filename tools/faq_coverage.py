@@ -0,0 +1,70 @@
+# tools/faq_coverage.py
+
+import json
+import os
+import sys
+
+BASE_DIR = os.path.dirname(os.path.dirname(__file__)) # Go to project root path
+sys.path.insert(0, BASE_DIR)
+
+from dotenv import load_dotenv
+load_dotenv(os.path.join(BASE_DIR, ".env"))
+
+from intents import classify_intents
+from faq_router import get_index
+
+# Report what fraction of a recorded question set the FAQ fast path answers
+# without calling OpenAI.
+# Usage:
+#   python tools/faq_coverage.py [questions file] [--show]
+#   questions file: one question per line, or JSONL with a "question"/"text" field
+#   (default: instance/faq_questions.example.txt)
+#   --show  print every question with its answer / fall-through
+
+DEFAULT_QUESTIONS = os.path.join(BASE_DIR, "instance", "faq_questions.example.txt")
+
+def load_questions(path: str) -> list:
+    questions = []
+    with open(path, "r", encoding="utf-8") as f:
+        for line in f:
+            line = line.strip()
+            if not line:
+                continue
+            if line.startswith("{"):
+                rec = json.loads(line)
+                line = rec.get("question") or rec.get("text") or ""
+            if line:
+                questions.append(line)
+    return questions
+
+def main():
+    args = [a for a in sys.argv[1:] if not a.startswith("--")]
+    show = "--show" in sys.argv
+    questions = load_questions(args[0] if args else DEFAULT_QUESTIONS)
+    index = get_index()
+
+    seat = answered = 0
+    for q in questions:
+        if "seat_lookup" in classify_intents(q):
+            seat += 1
+            if show:
+                print(f"🪑 {q}  → seat lookup")
+            continue
+        hit = index.match(q)
+        if hit:
+            answered += 1
+            if show:
+                labels = ", ".join(e["label"] for e in hit["entries"])
+                print(f"✅ {q}  → {labels} (score {hit['score']})")
+        elif show:
+            print(f"➡️ {q}  → AI")
+
+    total = len(questions)
+    llm_candidates = total - seat
+    print(f"\nQuestions: {total} (seat lookups: {seat})")
+    print(f"FAQ answered: {answered}/{total} ({answered / total:.1%} of all)" if total else "No questions.")
+    if llm_candidates:
+        print(f"OpenAI calls avoided: {answered}/{llm_candidates} ({answered / llm_candidates:.1%} of non-seat questions)")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,343 @@
+# tools/guest_loader.py
+
+import csv
+import io
+import os
+import sys
+import time
+
+import psycopg2
+from psycopg2.extras import RealDictCursor, execute_values
+from dotenv import load_dotenv
+
+BASE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__))) # Go to project root path
+sys.path.insert(0, BASE_DIR)
+
+from db import guest_index, guest_snapshot
+
+# Import the guest list CSV into the guests table.
+# Usage:
+#   python tools/guest_loader.py [--render] [--sync] [--check] [--strict] [--snapshot] [path/to/guests.csv]
+#   --render  connect with RENDER_DATABASE_URL / REMOTE_DATABASE_URL (TLS)
+#             instead of the local PG* settings
+#   --sync    apply only the differences (see below) instead of replacing the table
+#   --check   validate only (with --sync: also print the changes), write nothing
+#   --strict  treat warnings (see WARNINGS) as validation errors
+#   --snapshot  afterwards write the guest snapshot file for GUEST_SEARCH_MODE=snapshot
+#             (db/guest_snapshot.py, GUEST_SNAPSHOT_PATH) from the committed table
+#   The CSV path defaults to GUESTS_CSV_PATH.
+#
+# The CSV is streamed with COPY FROM STDIN into a temporary staging table (one
+# round trip instead of one INSERT per guest), validated there, and swapped into
+# guests with DELETE + INSERT ... SELECT in the same transaction. Readers keep
+# seeing the previous guest list until the commit, never an empty or partial one;
+# if validation fails nothing is changed.
+#
+# --sync diffs the staging table against guests by guest_code: new and edited
+# rows are upserted in batches, guests missing from the CSV are soft-deleted
+# (attending = FALSE), and a change summary is printed.
+# Both modes bump guest_data_version and log the changed guest_codes in
+# guest_changes (db/migrations/002_guest_data_version.sql), so the in-process
+# guest index reloads only those rows.
+
+COLUMNS = ["guest_code", "name", "alias", "seat_number", "attending",
+           "group_code", "relation_role", "representative", "display_name"]
+RELATION_ROLES = ("self", "spouse", "child", "guest", "other")
+# VARCHAR limits from db/schema.sql; COPY would abort on the first longer value.
+MAX_LENGTHS = {"guest_code": 10, "group_code": 10, "relation_role": 20, "representative": 10}
+
+SYNC_BATCH_SIZE = 500  # guest_codes per upsert / soft-delete statement
+SUMMARY_LIMIT = 20  # Changes listed per kind in the summary
+
+# Each check returns the offending rows of the staging table.
+VALIDATIONS = [
+    ("duplicate guest_code",
+     "SELECT guest_code, COUNT(*) FROM guests_staging GROUP BY guest_code HAVING COUNT(*) > 1"),
+    ("guest without name / alias / display_name",
+     "SELECT guest_code, NULL FROM guests_staging "
+     "WHERE name IS NULL AND alias IS NULL AND display_name IS NULL"),
+    ("unknown group_code (not in groups)",
+     "SELECT s.guest_code, s.group_code FROM guests_staging s "
+     "LEFT JOIN groups g ON g.group_code = s.group_code "
+     "WHERE s.group_code IS NOT NULL AND g.group_code IS NULL"),
+    ("invalid relation_role",
+     "SELECT guest_code, relation_role FROM guests_staging "
+     f"WHERE relation_role IS NOT NULL AND relation_role NOT IN {RELATION_ROLES}"),
+]
+
+# Suspicious but allowed rows: printed, and only fail the load with --strict.
+# A representative without a row of its own is still a valid family anchor
+# (db/queries.resolve_anchors groups the members under it).
+WARNINGS = [
+    ("representative is not a guest_code in the file",
+     "SELECT s.guest_code, s.representative FROM guests_staging s "
+     "LEFT JOIN guests_staging r ON r.guest_code = s.representative "
+     "WHERE s.representative IS NOT NULL AND r.guest_code IS NULL"),
+]
+
+def normalize(value: str):
+    if value is None:
+        return None
+    val = str(value).strip()
+    return val if val else None
+
+def connect(render: bool):
+    if render:
+        db_url = os.getenv("RENDER_DATABASE_URL") or os.getenv("REMOTE_DATABASE_URL")
+        if not db_url:
+            raise RuntimeError("🥲 No database URL found. Please set RENDER_DATABASE_URL or REMOTE_DATABASE_URL.")
+        return psycopg2.connect(db_url, sslmode="require")
+    return psycopg2.connect(
+        dbname=os.getenv("PGDATABASE", "your_db"),
+        user=os.getenv("PGUSER", "postgres"),
+        password=os.getenv("PGPASSWORD", "your_password"),
+        host=os.getenv("PGHOST", "localhost"),
+        port=os.getenv("PGPORT", "5432"),
+    )
+
+def read_csv(filename: str):
+    """CSV rows as normalized tuples in COLUMNS order, plus per-line parse errors."""
+    rows, errors = [], []
+    with open(filename, newline="", encoding="utf-8-sig") as csvfile:
+        reader = csv.DictReader(csvfile)
+        missing = [c for c in ("guest_code", "name") if c not in (reader.fieldnames or [])]
+        if missing:
+            return [], [f"header is missing column(s): {', '.join(missing)}"]
+        for row in reader:
+            seat = normalize(row.get("seat_number"))
+            try:
+                seat = int(seat) if seat else None
+            except ValueError:
+                errors.append(f"line {reader.line_num}: seat_number {seat!r} is not a number")
+                continue
+            if not normalize(row.get("guest_code")):
+                errors.append(f"line {reader.line_num}: missing guest_code")
+                continue
+            too_long = [c for c, n in MAX_LENGTHS.items() if len(normalize(row.get(c)) or "") > n]
+            if too_long:
+                errors.append(f"line {reader.line_num}: {', '.join(too_long)} too long")
+                continue
+            rows.append((
+                normalize(row.get("guest_code")),
+                normalize(row.get("name")),
+                normalize(row.get("alias")),
+                seat,
+                str(row.get("attending", "")).strip().upper() == "TRUE",
+                normalize(row.get("group_code")),
+                normalize(row.get("relation_role")),
+                normalize(row.get("representative")),
+                normalize(row.get("display_name")),
+            ))
+    return rows, errors
+
+def _copy_buffer(rows) -> io.StringIO:
+    # COPY csv format: an unquoted empty field is NULL, a quoted one ("") is ''.
+    buf = io.StringIO()
+    for row in rows:
+        buf.write(",".join(
+            "" if v is None
+            else ("t" if v else "f") if isinstance(v, bool)
+            else str(v) if isinstance(v, int)
+            else '"' + v.replace('"', '""') + '"'
+            for v in row
+        ))
+        buf.write("\n")
+    buf.seek(0)
+    return buf
+
+def _run_checks(cur, checks) -> list:
+    problems = []
+    for label, sql in checks:
+        cur.execute(sql + " LIMIT 20")
+        for key, detail in cur.fetchall():
+            problems.append(f"{label}: {key}" + (f" ({detail})" if detail is not None else ""))
+    return problems
+
+def load(cur, rows, strict: bool = False) -> list:
+    """
+    Stage and validate rows; returns the validation errors (empty = ok).
+    Warnings are printed, or returned as errors with strict.
+    """
+    cur.execute("CREATE TEMP TABLE guests_staging (LIKE guests INCLUDING DEFAULTS) ON COMMIT DROP")
+    cur.copy_expert(
+        f"COPY guests_staging ({', '.join(COLUMNS)}) FROM STDIN WITH (FORMAT csv)",
+        _copy_buffer(rows),
+    )
+    errors = _run_checks(cur, VALIDATIONS)
+    warnings = _run_checks(cur, WARNINGS)
+    if strict:
+        return errors + warnings
+    if warnings:
+        print("⚠️ warnings (not blocking, use --strict to reject):")
+        for warning in warnings:
+            print(f"  - {warning}")
+    return errors
+
+def swap(cur) -> int:
+    # DELETE rather than TRUNCATE: TRUNCATE locks readers out and is not MVCC-safe,
+    # DELETE lets concurrent lookups keep reading the old rows until commit.
+    cur.execute("LOCK TABLE guests IN SHARE ROW EXCLUSIVE MODE")  # One loader at a time
+    cur.execute("DELETE FROM guests")
+    cur.execute(f"INSERT INTO guests ({', '.join(COLUMNS)}) "
+                f"SELECT {', '.join(COLUMNS)} FROM guests_staging")
+    return cur.rowcount
+
+def diff(cur) -> dict:
+    """Changes that would make guests match guests_staging, by guest_code."""
+    cols = ", ".join(f"s.{c}" for c in COLUMNS[1:])
+    live = ", ".join(f"g.{c}" for c in COLUMNS[1:])
+    cur.execute("SELECT s.guest_code, s.name, s.seat_number FROM guests_staging s "
+                "LEFT JOIN guests g USING (guest_code) WHERE g.guest_code IS NULL "
+                "ORDER BY s.guest_code")
+    inserts = cur.fetchall()
+    cur.execute(f"SELECT s.guest_code, s.name, g.seat_number, s.seat_number FROM guests_staging s "
+                f"JOIN guests g USING (guest_code) WHERE ({cols}) IS DISTINCT FROM ({live}) "
+                f"ORDER BY s.guest_code")
+    updates = cur.fetchall()
+    cur.execute("SELECT g.guest_code, g.name, g.seat_number FROM guests g "
+                "LEFT JOIN guests_staging s USING (guest_code) "
+                "WHERE s.guest_code IS NULL AND g.attending ORDER BY g.guest_code")
+    deletes = cur.fetchall()
+    return {"insert": inserts, "update": updates, "delete": deletes}
+
+def print_summary(changes: dict) -> None:
+    print(f"inserts={len(changes['insert'])} updates={len(changes['update'])} "
+          f"soft-deletes={len(changes['delete'])}")
+    for code, name, seat in changes["insert"][:SUMMARY_LIMIT]:
+        print(f"  + {code} {name or ''} (table {seat})")
+    for code, name, old_seat, new_seat in changes["update"][:SUMMARY_LIMIT]:
+        seat = f"table {old_seat} -> {new_seat}" if old_seat != new_seat else "details"
+        print(f"  ~ {code} {name or ''} ({seat})")
+    for code, name, seat in changes["delete"][:SUMMARY_LIMIT]:
+        print(f"  - {code} {name or ''} (was table {seat}, now attending = FALSE)")
+    hidden = sum(max(0, len(rows) - SUMMARY_LIMIT) for rows in changes.values())
+    if hidden:
+        print(f"  ... and {hidden} more")
+
+def apply_changes(cur, changes: dict) -> None:
+    cur.execute("LOCK TABLE guests IN SHARE ROW EXCLUSIVE MODE")  # One loader at a time
+    upserts = [row[0] for row in changes["insert"] + changes["update"]]
+    deletes = [row[0] for row in changes["delete"]]
+    assignments = ", ".join(f"{c} = EXCLUDED.{c}" for c in COLUMNS[1:])
+    for i in range(0, len(upserts), SYNC_BATCH_SIZE):
+        cur.execute(
+            f"INSERT INTO guests ({', '.join(COLUMNS)}) "
+            f"SELECT {', '.join(COLUMNS)} FROM guests_staging WHERE guest_code = ANY(%s) "
+            f"ON CONFLICT (guest_code) DO UPDATE SET {assignments}",
+            (upserts[i:i + SYNC_BATCH_SIZE],),
+        )
+    for i in range(0, len(deletes), SYNC_BATCH_SIZE):
+        cur.execute("UPDATE guests SET attending = FALSE WHERE guest_code = ANY(%s)",
+                    (deletes[i:i + SYNC_BATCH_SIZE],))
+
+def bump_version(cur, changes: dict = None):
+    """
+    Bump guest_data_version and log what changed (changes=None: whole table).
+    Returns the new version, or None before migration 002 is applied.
+    """
+    cur.execute("SELECT to_regclass('guest_data_version') IS NOT NULL")
+    if not cur.fetchone()[0]:
+        print("⚠️ guest_data_version missing (run tools/apply_migrations.py); "
+              "the guest index falls back to hashing the table")
+        return None
+    cur.execute("UPDATE guest_data_version SET version = version + 1, updated_at = NOW() "
+                "RETURNING version")
+    version = cur.fetchone()[0]
+    if changes is None:
+        log = [(version, None, "reload")]
+    else:
+        log = [(version, row[0], op) for op, rows in changes.items() for row in rows]
+    execute_values(cur, "INSERT INTO guest_changes (version, guest_code, op) VALUES %s", log)
+    return version
+
+def write_snapshot(conn) -> None:
+    """Write GUEST_SNAPSHOT_PATH from the guests table, tagged with the version the app probes."""
+    with conn.cursor(cursor_factory=RealDictCursor) as cur:
+        cur.execute(guest_index.HAS_DATA_VERSION_SQL)
+        if cur.fetchone()["present"]:
+            cur.execute(guest_index.DATA_VERSION_SQL)
+            version = f"v{cur.fetchone()['version']}"
+        else:
+            cur.execute(guest_index.VERSION_SQL)
+            row = cur.fetchone()
+            version = f"{row['row_count']}:{row['digest']}"
+        cur.execute(guest_index.LOAD_SQL)
+        rows = cur.fetchall()
+    size = guest_snapshot.write(guest_snapshot.GUEST_SNAPSHOT_PATH, rows, version)
+    print(f"✅ snapshot {guest_snapshot.GUEST_SNAPSHOT_PATH}: {len(rows)} guests, {size} bytes ({version})")
+
+def run(render: bool = False, check_only: bool = False, filename: str = None,
+        sync: bool = False, snapshot: bool = False, strict: bool = False) -> bool:
+    load_dotenv()
+    filename = filename or os.getenv("GUESTS_CSV_PATH")
+    if not filename:
+        raise ValueError("GUESTS_CSV_PATH hasn't been set, please check .env file!")
+
+    started = time.perf_counter()
+    rows, errors = read_csv(filename)
+    if not errors and not rows:
+        errors = [f"{filename} has no guest rows"]
+    if errors:
+        print(f"🚫 {filename} is invalid, guests table unchanged:")
+        for err in errors[:20]:
+            print(f"  - {err}")
+        return False
+
+    conn = connect(render)
+    try:
+        with conn:
+            with conn.cursor() as cur:
+                errors = load(cur, rows, strict=strict)
+                if errors:
+                    print("🚫 validation failed, guests table unchanged:")
+                    for err in errors:
+                        print(f"  - {err}")
+                    conn.rollback()
+                    return False
+                if sync:
+                    changes = diff(cur)
+                    print_summary(changes)
+                if check_only:
+                    print(f"✅ {len(rows)} rows are valid (check only, nothing written)")
+                    conn.rollback()
+                    return True
+                if sync:
+                    if not any(changes.values()):
+                        print("✅ guests already up to date, nothing written")
+                        if snapshot:
+                            write_snapshot(conn)
+                        return True
+                    apply_changes(cur, changes)
+                    version = bump_version(cur, changes)
+                    summary = f"guests synced (version {version})"
+                else:
+                    cur.execute("SELECT COUNT(*) FROM guests")
+                    before = cur.fetchone()[0]
+                    inserted = swap(cur)
+                    version = bump_version(cur)
+                    summary = f"guests replaced: {before} -> {inserted} rows (version {version})"
+        print(f"✅ {summary} in {time.perf_counter() - started:.2f}s ({'Render' if render else 'local'})")
+        if snapshot:
+            write_snapshot(conn)
+        return True
+    except Exception as e:
+        print(f"🚫error: {e}")
+        return False
+    finally:
+        conn.close()
+
+def main(render: bool = False):
+    args = [a for a in sys.argv[1:] if not a.startswith("--")]
+    ok = run(
+        render=render or "--render" in sys.argv,
+        check_only="--check" in sys.argv,
+        sync="--sync" in sys.argv,
+        strict="--strict" in sys.argv,
+        snapshot="--snapshot" in sys.argv,
+        filename=args[0] if args else None,
+    )
+    if not ok:
+        raise SystemExit(1)
+
+if __name__ == "__main__":
+    main()
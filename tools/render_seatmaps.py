@@ -0,0 +1,35 @@
+# tools/render_seatmaps.py
+
+import os
+import sys
+
+BASE_DIR = os.path.dirname(os.path.dirname(__file__)) # Go to project root path
+sys.path.insert(0, BASE_DIR)
+
+from dotenv import load_dotenv
+load_dotenv(os.path.join(BASE_DIR, ".env"))
+
+import seatmap
+
+# Render the per-table highlighted seat maps ahead of deploy.
+# Usage:
+#   python tools/render_seatmaps.py [--force]
+#   --force  re-render every table even if its files are up to date
+# Table positions come from SEATMAP_TABLES_PATH
+# (see instance/seatmap_tables.example.json).
+
+def main():
+    renderer = seatmap.get_renderer()
+    if not renderer.enabled:
+        print(f"Per-table maps disabled (Pillow installed? config at {renderer.config_path}?)")
+        raise SystemExit(1)
+    images = renderer.render_all(force="--force" in sys.argv)
+    for table, names in images.items():
+        sizes = ", ".join(
+            f"{kind}={os.path.getsize(os.path.join(seatmap.STATIC_DIR, path)) // 1024} KB"
+            for kind, path in names.items()
+        )
+        print(f"  table {table}: {names['webp']} ({sizes})")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,145 @@
+# tools/replay_dead_letters.py
+
+import os
+import sys
+import time
+from collections import Counter
+
+BASE_DIR = os.path.dirname(os.path.dirname(__file__)) # Go to project root path
+sys.path.insert(0, BASE_DIR)
+
+from dotenv import load_dotenv
+load_dotenv(os.path.join(BASE_DIR, ".env"))
+
+from linebot.v3.messaging import (
+    ApiClient,
+    ApiException,
+    Configuration,
+    MessagingApi,
+    PushMessageRequest,
+    TextMessage,
+)
+
+from dead_letters import DEAD_LETTER_PATH, DeadLetterStore, is_replayable
+
+# Redeliver dead-lettered pushes, e.g. after a LINE outage.
+# Usage:
+#   python tools/replay_dead_letters.py [--dry-run] [--rate N] [--batch N] [--pause S] [--limit N]
+#   --dry-run  only report what would be sent
+#   --rate     pushes per second (default 5)
+#   --batch    pushes per batch (default 50); --pause seconds between batches (default 2)
+#   --limit    stop after this many pushes
+#
+# Each record is pushed with its stored id as X-Line-Retry-Key, so a message LINE
+# already accepted comes back as 409 instead of being delivered twice. Delivered
+# ids are appended to <dead-letter file>.sent and skipped on the next run.
+# A 429 pauses for Retry-After (or 30s) and retries the same record once.
+
+def _opt(name: str, default, cast=float):
+    if name in sys.argv:
+        i = sys.argv.index(name)
+        if i + 1 < len(sys.argv):
+            try:
+                return cast(sys.argv[i + 1])
+            except ValueError:
+                print(f"[Error] Invalid value for {name}, fallback to {default}")
+    return default
+
+def _mask(user_id: str) -> str:
+    return f"{user_id[:5]}***{user_id[-3:]}"
+
+def _retry_after(e: ApiException) -> float:
+    try:
+        return float((e.headers or {}).get("Retry-After", 30))
+    except (TypeError, ValueError):
+        return 30.0
+
+def main():
+    dry_run = "--dry-run" in sys.argv
+    rate = max(0.1, _opt("--rate", 5.0))
+    batch = max(1, _opt("--batch", 50, int))
+    pause = _opt("--pause", 2.0)
+    limit = _opt("--limit", None, int)
+
+    path = DEAD_LETTER_PATH if os.path.isabs(DEAD_LETTER_PATH) else os.path.join(BASE_DIR, DEAD_LETTER_PATH)
+    store = DeadLetterStore(path)
+    sent = store.sent_ids()
+
+    todo, report = [], Counter()
+    seen = set()
+    for rec in store.records():
+        report["records"] += 1
+        message_id = rec.get("id")
+        if not is_replayable(rec):
+            report["not_replayable"] += 1  # Old format: masked recipient, no id
+        elif message_id in sent:
+            report["already_sent"] += 1
+        elif message_id in seen:
+            report["duplicate"] += 1
+        else:
+            seen.add(message_id)
+            todo.append(rec)
+    if limit is not None:
+        todo = todo[:limit]
+
+    print(f"files: {', '.join(store.files()) or '(none)'}")
+    print(f"records={report['records']} to_send={len(todo)} already_sent={report['already_sent']} "
+          f"not_replayable={report['not_replayable']} duplicate={report['duplicate']}")
+    if dry_run or not todo:
+        for rec in todo:
+            print(f"  would send id={rec['id']} user={_mask(rec['user_id'])} ts={rec.get('ts')}")
+        return
+
+    token = os.getenv("LINE_CHANNEL_ACCESS_TOKEN")
+    if not token:
+        print("ERROR: LINE_CHANNEL_ACCESS_TOKEN is not set.")
+        raise SystemExit(1)
+    api = MessagingApi(ApiClient(Configuration(access_token=token)))
+
+    interval = 1.0 / rate
+    started = time.monotonic()
+    for n, rec in enumerate(todo, 1):
+        if rec.get("messages"):
+            # Whole bundle (text + seat map image) in one push, as originally sent
+            request = PushMessageRequest.from_dict({"to": rec["user_id"], "messages": rec["messages"]})
+        else:
+            request = PushMessageRequest(to=rec["user_id"], messages=[TextMessage(text=rec["text"])])
+        for attempt in (1, 2):
+            try:
+                api.push_message(request, x_line_retry_key=rec["id"])
+                store.mark_sent(rec["id"])
+                report["sent"] += 1
+                break
+            except ApiException as e:
+                if e.status == 409:
+                    # Accepted by LINE earlier (original push or a previous replay).
+                    store.mark_sent(rec["id"])
+                    report["accepted_earlier"] += 1
+                    break
+                if e.status == 429 and attempt == 1:
+                    wait = _retry_after(e)
+                    print(f"[replay] rate limited, waiting {wait:.0f}s")
+                    time.sleep(wait)
+                    continue
+                print(f"[replay][api-error] id={rec['id']} status={e.status}")
+                report["failed"] += 1
+                break
+            except Exception as e:
+                print(f"[replay][conn-error] id={rec['id']} {type(e).__name__}: {e}")
+                report["failed"] += 1
+                break
+
+        if n % batch == 0 and n < len(todo):
+            print(f"[replay] {n}/{len(todo)} done, pausing {pause:.1f}s")
+            time.sleep(pause)
+        else:
+            time.sleep(interval)
+
+    elapsed = time.monotonic() - started
+    print(f"\nsent={report['sent']} accepted_earlier={report['accepted_earlier']} "
+          f"failed={report['failed']} in {elapsed:.1f}s")
+    if report["failed"]:
+        print("Failed records stay in the store; run the tool again to retry them.")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,164 @@
+# webhook_dedup.py
+
+import os
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Dict, Optional
+
+# Seen-event store for LINE webhook redeliveries.
+# LINE may deliver the same event again (deliveryContext.isRedelivery) when our
+# earlier response was slow or failed; main.py checks every event's
+# webhookEventId here and drops the ones already queued, before any routing,
+# OpenAI call or push happens.
+# Ids are kept WEBHOOK_DEDUP_TTL_SECONDS in a bounded in-memory map and, with
+# WEBHOOK_DEDUP_PATH set, in SQLite so a redelivery after a restart is caught too.
+
+DEBUG_VERBOSE = os.getenv("DEBUG_VERBOSE", "false").lower() == "true"
+
+def _get_num_env(var_name: str, default, cast=int):
+    try:
+        return cast(os.getenv(var_name, default))
+    except ValueError:
+        print(f"[Error] Invalid value for {var_name}, fallback to {default}")
+        return default
+
+# Empty path = memory only (duplicates across a restart are not caught).
+WEBHOOK_DEDUP_PATH = os.getenv("WEBHOOK_DEDUP_PATH", "instance/webhook_events.sqlite3")
+WEBHOOK_DEDUP_TTL_SECONDS = _get_num_env("WEBHOOK_DEDUP_TTL_SECONDS", 86400.0, float)
+# Ids kept in memory; the oldest are evicted first (SQLite still has them).
+WEBHOOK_DEDUP_MAX_ENTRIES = _get_num_env("WEBHOOK_DEDUP_MAX_ENTRIES", 100_000)
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS seen_events (
+    event_id TEXT PRIMARY KEY,
+    seen_at  REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS idx_seen_events_time ON seen_events (seen_at);
+"""
+
+# Expired rows are purged every this many new ids.
+_PURGE_EVERY = 1000
+
+class SeenEvents:
+    """Bounded TTL set of webhook event ids, optionally persisted in SQLite."""
+
+    def __init__(self, path: str = WEBHOOK_DEDUP_PATH, ttl: float = WEBHOOK_DEDUP_TTL_SECONDS,
+                 max_entries: int = WEBHOOK_DEDUP_MAX_ENTRIES):
+        self.path, self.ttl, self.max_entries = path, ttl, max(1, max_entries)
+        self._lock = threading.Lock()
+        self._recent: "OrderedDict[str, float]" = OrderedDict()  # event_id -> seen_at, oldest first
+        self._db = self._open(path)
+        self.checked = 0
+        self.duplicates = 0
+        self.redeliveries = 0
+        self.redelivery_duplicates = 0
+        self._added = 0
+
+    def _open(self, path: str) -> Optional[sqlite3.Connection]:
+        if not path:
+            return None
+        try:
+            folder = os.path.dirname(path)
+            if folder:
+                os.makedirs(folder, exist_ok=True)
+            db = sqlite3.connect(path, check_same_thread=False)
+            db.execute("PRAGMA journal_mode=WAL")
+            db.executescript(_SCHEMA)
+            db.execute("DELETE FROM seen_events WHERE seen_at < ?", (time.time() - self.ttl,))
+            db.commit()
+            return db
+        except Exception as e:
+            print(f"[webhook_dedup][store-error] {type(e).__name__}: {e} (memory only)")
+            self.path = ""
+            return None
+
+    def _seen_in_memory(self, event_id: str, now: float) -> bool:
+        seen_at = self._recent.get(event_id)
+        if seen_at is None:
+            return False
+        if now - seen_at < self.ttl:
+            return True
+        del self._recent[event_id]
+        return False
+
+    def _remember(self, event_id: str, now: float) -> None:
+        self._recent[event_id] = now
+        # Entries arrive in time order, so the front is both oldest and first to expire.
+        while self._recent and (len(self._recent) > self.max_entries
+                                or now - next(iter(self._recent.values())) >= self.ttl):
+            self._recent.popitem(last=False)
+
+    def _claim_persisted(self, event_id: str, now: float) -> bool:
+        """Record the id in SQLite; False if a live row already had it."""
+        cur = self._db.execute(
+            "INSERT INTO seen_events (event_id, seen_at) VALUES (?, ?) "
+            "ON CONFLICT (event_id) DO UPDATE SET seen_at = excluded.seen_at "
+            "WHERE seen_events.seen_at < ?",
+            (event_id, now, now - self.ttl),
+        )
+        self._added += 1
+        if self._added % _PURGE_EVERY == 0:
+            self._db.execute("DELETE FROM seen_events WHERE seen_at < ?", (now - self.ttl,))
+        self._db.commit()
+        return cur.rowcount > 0
+
+    def add(self, event_id: Optional[str], redelivery: bool = False) -> bool:
+        """
+        Mark an event as seen. True = first time (process it), False = duplicate (drop it).
+        Events without an id are always processed.
+        """
+        if not event_id:
+            return True
+        now = time.time()
+        with self._lock:
+            self.checked += 1
+            self.redeliveries += bool(redelivery)
+            if self._seen_in_memory(event_id, now):
+                new = False
+            elif self._db is not None:
+                try:
+                    new = self._claim_persisted(event_id, now)
+                except sqlite3.Error as e:
+                    if DEBUG_VERBOSE:
+                        print(f"[webhook_dedup][store-error] {type(e).__name__}: {e}")
+                    new = True  # Prefer a possible duplicate over a lost message
+            else:
+                new = True
+            if new:
+                self._remember(event_id, now)
+            else:
+                self.duplicates += 1
+                self.redelivery_duplicates += bool(redelivery)
+        return new
+
+    def forget(self, event_id: Optional[str]) -> None:
+        """Undo add() when the event could not be queued, so a redelivery is processed."""
+        if not event_id:
+            return
+        with self._lock:
+            self._recent.pop(event_id, None)
+            if self._db is not None:
+                try:
+                    self._db.execute("DELETE FROM seen_events WHERE event_id = ?", (event_id,))
+                    self._db.commit()
+                except sqlite3.Error:
+                    pass
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                "checked": self.checked,
+                "duplicates": self.duplicates,
+                "redeliveries": self.redeliveries,
+                "redelivery_duplicates": self.redelivery_duplicates,
+                "in_memory": len(self._recent),
+                "persistent": self._db is not None,
+            }
+
+    def close(self) -> None:
+        with self._lock:
+            if self._db is not None:
+                self._db.close()
+                self._db = None